@@ -0,0 +1,93 @@
+"""Benchmark of reading query results via the Storage Read API against paging through REST.
+
+Builds a table of random feature columns and reads it into a dataframe twice: through
+`RowIterator.to_dataframe` paging over JSON rows as the REST API returns them, and through
+`bq_storage.read_table` over parallel arrow streams of a local stand-in of the Storage Read
+API. Both apply the same dtypes. Time spent building the JSON pages of the REST stand-in is not
+counted. Run with `python -m benchmarks.bq_read`.
+"""
+import argparse
+import time
+from typing import Any
+from typing import Dict
+
+import numpy as np
+import pyarrow as pa
+from google.cloud import bigquery
+from google.cloud.bigquery.table import RowIterator
+
+from benchmarks.fake_bq_storage import FakeReadClient
+from xgb_churn_prediction.data.bq_storage import read_table
+
+TABLE = "projects/benchmark/datasets/benchmark/tables/features"
+DTYPES = {"segment": "category", "tenure": "float32"}
+
+
+def make_table(n_rows: int, n_features: int) -> pa.Table:
+    rng = np.random.default_rng(0)
+    columns: Dict[str, Any] = {"id": np.arange(n_rows), "tenure": rng.integers(0, 120, n_rows)}
+    for feature in range(n_features):
+        columns[f"feature_{feature}"] = rng.normal(size=n_rows)
+    columns["segment"] = rng.choice(["consumer", "business", "enterprise"], n_rows)
+    return pa.table(columns)
+
+
+def read_rest(data: pa.Table, page_rows: int) -> float:
+    """Function to read the table through RowIterator paging over JSON rows
+
+    Args:
+        data (pa.Table): table to serve
+        page_rows (int): number of rows per page
+
+    Returns:
+        float: seconds spent outside of building the pages
+    """
+    types = {pa.int64(): "INTEGER", pa.float64(): "FLOAT", pa.string(): "STRING"}
+    schema = [bigquery.SchemaField(field.name, types[field.type]) for field in data.schema]
+    building = 0.0
+
+    def api_request(method: str, path: str, query_params: Dict[str, Any], **kwargs: Any) -> Dict:
+        nonlocal building
+        start = time.perf_counter()
+        offset = int(query_params.get("pageToken") or 0)
+        page = data.slice(offset, page_rows).to_pydict()
+        rows = [
+            {"f": [{"v": None if value is None else str(value)} for value in values]}
+            for values in zip(*page.values())
+        ]
+        response = {"rows": rows, "totalRows": str(data.num_rows)}
+        if offset + page_rows < data.num_rows:
+            response["pageToken"] = str(offset + page_rows)
+        building += time.perf_counter() - start
+        return response
+
+    rows = RowIterator(None, api_request, "/projects/benchmark/queries/job", schema)
+    start = time.perf_counter()
+    rows.to_dataframe(dtypes=DTYPES, create_bqstorage_client=False)
+    return time.perf_counter() - start - building
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--n-features", type=int, default=8)
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--rest-max-rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'read':>8} {'seconds':>8} {'rows_per_s':>12}")
+    for n_rows in args.n_rows:
+        data = make_table(n_rows, args.n_features)
+        if n_rows <= args.rest_max_rows:
+            seconds = read_rest(data, page_rows=50_000)
+            print(f"{n_rows:>10} {'rest':>8} {seconds:>8.2f} {n_rows / seconds:>12,.0f}")
+        client = FakeReadClient()
+        client.put(TABLE, data)
+        start = time.perf_counter()
+        read_table(TABLE, "benchmark", dtypes=DTYPES, read_client=client, max_streams=args.streams)
+        seconds = time.perf_counter() - start
+        print(f"{n_rows:>10} {'storage':>8} {seconds:>8.2f} {n_rows / seconds:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of the compiled tree-ensemble engine against sklearn's predict_proba.
+
+Trains a stand-in forest on random data, checks that the compiled forest returns identical
+probabilities and reports the time per call for batch sizes from 1 to 100k rows. Run with
+`python -m benchmarks.compiled_forest`.
+"""
+import argparse
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from xgb_churn_prediction.model.compiled_forest import CompiledForest
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+
+
+def time_per_call(fn: Callable[[np.ndarray], np.ndarray], X: np.ndarray, min_time: float) -> float:
+    """Function to measure the mean time of a call, repeating calls for at least min_time
+
+    Args:
+        fn (Callable[[np.ndarray], np.ndarray]): function to time
+        X (np.ndarray): input of the function
+        min_time (float): minimum total time in seconds to repeat calls for
+
+    Returns:
+        float: mean seconds per call
+    """
+    fn(X)
+    calls = 0
+    start = time.perf_counter()
+    while calls == 0 or time.perf_counter() - start < min_time:
+        fn(X)
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-features", type=int, default=20)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--min-time", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, args.n_features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(size=len(X)) > 0).astype(int)
+    forest = RandomForestClassifier(n_estimators=args.n_estimators, random_state=0).fit(X, y)
+    compiled = CompiledForest.from_estimator(forest)
+    X_test = rng.normal(size=(max(BATCH_SIZES), args.n_features))
+
+    results: List[Dict[str, float]] = []
+    for batch_size in BATCH_SIZES:
+        batch = X_test[:batch_size]
+        assert np.array_equal(compiled.predict_proba(batch), forest.predict_proba(batch))
+        sklearn_s = time_per_call(forest.predict_proba, batch, args.min_time)
+        compiled_s = time_per_call(compiled.predict_proba, batch, args.min_time)
+        results.append(
+            {
+                "batch_size": batch_size,
+                "sklearn_ms": sklearn_s * 1000,
+                "compiled_ms": compiled_s * 1000,
+                "speedup": sklearn_s / compiled_s,
+            }
+        )
+
+    print(f"{'batch_size':>10} {'sklearn_ms':>12} {'compiled_ms':>12} {'speedup':>8}")
+    for result in results:
+        print(
+            f"{result['batch_size']:>10} {result['sklearn_ms']:>12.3f} "
+            f"{result['compiled_ms']:>12.3f} {result['speedup']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
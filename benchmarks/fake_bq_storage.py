@@ -0,0 +1,62 @@
+"""Minimal local stand-in for the BigQuery Storage Read API client.
+
+Serves arrow tables kept in memory like `BigQueryReadClient`: a read session splits a table
+into streams of contiguous rows, and every stream yields responses carrying serialized arrow
+record batches in the format of the API. Used by `benchmarks.bq_read` and the ingestion tests.
+"""
+import itertools
+from types import SimpleNamespace
+from typing import Any
+from typing import Dict
+from typing import Iterator
+
+import pyarrow as pa
+
+
+class FakeReadClient:
+    """Serves in-memory arrow tables through the methods of BigQueryReadClient."""
+
+    def __init__(self, batch_rows: int = 100_000) -> None:
+        """Initializes a new instance of FakeReadClient.
+
+        Args:
+            batch_rows (int): number of rows per record batch of a stream
+        """
+        self.batch_rows = batch_rows
+        self.tables: Dict[str, pa.Table] = {}
+        self.streams: Dict[str, pa.Table] = {}
+        self.sessions = itertools.count()
+
+    def put(self, table: str, data: pa.Table) -> None:
+        """Function to store a table under its path, `projects/<p>/datasets/<d>/tables/<t>`"""
+        self.tables[table] = data
+
+    def create_read_session(
+        self, parent: str, read_session: Dict[str, Any], max_stream_count: int = 0
+    ) -> SimpleNamespace:
+        if read_session.get("data_format") != "ARROW":
+            raise ValueError("Only arrow read sessions are supported")
+        data = self.tables[read_session["table"]]
+        session = f"{parent}/locations/local/sessions/{next(self.sessions)}"
+        n_streams = min(max_stream_count or 1, -(-data.num_rows // self.batch_rows))
+        streams = []
+        for index in range(n_streams):
+            name = f"{session}/streams/{index}"
+            start = data.num_rows * index // n_streams
+            self.streams[name] = data.slice(start, data.num_rows * (index + 1) // n_streams - start)
+            streams.append(SimpleNamespace(name=name))
+        return SimpleNamespace(
+            name=session,
+            arrow_schema=SimpleNamespace(serialized_schema=data.schema.serialize().to_pybytes()),
+            streams=streams,
+        )
+
+    def read_rows(self, name: str, offset: int = 0) -> Iterator[SimpleNamespace]:
+        data = self.streams.pop(name).slice(offset)
+        for batch in data.to_batches(max_chunksize=self.batch_rows):
+            yield SimpleNamespace(
+                arrow_record_batch=SimpleNamespace(
+                    serialized_record_batch=batch.serialize().to_pybytes()
+                ),
+                row_count=batch.num_rows,
+            )
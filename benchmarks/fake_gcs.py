@@ -0,0 +1,140 @@
+"""Minimal local stand-in for the GCS JSON API, enough to download objects with the client.
+
+Serves object metadata and (ranged) media downloads of objects kept in memory, optionally
+throttled per connection to mimic the latency and bandwidth of single GCS requests. Used by
+`benchmarks.model_download` and the downloader tests.
+"""
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlparse
+
+import google_crc32c
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage import Client
+
+_OBJECT_PATH = re.compile(r"^(/download)?/storage/v1/b/([^/]+)/o/([^/]+)$")
+
+
+class FakeGcsServer:
+    """Threaded HTTP server serving objects like the GCS JSON API."""
+
+    def __init__(self, latency_s: float = 0.0, bandwidth_mb_s: Optional[float] = None) -> None:
+        """Initializes a new instance of FakeGcsServer, call `start` to serve requests.
+
+        Args:
+            latency_s (float): delay before every response
+            bandwidth_mb_s (Optional[float]): throughput of a single response, unlimited if None
+        """
+        self.latency_s = latency_s
+        self.bandwidth_mb_s = bandwidth_mb_s
+        self.objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.requests = 0
+        self._generation = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """str: endpoint to pass to the storage client"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeGcsServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def client(self) -> Client:
+        """Function to create a storage client talking to this server"""
+        return Client(
+            project="test",
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": self.url},
+        )
+
+    def put(self, bucket: str, name: str, content: bytes) -> None:
+        """Function to store an object under a new generation"""
+        self._generation += 1
+        crc32c = base64.b64encode(google_crc32c.Checksum(content).digest()).decode()
+        self.objects[(bucket, name)] = {
+            "content": content,
+            "metadata": {
+                "kind": "storage#object",
+                "bucket": bucket,
+                "name": name,
+                "size": str(len(content)),
+                "generation": str(self._generation),
+                "crc32c": crc32c,
+                "md5Hash": base64.b64encode(hashlib.md5(content).digest()).decode(),
+            },
+        }
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server.requests += 1
+                url = urlparse(self.path)
+                match = _OBJECT_PATH.match(url.path)
+                entry = match and server.objects.get((match.group(2), unquote(match.group(3))))
+                if not entry:
+                    self._reply(404, json.dumps({"error": {"code": 404}}).encode())
+                    return
+                query = parse_qs(url.query)
+                generation = query.get("ifGenerationMatch", [entry["metadata"]["generation"]])
+                if generation[0] != entry["metadata"]["generation"]:
+                    self._reply(412, json.dumps({"error": {"code": 412}}).encode())
+                    return
+                if query.get("alt") != ["media"]:
+                    self._reply(200, json.dumps(entry["metadata"]).encode())
+                    return
+
+                content = entry["content"]
+                byte_range = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                headers = {
+                    "x-goog-hash": f"crc32c={entry['metadata']['crc32c']},"
+                    f"md5={entry['metadata']['md5Hash']}",
+                    "x-goog-generation": entry["metadata"]["generation"],
+                }
+                if byte_range:
+                    start = int(byte_range.group(1))
+                    end = int(byte_range.group(2) or len(content) - 1)
+                    headers = {"Content-Range": f"bytes {start}-{end}/{len(content)}"}
+                    self._reply(206, content[start : end + 1], headers)
+                else:
+                    self._reply(200, content, headers)
+
+            def _reply(self, status: int, body: bytes, headers: Dict[str, str] = {}) -> None:
+                time.sleep(server.latency_s)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if server.bandwidth_mb_s is None:
+                    self.wfile.write(body)
+                    return
+                step = 1 << 20
+                for start in range(0, len(body), step):
+                    self.wfile.write(body[start : start + step])
+                    time.sleep(min(step, len(body) - start) / (server.bandwidth_mb_s * 2**20))
+
+        return Handler
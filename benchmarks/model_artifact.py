@@ -0,0 +1,102 @@
+"""Benchmark of loading a forest from the artifact format against unpickling it.
+
+Trains a stand-in forest on random data, saves it as pickle and as artifact (manifest and
+array blobs) and reports size on disk, load time and the memory each load takes. Every load
+runs in a fresh process after the imports, so the numbers cover nothing but the load itself.
+Run with `python -m benchmarks.model_artifact`.
+"""
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from xgb_churn_prediction.model.artifact import save_artifact
+
+# loads the model in a fresh process and prints load seconds and the growth of private and
+# file-backed resident memory in MB, file-backed pages are shared by all processes mapping them
+LOAD_SCRIPT = """
+import pickle, sys, time
+from xgb_churn_prediction.model.artifact import load_artifact
+def rss():
+    with open("/proc/self/status") as file:
+        fields = dict(line.split(":", 1) for line in file)
+    return [int(fields[name].split()[0]) / 1024 for name in ("RssAnon", "RssFile")]
+before = rss()
+start = time.perf_counter()
+if sys.argv[1] == "pickle":
+    with open(sys.argv[2], "rb") as file:
+        model = pickle.load(file)
+else:
+    model = load_artifact(sys.argv[2], mmap=sys.argv[1] == "mmap")
+seconds = time.perf_counter() - start
+after = rss()
+print(seconds, after[0] - before[0], after[1] - before[1])
+"""
+
+
+def load_in_subprocess(mode: str, path: str) -> tuple:
+    """Function to load the model in a fresh python process
+
+    Args:
+        mode (str): `pickle`, `read` or `mmap`
+        path (str): path of the pickle file or the artifact
+
+    Returns:
+        tuple: load seconds, growth of private and of file-backed resident memory in MB
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", LOAD_SCRIPT, mode, path],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    ).stdout.split()
+    return float(output[0]), float(output[1]), float(output[2])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-features", type=int, default=20)
+    parser.add_argument("--n-estimators", type=int, default=500)
+    parser.add_argument("--n-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(args.n_rows, args.n_features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(size=len(X)) > 0).astype(int)
+    forest = RandomForestClassifier(n_estimators=args.n_estimators, n_jobs=-1, random_state=0)
+    forest.fit(X, y)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = f"{directory}/model.pkl"
+        with open(pickle_path, "wb") as file:
+            pickle.dump(forest, file)
+        start = time.perf_counter()
+        save_artifact(forest, f"{directory}/model")
+        print(f"saved artifact in {time.perf_counter() - start:.2f}s")
+
+        sizes = {
+            "pickle": os.path.getsize(pickle_path),
+            "artifact": os.path.getsize(f"{directory}/model.bin"),
+        }
+        print(f"{'load':>8} {'size_mb':>8} {'load_s':>8} {'private_mb':>11} {'shared_mb':>10}")
+        for mode, path, size in [
+            ("pickle", pickle_path, sizes["pickle"]),
+            ("read", f"{directory}/model", sizes["artifact"]),
+            ("mmap", f"{directory}/model", sizes["artifact"]),
+        ]:
+            seconds, private_mb, shared_mb = load_in_subprocess(mode, path)
+            print(
+                f"{mode:>8} {size / 2**20:>8.1f} {seconds:>8.3f} {private_mb:>11.1f} "
+                f"{shared_mb:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
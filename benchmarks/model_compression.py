@@ -0,0 +1,81 @@
+"""Benchmark of the size and time trade-offs of compressing saved models.
+
+Trains a stand-in forest on random data, saves it with every codec and level given, and
+reports the size, the time to compress and to decompress the saved model, and the resulting
+cold start time. The download is not measured: the cold start is the size divided by an assumed
+bandwidth (`--bandwidth-mb-s`, 200 MB/s by default) plus the measured decompression time.
+Run with `python -m benchmarks.model_compression`.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from xgb_churn_prediction.model.artifact import decompress_artifact
+from xgb_churn_prediction.model.compression import check_codec
+from xgb_churn_prediction.model.save_load_model import save_model
+
+CONFIGURATIONS = [
+    ("none", None, 0),
+    ("lz4", 0, 0),
+    ("zstd", 1, 0),
+    ("zstd", 3, 0),
+    ("zstd", 3, -1),
+    ("zstd", 9, -1),
+    ("zstd", 19, -1),
+    ("gzip", 6, 0),
+    ("lzma", 6, 0),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-features", type=int, default=20)
+    parser.add_argument("--n-estimators", type=int, default=500)
+    parser.add_argument("--n-rows", type=int, default=20000)
+    # assumed download bandwidth from GCS, the download itself is not measured
+    parser.add_argument("--bandwidth-mb-s", type=float, default=200.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(args.n_rows, args.n_features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(size=len(X)) > 0).astype(int)
+    forest = RandomForestClassifier(n_estimators=args.n_estimators, n_jobs=-1, random_state=0)
+    forest.fit(X, y)
+
+    print(
+        f"{'codec':>6} {'level':>6} {'threads':>8} {'size_mb':>8} {'ratio':>6} "
+        f"{'save_s':>7} {'decompress_s':>13} {'cold_start_s':>13}"
+    )
+    raw_size = None
+    for codec, level, threads in CONFIGURATIONS:
+        compression = None if codec == "none" else codec
+        try:
+            if compression is not None:
+                check_codec(compression)
+        except ValueError as e:
+            print(f"{codec:>6} skipped: {e}")
+            continue
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/model"
+            start = time.perf_counter()
+            save_model(forest, path, compression=compression, level=level, threads=threads)
+            save_seconds = time.perf_counter() - start
+            size = os.path.getsize(f"{path}.bin")
+            raw_size = raw_size or size
+            start = time.perf_counter()
+            decompress_artifact(path)
+            decompress_seconds = time.perf_counter() - start
+        cold_start = size / 2**20 / args.bandwidth_mb_s + decompress_seconds
+        print(
+            f"{codec:>6} {str(level):>6} {threads:>8} {size / 2**20:>8.1f} "
+            f"{raw_size / size:>6.2f} {save_seconds:>7.2f} {decompress_seconds:>13.3f} "
+            f"{cold_start:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
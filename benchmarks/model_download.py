@@ -0,0 +1,50 @@
+"""Benchmark of downloading a model blob in concurrent byte ranges against a single request.
+
+Serves a random blob from a local fake of the GCS JSON API, throttled per connection to mimic
+the latency and bandwidth a single GCS request gets, and reports the download time and
+throughput of `Blob.download_to_filename` and of `download_blob` for several concurrencies.
+Run with `python -m benchmarks.model_download`.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_gcs import FakeGcsServer
+from xgb_churn_prediction.model.download import CHUNK_BYTES
+from xgb_churn_prediction.model.download import download_blob
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--latency-s", type=float, default=0.02)
+    parser.add_argument("--bandwidth-mb-s", type=float, default=50.0)
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // 2**20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server = FakeGcsServer(latency_s=args.latency_s, bandwidth_mb_s=args.bandwidth_mb_s).start()
+    try:
+        server.put("bucket", "model/model.bin", os.urandom(args.size_mb * 2**20))
+        blob = server.client().bucket("bucket").get_blob("model/model.bin")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/model.bin"
+            print(f"{'download':>16} {'workers':>8} {'seconds':>8} {'mb_per_s':>9}")
+            start = time.perf_counter()
+            blob.download_to_filename(path, raw_download=True, checksum="crc32c")
+            seconds = time.perf_counter() - start
+            print(f"{'single request':>16} {1:>8} {seconds:>8.2f} {args.size_mb / seconds:>9.1f}")
+            for workers in args.workers:
+                os.remove(path)
+                start = time.perf_counter()
+                download_blob(blob, path, chunk_bytes=args.chunk_mb * 2**20, max_workers=workers)
+                seconds = time.perf_counter() - start
+                print(f"{'ranges':>16} {workers:>8} {seconds:>8.2f} {args.size_mb / seconds:>9.1f}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Load test comparing gunicorn's default settings with the tuned serving profile.
+
+Trains a stand-in model on random data, serves it locally with the Flask app in
+`src/xgb_churn_prediction/inference` once per gunicorn profile and reports throughput and
+latency percentiles. Run with `python -m benchmarks.serving_load_test`.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.model.features import Featurizer
+from xgb_churn_prediction.model.save_load_model import save_model
+
+REPO_ROOT = Path(__file__).parent.parent
+INFERENCE_DIR = REPO_ROOT / "src" / "xgb_churn_prediction" / "inference"
+
+PROFILES = {
+    "default": ["gunicorn", "--bind", "127.0.0.1:{port}", "app:app"],
+    "tuned": ["gunicorn", "-c", "app.gunicorn.conf.py", "app:app"],
+}
+
+
+def make_stand_in_model(model_dir: str, n_features: int, n_estimators: int) -> pd.DataFrame:
+    """Function to train and save a stand-in model with the same pipeline layout as train_model
+
+    Args:
+        model_dir (str): directory to save model.pkl to
+        n_features (int): number of numeric features
+        n_estimators (int): number of trees in the forest
+
+    Returns:
+        pd.DataFrame: sample of the training features to build requests from
+    """
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(5000, n_features))).add_prefix("feature_")
+    y = (X.sum(axis=1) > 0).astype(int)
+    model = Pipeline(
+        [
+            ("preprocessing", Pipeline([("generate_features", Featurizer())])),
+            ("model", RandomForestClassifier(n_estimators=n_estimators, random_state=0)),
+        ]
+    )
+    model.fit(X, y)
+    save_model(model, f"{model_dir}/model")
+    return X
+
+
+def run_load(port: int, body: bytes, concurrency: int, duration: float) -> Tuple[List[float], int]:
+    """Function to send requests from `concurrency` keep-alive connections for `duration` seconds
+
+    Returns:
+        Tuple[List[float], int]: latencies of successful requests in seconds, number of errors
+    """
+    deadline = time.perf_counter() + duration
+
+    def client() -> Tuple[List[float], int]:
+        latencies, errors = [], 0
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/predict", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.close()
+        return latencies, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: client(), range(concurrency)))
+    return [lat for lats, _ in results for lat in lats], sum(errors for _, errors in results)
+
+
+def wait_until_healthy(port: int, timeout: float = 60) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            # 503 while the model is warming up
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("Server did not become healthy")
+
+
+def benchmark_profile(
+    profile: str, model_dir: str, port: int, body: bytes, concurrency: int, duration: float
+) -> Dict[str, float]:
+    env = {
+        **os.environ,
+        "AIP_HTTP_PORT": str(port),
+        "AIP_HEALTH_ROUTE": "/health",
+        "AIP_PREDICT_ROUTE": "/predict",
+        "AIP_STORAGE_URI": model_dir,
+        "PYTHONPATH": os.pathsep.join([str(REPO_ROOT / "src"), os.environ.get("PYTHONPATH", "")]),
+    }
+    command = [arg.format(port=port) for arg in PROFILES[profile]]
+    server = subprocess.Popen(command, cwd=INFERENCE_DIR, env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port)
+        latencies, errors = run_load(port, body, concurrency, duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (np.nan, np.nan)
+    return {
+        "requests_per_s": len(latencies) / duration,
+        "p50_ms": float(p50),
+        "p99_ms": float(p99),
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+    parser.add_argument("--concurrency", type=int, default=16, help="parallel connections")
+    parser.add_argument("--rows", type=int, default=10, help="rows per request")
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8085)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        X = make_stand_in_model(model_dir, args.features, args.trees)
+        body = json.dumps({"instances": X.head(args.rows).to_dict("records")}).encode()
+
+        results = {
+            profile: benchmark_profile(
+                profile, model_dir, args.port, body, args.concurrency, args.duration
+            )
+            for profile in PROFILES
+        }
+
+    print(pd.DataFrame(results).T.to_string(float_format="{:.1f}".format), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+# kinds of clients kept in the registry
+BIGQUERY = "bigquery"
+BIGQUERY_READ = "bigquery_read"
+STORAGE = "storage"
+METRIC_SERVICE = "metric_service"
+
+
+# functions creating a client from project and location. Libraries are imported on first use,
+# so e.g. serving does not load the BigQuery libraries, and client classes are looked up on
+# every call, so patching them (e.g. `google.cloud.bigquery.Client`) also patches the registry
+
+
+def _bigquery_client(project: Optional[str], location: Optional[str]) -> Any:
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=project, location=location)
+
+
+def _bigquery_read_client(project: Optional[str], location: Optional[str]) -> Any:
+    try:
+        import google.cloud.bigquery_storage as bigquery_storage
+    except ImportError as e:
+        raise ImportError(
+            "Reading via the Storage Read API needs google-cloud-bigquery-storage"
+        ) from e
+
+    return bigquery_storage.BigQueryReadClient()
+
+
+def _storage_client(project: Optional[str], location: Optional[str]) -> Any:
+    import google.cloud.storage as storage
+
+    return storage.Client(project=project)
+
+
+def _metric_service_client(project: Optional[str], location: Optional[str]) -> Any:
+    from google.cloud import monitoring_v3
+
+    return monitoring_v3.MetricServiceClient()
+
+
+_DEFAULT_FACTORIES: Dict[str, Callable[[Optional[str], Optional[str]], Any]] = {
+    BIGQUERY: _bigquery_client,
+    BIGQUERY_READ: _bigquery_read_client,
+    STORAGE: _storage_client,
+    METRIC_SERVICE: _metric_service_client,
+}
+
+_lock = threading.Lock()
+_factories = dict(_DEFAULT_FACTORIES)
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], Any] = {}
+_pid = os.getpid()
+
+
+def _forget_clients() -> None:
+    # connections and channels inherited by a forked process belong to the parent
+    global _lock, _pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _pid = os.getpid()
+
+
+os.register_at_fork(after_in_child=_forget_clients)
+
+
+def get_client(kind: str, project: Optional[str] = None, location: Optional[str] = None) -> Any:
+    """Function to get the process-wide client of a kind, project and location
+
+    A client is created on first use and reused afterwards, so credential discovery, HTTP
+    sessions, gRPC channels and their TLS connections are set up once per process instead of
+    on every call. A forked process creates its own clients.
+
+    Args:
+        kind (str): kind of client, e.g. BIGQUERY or STORAGE
+        project (Optional[str]): project of the client, the default project if None
+        location (Optional[str]): default location of the client, e.g. for BigQuery jobs
+
+    Returns:
+        Any: client
+
+    Raises:
+        KeyError: if the kind of client is unknown
+    """
+    if _pid != os.getpid():
+        _forget_clients()
+    key = (kind, project, location)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _factories[kind](project, location)
+                _clients[key] = client
+    return client
+
+
+def bigquery_client(project: Optional[str] = None, location: Optional[str] = None) -> Any:
+    """Function to get the shared bigquery.Client of a project, see `get_client`"""
+    return get_client(BIGQUERY, project, location)
+
+
+def bigquery_read_client() -> Any:
+    """Function to get the shared BigQueryReadClient of the Storage Read API, see `get_client`"""
+    return get_client(BIGQUERY_READ)
+
+
+def storage_client(project: Optional[str] = None) -> Any:
+    """Function to get the shared storage.Client, see `get_client`"""
+    return get_client(STORAGE, project)
+
+
+def metric_service_client() -> Any:
+    """Function to get the shared Cloud Monitoring MetricServiceClient, see `get_client`"""
+    return get_client(METRIC_SERVICE)
+
+
+def set_factory(kind: str, factory: Callable[[Optional[str], Optional[str]], Any]) -> None:
+    """Function to replace how clients of a kind are created, e.g. by a local fake in tests
+
+    Clients of the kind created before are dropped.
+
+    Args:
+        kind (str): kind of client, e.g. BIGQUERY or STORAGE
+        factory (Callable[[Optional[str], Optional[str]], Any]): function creating a client from
+            project and location
+    """
+    with _lock:
+        _factories[kind] = factory
+        for key in [key for key in _clients if key[0] == kind]:
+            del _clients[key]
+
+
+def reset() -> None:
+    """Function to drop all clients and restore the default factories"""
+    with _lock:
+        _clients.clear()
+        _factories.clear()
+        _factories.update(_DEFAULT_FACTORIES)
@@ -0,0 +1,190 @@
+# script for reading query results as arrow record batches via the BigQuery Storage Read API
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ..clients import bigquery_read_client
+
+# number of streams a table is read with in parallel, BigQuery may create fewer
+MAX_STREAMS = 8
+
+
+def table_path(table: Any) -> str:
+    """Function to get the resource path of a table as used by the Storage Read API
+
+    Args:
+        table (Any): bigquery.TableReference, e.g. the destination of a query job
+
+    Returns:
+        str: table path `projects/<project>/datasets/<dataset>/tables/<table>`
+    """
+    return f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}"
+
+
+def arrow_type(dtype: Any, field_type: pa.DataType) -> Optional[pa.DataType]:
+    """Function to get the arrow type a column is converted to for a pandas dtype
+
+    Args:
+        dtype (Any): pandas dtype specification as passed to `DataFrame.astype`
+        field_type (pa.DataType): arrow type of the column as read
+
+    Returns:
+        Optional[pa.DataType]: arrow type that converts to the dtype, None for pandas extension
+            dtypes without arrow counterpart
+    """
+    if dtype in (str, "str", object, "object"):
+        return pa.string()
+    if dtype == "category":
+        value_type = field_type.value_type if pa.types.is_dictionary(field_type) else field_type
+        return pa.dictionary(pa.int32(), value_type)
+    try:
+        return pa.from_numpy_dtype(np.dtype(dtype))
+    except (TypeError, pa.ArrowNotImplementedError):
+        return None
+
+
+def target_schema(schema: pa.Schema, dtypes: Optional[Dict]) -> Tuple[pa.Schema, Dict]:
+    """Function to get the schema record batches are cast to for the dtypes of their columns
+
+    Args:
+        schema (pa.Schema): schema of the record batches as read
+        dtypes (Optional[Dict]): data types specifications for columns
+
+    Returns:
+        Tuple[pa.Schema, Dict]: schema to cast to and the dtypes without arrow counterpart, which
+            have to be applied to the dataframe
+    """
+    target = schema
+    remaining = {}
+    for column, dtype in (dtypes or {}).items():
+        index = schema.get_field_index(column)
+        if index < 0:
+            continue
+        field_type = arrow_type(dtype, schema.field(index).type)
+        if field_type is None:
+            remaining[column] = dtype
+        else:
+            target = target.set(index, schema.field(index).with_type(field_type))
+    return target, remaining
+
+
+def _create_session(
+    read_client: Any, table: Any, parent_project: str, max_streams: int
+) -> Tuple[Any, Any, pa.Schema]:
+    # read client, read session of the table and the arrow schema of its record batches
+    if read_client is None:
+        read_client = bigquery_read_client()
+    path = table if isinstance(table, str) else table_path(table)
+    session = read_client.create_read_session(
+        parent=f"projects/{parent_project}",
+        read_session={"table": path, "data_format": "ARROW"},
+        max_stream_count=max_streams,
+    )
+    logging.info(f"Reading {path} in {len(session.streams)} streams")
+    schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+    return read_client, session, schema
+
+
+def _stream_batches(read_client: Any, stream: str, schema: pa.Schema) -> Iterator[pa.RecordBatch]:
+    for response in read_client.read_rows(stream):
+        yield pa.ipc.read_record_batch(
+            pa.py_buffer(response.arrow_record_batch.serialized_record_batch), schema
+        )
+
+
+def _read_stream(
+    read_client: Any, stream: str, schema: pa.Schema, target: pa.Schema
+) -> Optional[pa.Table]:
+    # record batches of one stream, converted to the target types while other streams are read
+    batches = list(_stream_batches(read_client, stream, schema))
+    if not batches:
+        return None
+    table = pa.Table.from_batches(batches, schema)
+    return table if target.equals(schema) else table.cast(target)
+
+
+def iter_table_batches(
+    table: Any, parent_project: str, read_client: Any = None, max_streams: int = 1
+) -> Iterator[pa.RecordBatch]:
+    """Function to read a table via the Storage Read API one record batch at a time
+
+    Streams are read one after the other, so only the batch being read is held in memory.
+
+    Args:
+        table (Any): bigquery.TableReference or table path, see `table_path`
+        parent_project (str): project the read session is billed to
+        read_client (Any): BigQueryReadClient or stand-in, the shared client if None
+        max_streams (int): number of streams to split the table into at most, rows are only kept
+            in order with a single stream
+
+    Yields:
+        pa.RecordBatch: record batches of the table
+
+    Raises:
+        ImportError: if no read client is given and google-cloud-bigquery-storage is missing
+    """
+    read_client, session, schema = _create_session(read_client, table, parent_project, max_streams)
+    for stream in session.streams:
+        yield from _stream_batches(read_client, stream.name, schema)
+
+
+def read_table(
+    table: Any,
+    parent_project: str,
+    dtypes: Optional[Dict] = None,
+    read_client: Any = None,
+    max_streams: int = MAX_STREAMS,
+    arrow_backed: bool = False,
+) -> pd.DataFrame:
+    """Function to read a table via the Storage Read API as arrow record batches
+
+    The table is split into streams read in parallel threads. The record batches of every stream
+    are converted to the arrow types of `dtypes` as soon as the stream is complete, so the
+    DataFrame is built in a single conversion from arrow with every column in its final type.
+    Rows of several streams do not keep the order of the table, use `max_streams=1` for ordered
+    results.
+
+    Args:
+        table (Any): bigquery.TableReference or table path, see `table_path`
+        parent_project (str): project the read session is billed to
+        dtypes (Optional[Dict]): data types specifications for columns
+        read_client (Any): BigQueryReadClient or stand-in, the shared client if None
+        max_streams (int): number of streams to read in parallel at most
+        arrow_backed (bool): whether to keep the columns in arrow memory (pd.ArrowDtype) instead
+            of converting them to numpy
+
+    Returns:
+        pd.DataFrame: table as dataframe
+
+    Raises:
+        ImportError: if no read client is given and google-cloud-bigquery-storage is missing
+    """
+    read_client, session, schema = _create_session(read_client, table, parent_project, max_streams)
+    # dtypes with an arrow counterpart are applied while reading, any other ones afterwards
+    target, remaining = target_schema(schema, dtypes)
+
+    streams = [stream.name for stream in session.streams]
+    with ThreadPoolExecutor(max_workers=max(len(streams), 1)) as executor:
+        tables = [
+            stream_table
+            for stream_table in executor.map(
+                lambda stream: _read_stream(read_client, stream, schema, target), streams
+            )
+            if stream_table is not None
+        ]
+    result = pa.concat_tables(tables) if tables else target.empty_table()
+    del tables
+
+    df = result.to_pandas(
+        types_mapper=pd.ArrowDtype if arrow_backed else None, split_blocks=True, self_destruct=True
+    )
+    return df.astype(remaining) if remaining else df
@@ -0,0 +1,119 @@
+# script for splitting streamed record batches into bounded chunks and prefetching them
+
+import math
+import queue
+import threading
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import TypeVar
+
+import pyarrow as pa
+
+T = TypeVar("T")
+
+# marks the end of the items put into a prefetch queue
+_DONE = object()
+
+
+def rechunk(
+    batches: Iterable[pa.RecordBatch],
+    chunk_rows: Optional[int] = None,
+    chunk_bytes: Optional[int] = None,
+) -> Iterator[pa.Table]:
+    """Function to regroup record batches of any size into tables of bounded size
+
+    Batches are sliced without copying. A chunk is complete once it has `chunk_rows` rows or
+    `chunk_bytes` bytes, whichever comes first. The size of a slice is estimated from the
+    average row size of its batch.
+
+    Args:
+        batches (Iterable[pa.RecordBatch]): record batches, e.g. pages of a query result
+        chunk_rows (Optional[int]): number of rows per chunk at most
+        chunk_bytes (Optional[int]): number of bytes per chunk at most, at least one row
+
+    Yields:
+        pa.Table: chunks of the batches in order, the last one possibly smaller
+
+    Raises:
+        ValueError: if neither chunk_rows nor chunk_bytes is given
+    """
+    if not chunk_rows and not chunk_bytes:
+        raise ValueError("Either chunk_rows or chunk_bytes is needed to bound the chunk size")
+    pending: List[pa.RecordBatch] = []
+    rows, nbytes = 0, 0.0
+    for batch in batches:
+        row_bytes = batch.nbytes / batch.num_rows if batch.num_rows else 0.0
+        while batch.num_rows:
+            take = batch.num_rows
+            if chunk_rows:
+                take = min(take, chunk_rows - rows)
+            if chunk_bytes and row_bytes:
+                take = min(take, max(math.ceil((chunk_bytes - nbytes) / row_bytes), 1))
+            pending.append(batch.slice(0, take))
+            rows += take
+            nbytes += take * row_bytes
+            batch = batch.slice(take)
+            if (chunk_rows and rows >= chunk_rows) or (chunk_bytes and nbytes >= chunk_bytes):
+                yield pa.Table.from_batches(pending)
+                pending, rows, nbytes = [], 0, 0.0
+    if pending:
+        yield pa.Table.from_batches(pending)
+
+
+def prefetch(items: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """Function to produce the next items of an iterable on a background thread
+
+    The thread starts right away and stays at most `depth` items ahead of the consumer, so
+    producing the next item, e.g. reading and converting the next chunk, overlaps with
+    processing the current one while memory stays bounded. Errors of the producer are raised to
+    the consumer, closing the returned iterator stops the producer.
+
+    Args:
+        items (Iterable[T]): items to produce
+        depth (int): number of items produced ahead at most, 0 to produce on demand
+
+    Returns:
+        Iterator[T]: the items in order
+    """
+    if depth <= 0:
+        return iter(items)
+    produced: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        # waits for space in the queue unless the consumer stopped
+        while not stopped.is_set():
+            try:
+                produced.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    return _consume(produced, stopped)
+
+
+def _consume(produced: "queue.Queue[Any]", stopped: threading.Event) -> Iterator[Any]:
+    try:
+        while True:
+            item, error = produced.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
@@ -1,35 +1,321 @@
 # script for data ingestion
 
+import logging
+import math
+import numbers
+from typing import Any
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Sequence
 
+# registers the dbdate and dbtime dtypes, so they are restored from cached query results
+import db_dtypes
+import numpy as np
 import pandas as pd
-from google.cloud import bigquery
+import pyarrow as pa
 
+from ..clients import bigquery_client
 from ..util import get_resource_folder
 from ..util import read_sql_file
+from .bq_storage import MAX_STREAMS
+from .bq_storage import iter_table_batches
+from .bq_storage import read_table
+from .bq_storage import target_schema
+from .chunks import prefetch
+from .chunks import rechunk
+from .query_cache import QueryCache
+from .query_cache import query_cache_key
 
 # data parameters for modelling
 
+# bound of the chunks yielded by iter_bq_query, in bytes of arrow data
+CHUNK_BYTES = 128 * 2**20
 
-def execute_bq_query(project: str, sql_query: str, dtypes: Optional[Dict] = None) -> pd.DataFrame:
+
+def execute_bq_query(
+    project: str,
+    sql_query: str,
+    dtypes: Optional[Dict] = None,
+    use_storage_api: bool = False,
+    read_client: Any = None,
+    max_streams: int = MAX_STREAMS,
+    arrow_backed: bool = False,
+    cache: Optional[QueryCache] = None,
+) -> pd.DataFrame:
     """Function to execute a SQL query on BigQuery and parse the result into a pandas dataframe
 
+    By default the result is paged through the REST API. With `use_storage_api` the result
+    table is read as arrow record batches over parallel streams of the Storage Read API, which
+    is much faster for large results, see `bq_storage.read_table`.
+
+    With a query cache, given or enabled by QUERY_CACHE_DIR, the result of a query that was run
+    before on unchanged tables is memory-mapped from local disk instead of being queried again,
+    see `query_cache.query_cache_key`. The dataframe is cached as converted, incl. the
+    db-dtypes of the REST API, and restored with the same dtypes. Results that cannot be written
+    to the cache are returned uncached.
+
     Args:
         sql_query (str): SQL query to be executed
         project (str): environment where to execute the query
         dtypes Optional(Dict): data types specifications for columns
+        use_storage_api (bool): whether to read the result via the Storage Read API
+        read_client (Any): BigQueryReadClient or stand-in for the Storage Read API, the shared
+            client if None
+        max_streams (int): number of streams to read the result with in parallel at most, rows
+            are only kept in order with a single stream
+        arrow_backed (bool): whether to return arrow-backed columns (pd.ArrowDtype) when reading
+            via the Storage Read API
+        cache (Optional[QueryCache]): local cache of query results, the one enabled by the
+            environment if None
 
     Returns:
         pd.DataFrame: query result parsed into a pandas dataframe
     """
-    client = bigquery.Client(project=project)
+    client = bigquery_client(project)
+    cache = cache if cache is not None else QueryCache.from_env()
+    conversion = f"dataframe:storage_api={use_storage_api}:arrow_backed={arrow_backed}"
+    key = query_cache_key(client, sql_query, dtypes, conversion) if cache is not None else None
+    if cache is not None and key is not None:
+        cached = cache.read(key)
+        if cached is not None:
+            logging.info(f"Reading query result {key} from the local query cache")
+            # the dtypes of the dataframe as queried are restored from the pandas metadata
+            return cached.to_pandas(split_blocks=True, self_destruct=True)
+
     query_job = client.query(sql_query)
+    if use_storage_api:
+        # wait for the query to write its destination table
+        query_job.result()
+        df = read_table(
+            query_job.destination,
+            parent_project=project,
+            dtypes=dtypes,
+            read_client=read_client,
+            max_streams=max_streams,
+            arrow_backed=arrow_backed,
+        )
+    elif dtypes:
+        df = query_job.result().to_dataframe(dtypes=dtypes)
+    else:
+        df = query_job.result().to_dataframe()
+
+    if cache is not None and key is not None:
+        try:
+            cache.write(key, pa.Table.from_pandas(df, preserve_index=False))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OSError) as e:
+            # e.g. object columns of mixed types or a full disk, caching is best-effort
+            logging.warning(f"Query result {key} not cached: {e!r}")
+    return df
+
+
+def rest_types_mapper(arrow_type: pa.DataType) -> Optional[Any]:
+    """Function to map arrow types to the dtypes `RowIterator.to_dataframe` converts them to
+
+    Query results read through the REST API are converted to nullable dtypes by default, e.g.
+    integer columns with NULLs stay integers instead of becoming float64.
+
+    Args:
+        arrow_type (pa.DataType): arrow type of a column of the query result
+
+    Returns:
+        Optional[Any]: pandas dtype of the column, None for pyarrow's default conversion
+    """
+    if pa.types.is_boolean(arrow_type):
+        return pd.BooleanDtype()
+    if pa.types.is_integer(arrow_type):
+        return pd.Int64Dtype()
+    if pa.types.is_date(arrow_type):
+        return db_dtypes.DateDtype()
+    if pa.types.is_time(arrow_type):
+        return db_dtypes.TimeDtype()
+    return None
+
+
+def _to_dataframe(
+    table: pa.Table, dtypes: Optional[Dict], arrow_backed: bool, rest_dtypes: bool = False
+) -> pd.DataFrame:
+    # converts a table to a dataframe with the dtypes, cast in arrow where possible, or like
+    # `RowIterator.to_dataframe` with the dtypes applied afterwards for `rest_dtypes`
+    if rest_dtypes and not arrow_backed:
+        df = table.to_pandas(types_mapper=rest_types_mapper, split_blocks=True, self_destruct=True)
+        return df.astype(dtypes) if dtypes else df
+    target, remaining = target_schema(table.schema, dtypes)
+    df = table.cast(target).to_pandas(
+        types_mapper=pd.ArrowDtype if arrow_backed else None, split_blocks=True, self_destruct=True
+    )
+    return df.astype(remaining) if remaining else df
+
+
+def iter_bq_query(
+    project: str,
+    sql_query: str,
+    dtypes: Optional[Dict] = None,
+    chunk_rows: Optional[int] = None,
+    chunk_bytes: Optional[int] = CHUNK_BYTES,
+    prefetch_chunks: int = 1,
+    use_storage_api: bool = False,
+    read_client: Any = None,
+    arrow_backed: bool = False,
+    cache: Optional[QueryCache] = None,
+) -> Iterator[pd.DataFrame]:
+    """Function to execute a SQL query on BigQuery and iterate over its result in chunks
+
+    The result is read one page or record batch at a time and regrouped into dataframes of at
+    most `chunk_rows` rows or about `chunk_bytes` bytes. The next chunks are read and converted
+    on a background thread while the current one is processed, so a table of any size can be
+    processed in memory bounded by the chunk size. With a query cache the chunks are also
+    written to it, and a cached result is read from it chunk by chunk, see `execute_bq_query`.
+    Chunks have the dtypes `execute_bq_query` returns for the same arguments, e.g. nullable
+    Int64 and db-dtypes columns when reading through the REST API.
+
+    Args:
+        project (str): environment where to execute the query
+        sql_query (str): SQL query to be executed
+        dtypes (Optional[Dict]): data types specifications for columns
+        chunk_rows (Optional[int]): number of rows per chunk at most
+        chunk_bytes (Optional[int]): number of bytes of arrow data per chunk at most
+        prefetch_chunks (int): number of chunks read ahead, 0 to read on demand
+        use_storage_api (bool): whether to read the result via the Storage Read API, in a
+            single stream to keep the order of the rows
+        read_client (Any): BigQueryReadClient or stand-in for the Storage Read API, the shared
+            client if None
+        arrow_backed (bool): whether to return arrow-backed columns (pd.ArrowDtype)
+        cache (Optional[QueryCache]): local cache of query results, the one enabled by the
+            environment if None
 
-    if dtypes:
-        return query_job.result().to_dataframe(dtypes=dtypes)
+    Returns:
+        Iterator[pd.DataFrame]: chunks of the query result, none for an empty result
+    """
+    client = bigquery_client(project)
+    cache = cache if cache is not None else QueryCache.from_env()
+    key = query_cache_key(client, sql_query, dtypes) if cache is not None else None
+    cached = cache.read(key) if cache is not None and key is not None else None
+    if cached is not None:
+        logging.info(f"Reading query result {key} from the local query cache")
+        batches: Iterable[pa.RecordBatch] = cached.to_batches()
     else:
-        return query_job.result().to_dataframe()
+        query_job = client.query(sql_query)
+        rows = query_job.result()
+        if use_storage_api:
+            batches = iter_table_batches(query_job.destination, project, read_client=read_client)
+        else:
+            batches = rows.to_arrow_iterable()
+
+    tables = rechunk(batches, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes)
+    if cached is None and cache is not None and key is not None:
+        tables = cache.write_tables(key, tables)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        for table in tables:
+            yield _to_dataframe(table, dtypes, arrow_backed, rest_dtypes=not use_storage_api)
+
+    return prefetch(chunks(), depth=prefetch_chunks)
+
+
+def sql_literal(value: Any) -> str:
+    """Function to render a Python value as a BigQuery SQL literal
+
+    Args:
+        value (Any): string, number, bool or None
+
+    Returns:
+        str: SQL literal, strings quoted with quotes and backslashes escaped, NaN and infinities
+            cast from their string form as BigQuery has no literal for them
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value):
+            return "CAST('NaN' AS FLOAT64)"
+        if math.isinf(value):
+            return f"CAST('{'-' if value < 0 else ''}inf' AS FLOAT64)"
+        return repr(value)
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def projected_columns(*column_sets: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """Function to combine the columns declared by the consumers of a query
+
+    Args:
+        *column_sets (Optional[Iterable[str]]): e.g. the input columns of a model, the features
+            checked for drift or the label, None if a consumer needs all columns
+
+    Returns:
+        Optional[List[str]]: columns in order of first declaration without duplicates, None if
+            any consumer needs all columns
+    """
+    columns: List[str] = []
+    for column_set in column_sets:
+        if column_set is None:
+            return None
+        columns.extend(column for column in column_set if column not in columns)
+    return columns
+
+
+def build_query(
+    table: str,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    order_by: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> str:
+    """Function to create a query reading only the columns and rows a consumer needs
+
+    BigQuery stores tables by column and bills the bytes of the columns read, so projecting the
+    declared columns instead of `SELECT *` cuts both the bytes scanned and the data transferred.
+
+    Args:
+        table (str): table id, e.g. `project.dataset.table`
+        columns (Optional[Sequence[str]]): columns to read, all if None, see `projected_columns`
+        filters (Optional[Dict[str, Any]]): column values rows have to match, a list or tuple of
+            values matches any of them
+        exclude (Optional[Sequence[str]]): columns not to read when reading all columns
+        order_by (Optional[str]): expression to order the rows by, e.g. `RAND()`
+        limit (Optional[int]): number of rows to read at most
+
+    Returns:
+        str: SQL query
+
+    Raises:
+        ValueError: if no column is left to read
+    """
+    if columns is not None:
+        select = ", ".join(f"`{column}`" for column in columns if column not in (exclude or []))
+        if not select:
+            raise ValueError(f"No columns left to read from {table}")
+    elif exclude:
+        select = f"* EXCEPT({', '.join(f'`{column}`' for column in exclude)})"
+    else:
+        select = "*"
+
+    lines = [f"SELECT {select}", f"FROM `{table}`"]
+    conditions = []
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple)):
+            conditions.append(f"`{column}` IN ({', '.join(sql_literal(v) for v in value)})")
+        elif value is None:
+            conditions.append(f"`{column}` IS NULL")
+        else:
+            conditions.append(f"`{column}` = {sql_literal(value)}")
+    if conditions:
+        lines.append(f"WHERE {' AND '.join(conditions)}")
+    if order_by:
+        lines.append(f"ORDER BY {order_by}")
+    if limit is not None:
+        lines.append(f"LIMIT {int(limit)}")
+
+    # same layout as the queries written inline
+    return "".join(f"\n        {line}" for line in lines) + "\n    "
 
 
 def create_data_query(param_1: str, param_2: str) -> str:
@@ -8,6 +8,8 @@ import google.api_core.exceptions
 import pandas as pd
 from google.cloud import bigquery
 
+from ..clients import bigquery_client
+
 
 def output_data(
     project: str,
@@ -30,8 +32,8 @@ def output_data(
     Raises:
         Exception: google.api_core.exceptions.GoogleAPICallError when there is an API call error
     """
-    # Initialize a BigQuery client using the specified GCP project.
-    client = bigquery.Client(project=project)
+    # Get the shared BigQuery client of the specified GCP project.
+    client = bigquery_client(project)
 
     # Check if a data type mapping is provided, and create a schema if available.
     if data_type_mapping:
@@ -56,3 +58,18 @@ def output_data(
     except google.api_core.exceptions.GoogleAPICallError:
         logging.error(f"Job errors: {job.errors}")
         raise
+
+
+def table_schema(project: str, table_id: str) -> List[Tuple[str, str]]:
+    """
+    Reads the schema of a BigQuery table in the format `output_data` takes it, e.g. to append
+    further chunks of data with the schema the first chunk was loaded with.
+    Args:
+        project (str): GCP project
+        table_id (str): id of the table in the form of dataset.tablename
+
+    Returns:
+        List[Tuple[str, str]]: column names and data types of the table
+    """
+    table = bigquery_client(project).get_table(table_id)
+    return [(field.name, field.field_type) for field in table.schema]
@@ -0,0 +1,186 @@
+# script for caching query results locally as memory-mapped arrow files
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+import pyarrow as pa
+from google.cloud import bigquery
+
+from ..model.model_cache import ModelCache
+from ..model.model_cache import cache_key
+
+# default location and size limit of the local query cache, overridable by environment variables
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "xgb_churn_prediction_queries")
+DEFAULT_MAX_MB = 4096
+
+# name of the arrow file holding the result in a cache entry
+RESULT_FILE = "result.arrow"
+
+# string literals and quoted identifiers, kept as they are, or runs of whitespace and comments
+_SQL_TOKENS = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|((?:\s|--[^\n]*|#[^\n]*|/\*.*?\*/)+)""",
+    re.DOTALL,
+)
+
+# functions whose result changes between runs of the same query on the same tables
+_NONDETERMINISTIC = re.compile(
+    r"\b(RAND|GENERATE_UUID|CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIME|CURRENT_TIMESTAMP"
+    r"|SESSION_USER)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(sql_query: str) -> str:
+    """Function to normalize a SQL query, so formatting and comments do not change its cache key
+
+    Args:
+        sql_query (str): SQL query
+
+    Returns:
+        str: query with comments removed, whitespace outside of literals collapsed to single
+            spaces and without trailing semicolon
+    """
+    normalized = _SQL_TOKENS.sub(lambda match: match.group(1) or " ", sql_query)
+    return normalized.strip().rstrip(";").rstrip()
+
+
+def query_cache_key(
+    client: Any, sql_query: str, dtypes: Optional[Dict] = None, conversion: str = ""
+) -> Optional[str]:
+    """Function to derive the cache key of a query result from what determines its content
+
+    The tables a query reads are found with a dry run, which is free and does not scan data.
+    The key covers the normalized query, the path and last modification time of every table
+    read, the dtypes and the conversion, so a changed table gets a different key.
+
+    Args:
+        client (Any): bigquery.Client
+        sql_query (str): SQL query
+        dtypes (Optional[Dict]): data types specifications for columns
+        conversion (str): how the result is converted before it is cached, empty for the arrow
+            result as read, results converted differently get different keys
+
+    Returns:
+        Optional[str]: cache key, None if the result cannot be cached, e.g. for queries calling
+            RAND() or reading tables with streamed rows or external data
+    """
+    normalized = normalize_sql(sql_query)
+    if _NONDETERMINISTIC.search(normalized):
+        return None
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    dry_run = client.query(normalized, job_config=job_config)
+    tables = []
+    for reference in sorted(dry_run.referenced_tables, key=lambda table: table.path):
+        table = client.get_table(reference)
+        # streamed rows and external data change without changing the modification time
+        if table.modified is None or table.streaming_buffer or table.table_type == "EXTERNAL":
+            return None
+        tables.append(f"{reference.path}@{table.modified.isoformat()}")
+    columns = sorted((column, str(dtype)) for column, dtype in (dtypes or {}).items())
+    return cache_key(normalized, *tables, repr(columns), conversion)
+
+
+class QueryCache(ModelCache):
+    """Local on-disk cache of query results.
+
+    Every entry holds the result as an uncompressed arrow IPC file, which is memory-mapped when
+    read, so loading a cached result does not copy it and only touches the pages converted.
+    Entries are added and evicted like the ones of ModelCache.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+        """Initializes a new instance of QueryCache.
+
+        Args:
+            directory (Optional[str]): directory of the cache, defaults to QUERY_CACHE_DIR or
+                `~/.cache/xgb_churn_prediction_queries`
+            max_bytes (Optional[int]): size limit of the cache, defaults to QUERY_CACHE_MAX_MB
+                or 4096 MB
+        """
+        if directory is None:
+            directory = os.environ.get("QUERY_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("QUERY_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 2**20)
+        super().__init__(directory, max_bytes)
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryCache"]:
+        """Function to get the query cache enabled by the environment
+
+        Returns:
+            Optional[QueryCache]: cache in QUERY_CACHE_DIR, None if the variable is not set
+        """
+        return cls() if os.environ.get("QUERY_CACHE_DIR") else None
+
+    def read(self, key: str) -> Optional[pa.Table]:
+        """Function to read a cached result, marking it as recently used
+
+        Args:
+            key (str): cache key, see `query_cache_key`
+
+        Returns:
+            Optional[pa.Table]: result memory-mapped from the cache, None if it is not cached
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        with pa.memory_map(os.path.join(path, RESULT_FILE)) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def write(self, key: str, table: pa.Table) -> None:
+        """Function to add a result to the cache
+
+        Args:
+            key (str): cache key, see `query_cache_key`
+            table (pa.Table): query result
+        """
+
+        def write_file(directory: str) -> None:
+            with pa.ipc.new_file(os.path.join(directory, RESULT_FILE), table.schema) as writer:
+                writer.write_table(table)
+
+        self.put(key, write_file)
+
+    def write_tables(self, key: str, tables: Iterable[pa.Table]) -> Iterator[pa.Table]:
+        """Function to add a result to the cache while it is passed on in parts
+
+        The parts are appended to a temporary file that is only added to the cache once all of
+        them have been passed on, so a partly consumed result is not cached.
+
+        Args:
+            key (str): cache key, see `query_cache_key`
+            tables (Iterable[pa.Table]): parts of the query result with the same schema
+
+        Yields:
+            pa.Table: the parts in order, after writing them
+        """
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        path = os.path.join(staging, RESULT_FILE)
+        writer = None
+
+        def move_file(directory: str) -> None:
+            shutil.move(path, directory)
+
+        try:
+            for table in tables:
+                if writer is None:
+                    writer = pa.ipc.new_file(path, table.schema)
+                writer.write_table(table)
+                yield table
+            if writer is not None:
+                writer.close()
+                writer = None
+                self.put(key, move_file)
+                logging.info(f"Cached query result {key}")
+        finally:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(staging, ignore_errors=True)
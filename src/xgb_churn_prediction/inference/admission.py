@@ -0,0 +1,354 @@
+# admission control and load shedding of prediction requests
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+# header with the number of milliseconds the caller waits for the response
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+# optional header with the number of rows of the request, checked before its body is read
+ROWS_HEADER = "X-Request-Rows"
+
+# reasons for rejecting a request, exported as label of the rejection counter
+QUEUE_FULL = "queue_full"
+DEADLINE = "deadline"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is rejected by admission control.
+
+    Attributes:
+        reason (str): `queue_full` or `deadline`
+        status (int): HTTP status to answer with, 429 if too many requests are waiting and 503
+            if the request cannot be answered within its deadline
+    """
+
+    def __init__(self, reason: str, message: str) -> None:
+        """Initializes a new instance of AdmissionRejected.
+
+        Args:
+            reason (str): reason of the rejection
+            message (str): message returned to the client
+        """
+        super().__init__(message)
+        self.reason = reason
+        self.status = 429 if reason == QUEUE_FULL else 503
+
+
+@dataclass
+class _Waiter:
+    """A request waiting for in-flight capacity.
+
+    Attributes:
+        rows (int): number of rows of the request
+        grant (Callable[[], None]): function waking up the waiting request
+        granted (bool): whether capacity has been handed over to the request
+    """
+
+    rows: int
+    grant: Callable[[], None]
+    granted: bool = False
+
+
+def parse_deadline(value: str, start: float, default_ms: float = 0) -> Optional[float]:
+    """Function to compute the deadline of a request from its deadline header
+
+    Args:
+        value (str): value of the deadline header, empty if not given
+        start (float): time.monotonic timestamp when the request arrived
+        default_ms (float): deadline of requests without the header, no deadline if 0
+
+    Returns:
+        Optional[float]: time.monotonic timestamp by which the response is due, None if no
+            deadline applies
+
+    Raises:
+        ValueError: if the header is not a positive number of milliseconds
+    """
+    if value:
+        try:
+            milliseconds = float(value)
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} must be a number of milliseconds, got {value}")
+        if milliseconds <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} must be positive, got {value}")
+    else:
+        milliseconds = default_ms
+    return start + milliseconds / 1000 if milliseconds > 0 else None
+
+
+class AdmissionController:
+    """Limits the rows being predicted at the same time and sheds load it cannot serve in time.
+
+    Requests are admitted while the rows in flight stay within `max_inflight_rows`; a request
+    with more rows than that is admitted on its own once nothing else is in flight. Requests
+    that do not fit wait in FIFO order, at most `max_queued` of them, and any request beyond
+    that is rejected straight away with a 429 instead of piling up until the caller times out.
+
+    Requests with a deadline are rejected with a 503 as soon as it is clear they cannot make
+    it: when the deadline has passed before they are admitted, or when the expected prediction
+    time, a moving average of the seconds per row of past requests, exceeds the time left.
+
+    Both blocking (`admit`, for the threads of the Flask app) and asyncio (`admit_async`, for
+    the ASGI server) admission is supported, a single instance serves one of them.
+
+    Before the body of a request is read, `precheck` already rejects it if the queue is full or
+    its deadline cannot be met by the rows it is expected to have, from the `X-Request-Rows`
+    header or estimated from its Content-Length, see `expected_rows`. Overload is thereby shed
+    without reading, decompressing and decoding bodies that are rejected anyway.
+    """
+
+    def __init__(
+        self, max_inflight_rows: int = 0, max_queued: int = 16, smoothing: float = 0.1
+    ) -> None:
+        """Initializes a new instance of AdmissionController.
+
+        Args:
+            max_inflight_rows (int): maximum number of rows predicted at the same time, no limit
+                if 0
+            max_queued (int): maximum number of requests waiting to be admitted
+            smoothing (float): weight of the latest request in the moving average of the
+                prediction seconds per row
+        """
+        self.max_inflight_rows = max_inflight_rows
+        self.max_queued = max_queued
+        self.smoothing = smoothing
+        self.seconds_per_row: Optional[float] = None
+        self.inflight_rows = 0
+        self.inflight_requests = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {QUEUE_FULL: 0, DEADLINE: 0}
+        self._queue: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # moving average of the body bytes per row by content type and encoding
+        self._bytes_per_row: Dict[Tuple[str, str], float] = {}
+
+    def expected_rows(
+        self,
+        rows_header: str,
+        body_format: Tuple[str, str],
+        content_length: Optional[int],
+    ) -> int:
+        """Function to get the number of rows a request is expected to have before reading it
+
+        Args:
+            rows_header (str): value of the `X-Request-Rows` header, empty if not given
+            body_format (Tuple[str, str]): content type and content encoding of the body
+            content_length (Optional[int]): size of the body, None if not known up front
+
+        Returns:
+            int: number of rows given by the header, else estimated from the body size of past
+                requests of the same format, 0 if unknown
+
+        Raises:
+            ValueError: if the header is not a non-negative number of rows
+        """
+        if rows_header:
+            try:
+                rows = int(rows_header)
+            except ValueError:
+                rows = -1
+            if rows < 0:
+                raise ValueError(f"{ROWS_HEADER} must be a number of rows, got {rows_header}")
+            return rows
+        bytes_per_row = self._bytes_per_row.get(body_format)
+        if not content_length or not bytes_per_row:
+            return 0
+        return int(content_length / bytes_per_row)
+
+    def observe_body(self, body_format: Tuple[str, str], n_bytes: int, rows: int) -> None:
+        """Function to record the size of a decoded request, used by `expected_rows`
+
+        Args:
+            body_format (Tuple[str, str]): content type and content encoding of the body
+            n_bytes (int): size of the body as received
+            rows (int): number of rows decoded from it
+        """
+        if n_bytes <= 0 or rows <= 0:
+            return
+        with self._lock:
+            latest = n_bytes / rows
+            previous = self._bytes_per_row.get(body_format)
+            self._bytes_per_row[body_format] = (
+                latest if previous is None else previous + self.smoothing * (latest - previous)
+            )
+
+    def precheck(self, rows: int, deadline: Optional[float] = None) -> None:
+        """Function to reject a request before its body is read if it cannot be admitted
+
+        Nothing is reserved, the request still has to be admitted with its exact number of
+        rows once decoded.
+
+        Args:
+            rows (int): number of rows the request is expected to have, 0 if unknown
+            deadline (Optional[float]): time.monotonic timestamp by which the response is due
+
+        Raises:
+            AdmissionRejected: if the queue is full and the request would have to wait, or its
+                deadline cannot be met
+        """
+        with self._lock:
+            self._check_deadline(rows, deadline)
+            must_wait = bool(self._queue) or not self._fits(rows)
+            if must_wait and len(self._queue) >= self.max_queued:
+                self.rejected[QUEUE_FULL] += 1
+                raise AdmissionRejected(QUEUE_FULL, "Too many requests waiting, retry later")
+
+    def admit(self, rows: int, deadline: Optional[float] = None) -> None:
+        """Function to wait until a request may be predicted, call `release` once done
+
+        Args:
+            rows (int): number of rows of the request
+            deadline (Optional[float]): time.monotonic timestamp by which the response is due
+
+        Raises:
+            AdmissionRejected: if the request is rejected
+        """
+        event = threading.Event()
+        waiter = self._enter(rows, deadline, event.set)
+        if waiter is None:
+            return
+        event.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+        self._leave(waiter, deadline)
+
+    async def admit_async(self, rows: int, deadline: Optional[float] = None) -> None:
+        """Function to wait on the event loop until a request may be predicted
+
+        Call `release` once the prediction is done, see `admit`.
+
+        Args:
+            rows (int): number of rows of the request
+            deadline (Optional[float]): time.monotonic timestamp by which the response is due
+
+        Raises:
+            AdmissionRejected: if the request is rejected
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake_up() -> None:
+            if not granted.done():
+                granted.set_result(None)
+
+        def grant() -> None:
+            loop.call_soon_threadsafe(wake_up)
+
+        waiter = self._enter(rows, deadline, grant)
+        if waiter is None:
+            return
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # the client went away while waiting, give back capacity handed over meanwhile
+            with self._lock:
+                if waiter.granted:
+                    self._release(waiter.rows)
+                else:
+                    self._queue.remove(waiter)
+            raise
+        self._leave(waiter, deadline)
+
+    def release(self, rows: int, seconds: Optional[float] = None) -> None:
+        """Function to hand back the capacity of an admitted request once it is predicted
+
+        Args:
+            rows (int): number of rows of the request
+            seconds (Optional[float]): prediction time of the request, updates the estimate
+                used to reject requests that cannot make their deadline
+        """
+        with self._lock:
+            if seconds is not None and rows > 0:
+                latest = seconds / rows
+                if self.seconds_per_row is None:
+                    self.seconds_per_row = latest
+                else:
+                    self.seconds_per_row += self.smoothing * (latest - self.seconds_per_row)
+            self._release(rows)
+
+    def _enter(
+        self, rows: int, deadline: Optional[float], grant: Callable[[], None]
+    ) -> Optional[_Waiter]:
+        # admits the request right away and returns None, or queues it and returns its waiter
+        with self._lock:
+            self._check_deadline(rows, deadline)
+            if not self._queue and self._fits(rows):
+                self._admit(rows)
+                return None
+            if len(self._queue) >= self.max_queued:
+                self.rejected[QUEUE_FULL] += 1
+                raise AdmissionRejected(QUEUE_FULL, "Too many requests waiting, retry later")
+            waiter = _Waiter(rows, grant)
+            self._queue.append(waiter)
+            return waiter
+
+    def _leave(self, waiter: _Waiter, deadline: Optional[float]) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._queue.remove(waiter)
+                self.rejected[DEADLINE] += 1
+                raise AdmissionRejected(DEADLINE, "Request deadline passed while waiting")
+            try:
+                self._check_deadline(waiter.rows, deadline)
+            except AdmissionRejected:
+                self._release(waiter.rows)
+                raise
+
+    def _check_deadline(self, rows: int, deadline: Optional[float]) -> None:
+        # called with the lock held
+        if deadline is None:
+            return
+        remaining = deadline - time.monotonic()
+        expected = (self.seconds_per_row or 0.0) * rows
+        if remaining <= expected:
+            self.rejected[DEADLINE] += 1
+            raise AdmissionRejected(
+                DEADLINE,
+                f"Request cannot be answered within its deadline, {remaining * 1000:.1f}ms left",
+            )
+
+    def _fits(self, rows: int) -> bool:
+        return (
+            self.max_inflight_rows <= 0
+            or self.inflight_rows == 0
+            or self.inflight_rows + rows <= self.max_inflight_rows
+        )
+
+    def _admit(self, rows: int) -> None:
+        self.inflight_rows += rows
+        self.inflight_requests += 1
+        self.admitted += 1
+
+    def _release(self, rows: int) -> None:
+        # called with the lock held, hands the capacity over to waiting requests in FIFO order
+        self.inflight_rows -= rows
+        self.inflight_requests -= 1
+        while self._queue and self._fits(self._queue[0].rows):
+            waiter = self._queue.popleft()
+            self._admit(waiter.rows)
+            waiter.granted = True
+            waiter.grant()
+
+    def snapshot(self) -> Dict[str, float]:
+        """Function to get the admission counters
+
+        Returns:
+            Dict[str, float]: rows and requests in flight, queued requests, admitted requests
+                and rejected requests per reason
+        """
+        with self._lock:
+            return {
+                "inflight_rows": self.inflight_rows,
+                "inflight_requests": self.inflight_requests,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                **{f"rejected_{reason}": count for reason, count in self.rejected.items()},
+            }
@@ -1,3 +1,53 @@
+import gc
+import glob
 import os
+import tempfile
+from typing import Any
+
+from xgb_churn_prediction.inference.resources import cpu_limit
+from xgb_churn_prediction.inference.resources import gunicorn_settings
+from xgb_churn_prediction.inference.resources import memory_limit
 
 bind = f'0.0.0.0:{os.environ["AIP_HTTP_PORT"]}'
+
+# load the app - and with it the model - once in the master process and fork the workers from
+# it, so all workers share the model memory copy-on-write instead of downloading their own copy
+preload_app = os.environ.get("GUNICORN_PRELOAD_APP", "true").lower() == "true"
+
+# worker processes, threads, recycling and timeouts derived from CPU and memory limits of the
+# container, each can be overridden via GUNICORN_<SETTING> environment variables
+settings = gunicorn_settings(cpu_limit(), memory_limit())
+worker_class = settings["worker_class"]
+workers = settings["workers"]
+threads = settings["threads"]
+max_requests = settings["max_requests"]
+max_requests_jitter = settings["max_requests_jitter"]
+keepalive = settings["keepalive"]
+timeout = settings["timeout"]
+graceful_timeout = settings["graceful_timeout"]
+
+# the workers write their metrics to files in this directory, so a scrape answered by any of
+# them returns the metrics of all workers, it is set before the app and prometheus_client load
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+    # metrics of an earlier run of the server
+    os.remove(path)
+
+
+def when_ready(server: Any) -> None:
+    """Gunicorn hook called in the master process just before the workers are forked"""
+    if preload_app:
+        # move everything allocated while loading the model into a permanent generation, so
+        # garbage collection in the workers does not write to (and thereby copy) shared pages
+        gc.collect()
+        gc.freeze()
+
+
+def child_exit(server: Any, worker: Any) -> None:
+    """Gunicorn hook called in the master process when a worker exits, e.g. when recycled"""
+    # imported here, prometheus_client picks its storage when it is imported
+    from prometheus_client import multiprocess
+
+    # counters and histograms of the worker are kept, its live gauges are dropped
+    multiprocess.mark_process_dead(worker.pid)
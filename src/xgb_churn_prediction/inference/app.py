@@ -1,76 +1,208 @@
 # custom HTTP server using Flask to serve predictions from a custom-trained model
 # doco: https://cloud.google.com/vertex-ai/docs/predictions/custom-container-requirements#image
-import io
 import os
-import pickle
+import time
 from typing import Any
 from typing import Dict
-from typing import List
+from typing import NoReturn
 
-import pandas as pd
 from flask import Flask
-from flask import jsonify
+from flask import Response
 from flask import request
-from google.cloud import storage
+from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import HTTPException
-
-health_endpoint = os.environ["AIP_HEALTH_ROUTE"]
-predict_endpoint = os.environ["AIP_PREDICT_ROUTE"]
-model_gcs_uri = os.environ["AIP_STORAGE_URI"]
-
-
-def download_model() -> Any:
-    """Function to load model from gcs uri
-
-    Returns:
-        object: The deserialized Python object, which is of the same type as the
-        original pickled object.
-    """
-    client = storage.Client()
-    buffer = io.BytesIO()
-    client.download_blob_to_file(f"{model_gcs_uri}/model.pkl", buffer, raw_download=True)
-    buffer.seek(0)
-    return pickle.load(buffer)
-
-
-model = download_model()
+from werkzeug.exceptions import NotFound
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.exceptions import UnsupportedMediaType
+
+from xgb_churn_prediction.inference.admission import DEADLINE_HEADER
+from xgb_churn_prediction.inference.admission import ROWS_HEADER
+from xgb_churn_prediction.inference.admission import AdmissionRejected
+from xgb_churn_prediction.inference.admission import parse_deadline
+from xgb_churn_prediction.inference.decoding import RequestDecoder
+from xgb_churn_prediction.inference.decoding import RequestTooLarge
+from xgb_churn_prediction.inference.decoding import UnsupportedEncoding
+from xgb_churn_prediction.inference.decoding import check_content_length
+from xgb_churn_prediction.inference.encoding import encode_predictions
+from xgb_churn_prediction.inference.metrics import PROMETHEUS_CONTENT_TYPE
+from xgb_churn_prediction.inference.model_store import DEFAULT_VERSION
+from xgb_churn_prediction.inference.model_store import MODEL_VERSION_HEADER
+from xgb_churn_prediction.inference.model_store import MODEL_VERSION_PARAMETER
+from xgb_churn_prediction.inference.outputs import OutputOptions
+from xgb_churn_prediction.inference.serving import admission
+from xgb_churn_prediction.inference.serving import cache
+from xgb_churn_prediction.inference.serving import collect_stats
+from xgb_churn_prediction.inference.serving import default_deadline_ms
+from xgb_churn_prediction.inference.serving import get_model
+from xgb_churn_prediction.inference.serving import health_endpoint
+from xgb_churn_prediction.inference.serving import max_body_bytes
+from xgb_churn_prediction.inference.serving import metrics
+from xgb_churn_prediction.inference.serving import metrics_endpoint
+from xgb_churn_prediction.inference.serving import predict_endpoint
+from xgb_churn_prediction.inference.serving import ready
+from xgb_churn_prediction.inference.serving import shadow
+from xgb_churn_prediction.inference.serving import watcher
+
+stats_endpoint = os.environ.get("STATS_ROUTE", "/stats")
+
+# size of the chunks request bodies are read and decoded in
+REQUEST_CHUNK_BYTES = 64 * 1024
 
 app = Flask(__name__)
 
 
 @app.route(health_endpoint)
-def healthy() -> Dict:
+def healthy() -> Any:
     """Endpoint to perform health checks on HTTP server (required by Vertex AI)
 
+    The first health check starts the warm-up of the model in the worker, which only reports
+    healthy once warm-up has finished.
+
     Returns:
-        Dict: empty dict as confirmation of health
+        Any: empty dict as confirmation of health, 503 while the model is warming up
     """
+    if not ready():
+        return {"exception": "Model is warming up"}, 503
     return {}
 
 
 @app.route(predict_endpoint, methods=["POST"])
-def predict() -> Dict:
+def predict() -> Response:
     """Endpoint to handle prediction requests if model is deployed to an endpoint
 
     Add all logic that is required to pre- or post-process data in here
-    Currently, data is loaded from json body to then generate predicitons with the loaded model
+    Currently, data is loaded from the request body to then generate predicitons with the loaded
+    model. Besides the Vertex AI `instances` format, a columnar JSON body
+    `{"columns": [...], "data": [[...], ...]}` and Arrow IPC streams (content type
+    `application/vnd.apache.arrow.stream`) are accepted, optionally compressed with a
+    `Content-Encoding` of gzip, deflate or zstd.
+    Results are returned as JSON unless the Accept header asks for `application/x-npy` or
+    `application/vnd.apache.arrow.stream`.
+
+    Requests are served by the default model unless the `X-Model-Version` header or the
+    `model_version` query parameter selects one of the versions in MODEL_VERSIONS.
+
+    Requests beyond the admission limits are rejected with a 429 and requests that cannot be
+    answered within the milliseconds in the `X-Request-Deadline-Ms` header with a 503. Both are
+    checked before the body is read, with the rows given by the `X-Request-Rows` header or
+    estimated from the Content-Length, and again with the exact rows once it is decoded.
+
+    Outputs are controlled via `parameters` in the body or the query string:
+    `output=proba` adds class scores, `top_k=<k>` only returns the k best classes with their
+    scores and `threshold=<t>` sets the cut-off on the positive class score for binary labels.
 
     Returns:
-        Dict: prediction results
+        Response: prediction results
     """
-    obj = request.get_json(force=True, cache=False)
-    instances: List[dict] = obj["instances"]
-    data_df = pd.DataFrame(instances)
+    start = time.perf_counter()
+    arrived = time.monotonic()
+    try:
+        deadline = parse_deadline(
+            request.headers.get(DEADLINE_HEADER, ""), arrived, default_deadline_ms
+        )
+        body_format = (request.content_type or "", request.headers.get("Content-Encoding", ""))
+        check_content_length(request.content_length, max_body_bytes)
+        expected_rows = admission.expected_rows(
+            request.headers.get(ROWS_HEADER, ""), body_format, request.content_length
+        )
+    except RequestTooLarge as e:
+        raise RequestEntityTooLarge(str(e))
+    except ValueError as e:
+        raise BadRequest(str(e))
+    # shed overload before reading, decompressing and decoding the body
+    try:
+        admission.precheck(expected_rows, deadline)
+    except AdmissionRejected as e:
+        _reject(e)
+
+    try:
+        decoder = RequestDecoder(*body_format, max_bytes=max_body_bytes)
+        # the body is decoded chunk by chunk while it is read from the socket
+        n_bytes = 0
+        while True:
+            chunk = request.stream.read(REQUEST_CHUNK_BYTES)
+            if not chunk:
+                break
+            n_bytes += len(chunk)
+            decoder.feed(chunk)
+        metrics.request_bytes.observe(n_bytes)
+        data_df, parameters = decoder.finish()
+        admission.observe_body(body_format, n_bytes, len(data_df))
+        timings = decoder.timings
+        options = OutputOptions.from_parameters({**parameters, **request.args})
+    except UnsupportedEncoding as e:
+        raise UnsupportedMediaType(str(e))
+    except RequestTooLarge as e:
+        raise RequestEntityTooLarge(str(e))
+    except ValueError as e:
+        raise BadRequest(str(e))
+    metrics.request_rows.observe(len(data_df))
 
     # TODO Add any logic to pre process infence input
-    predictions = model.predict(data_df)
-    labels = [{"label": pred} for pred in predictions]
-    output = {"predictions": labels}
-    return jsonify(output)
+    # the request finishes on this model even if a new version is swapped in meanwhile
+    version = request.headers.get(MODEL_VERSION_HEADER) or request.args.get(MODEL_VERSION_PARAMETER)
+    try:
+        loaded = get_model(version)
+    except KeyError as e:
+        raise NotFound(e.args[0])
+    admission_start = time.perf_counter()
+    try:
+        admission.admit(len(data_df), deadline)
+    except AdmissionRejected as e:
+        _reject(e)
+    predict_start = time.perf_counter()
+    metrics.queue_wait_seconds.labels("admission").observe(predict_start - admission_start)
+    try:
+        outputs = loaded.predict(data_df, options, cache=cache)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    finally:
+        admission.release(len(data_df), time.perf_counter() - predict_start)
+    timings["predict"] = time.perf_counter() - predict_start
+    if shadow is not None and version in (None, "", DEFAULT_VERSION):
+        shadow.submit(data_df, options, loaded, outputs)
+
+    encode_start = time.perf_counter()
+    body, content_type = encode_predictions(outputs, request.headers.get("Accept", ""))
+    timings["encode"] = time.perf_counter() - encode_start
+    timings["total"] = time.perf_counter() - start
+    for stage, seconds in timings.items():
+        metrics.stage_seconds.labels(stage).observe(seconds)
+    return Response(body, content_type=content_type)
+
+
+def _reject(e: AdmissionRejected) -> NoReturn:
+    metrics.rejections.labels(e.reason).inc()
+    if e.status == 429:
+        raise TooManyRequests(str(e))
+    raise ServiceUnavailable(str(e))
+
+
+@app.route(stats_endpoint)
+def stats() -> Dict:
+    """Endpoint to expose the served model version, micro-batching and prediction cache counters
+
+    Returns:
+        Dict: model version and stats of micro-batching and prediction cache, if enabled
+    """
+    return {"model_version": watcher.current.version, **collect_stats()}
+
+
+@app.route(metrics_endpoint)
+def metrics_exposition() -> Response:
+    """Endpoint to expose request metrics and per-stage latency histograms to Prometheus
+
+    Returns:
+        Response: metrics of this worker in the Prometheus text exposition format
+    """
+    return Response(metrics.expose(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.errorhandler(Exception)
 def handle_exception(e: Exception) -> Any:
+    metrics.errors.labels(type(e).__name__).inc()
     if isinstance(e, HTTPException):
         return e
 
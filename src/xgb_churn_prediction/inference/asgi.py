@@ -0,0 +1,27 @@
+# custom ASGI HTTP server to serve predictions from a custom-trained model
+# alternative to the Flask app in app.py, run with `SERVING_MODE=asgi` (see entrypoint.sh)
+# doco: https://cloud.google.com/vertex-ai/docs/predictions/custom-container-requirements#image
+import os
+
+from xgb_churn_prediction.inference import serving
+from xgb_churn_prediction.inference.server import AsgiPredictionServer
+
+# number of predictions running in parallel and number of admitted requests per worker
+max_concurrency = int(os.environ.get("PREDICT_MAX_CONCURRENCY", os.cpu_count() or 1))
+max_pending = int(os.environ.get("PREDICT_MAX_PENDING", "32"))
+
+app = AsgiPredictionServer(
+    get_model=serving.get_model,
+    health_route=serving.health_endpoint,
+    predict_route=serving.predict_endpoint,
+    cache=serving.cache,
+    shadow=serving.shadow,
+    is_ready=serving.ready,
+    max_concurrency=max_concurrency,
+    max_pending=max_pending,
+    metrics=serving.metrics,
+    metrics_route=serving.metrics_endpoint,
+    admission=serving.admission,
+    default_deadline_ms=serving.default_deadline_ms,
+    max_body_bytes=serving.max_body_bytes,
+)
@@ -0,0 +1,260 @@
+# dynamic micro-batching of concurrent prediction requests
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class _PendingRequest:
+    """A single request waiting to be scored as part of a batch.
+
+    Attributes:
+        data (pd.DataFrame): rows to score for this request
+        enqueued_at (float): perf_counter timestamp when the request was submitted
+        done (threading.Event): set once result or error is available
+        result (Optional[np.ndarray]): predictions for the rows of this request
+        error (Optional[BaseException]): exception raised while scoring the batch
+    """
+
+    data: pd.DataFrame
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[np.ndarray] = None
+    error: Optional[BaseException] = None
+
+
+class BatchingStats:
+    """Thread safe counters for batch sizes and request latencies.
+
+    Latencies are kept in a bounded window so percentiles reflect recent traffic only.
+    """
+
+    def __init__(self, window: int = 10000) -> None:
+        """Initializes a new instance of BatchingStats.
+
+        Args:
+            window (int): number of most recent requests used for latency percentiles
+        """
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.max_batch_rows = 0
+
+    def record_batch(self, n_requests: int, n_rows: int) -> None:
+        """Function to count a scored batch
+
+        Args:
+            n_requests (int): number of requests coalesced into the batch
+            n_rows (int): number of rows scored in the batch
+        """
+        with self._lock:
+            self.batches += 1
+            self.requests += n_requests
+            self.rows += n_rows
+            self.max_batch_rows = max(self.max_batch_rows, n_rows)
+
+    def record_latency(self, seconds: float) -> None:
+        """Function to record the time a request took from submission to its result
+
+        Args:
+            seconds (float): latency of the request
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Function to get a consistent copy of all counters
+
+        Returns:
+            Dict[str, float]: counters, mean batch size and p50/p99 latency in milliseconds
+        """
+        with self._lock:
+            latencies = np.fromiter(self._latencies, dtype=float)
+            snapshot = {
+                "requests": self.requests,
+                "rows": self.rows,
+                "batches": self.batches,
+                "max_batch_rows": self.max_batch_rows,
+                "mean_batch_requests": self.requests / self.batches if self.batches else 0.0,
+                "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            }
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        else:
+            p50, p99 = 0.0, 0.0
+        snapshot.update({"latency_p50_ms": float(p50), "latency_p99_ms": float(p99)})
+        return snapshot
+
+
+class MicroBatcher:
+    """Coalesces concurrent prediction requests into one vectorized predict call.
+
+    Requests are collected until either `max_wait_ms` has passed since the first request of
+    the batch arrived or `max_rows` rows are waiting. A single background thread then scores
+    all collected rows at once and hands each caller back its own slice of the result.
+    Only requests with the same columns are scored together, so a request never changes the
+    rows of another one. If scoring a batch fails, its requests are scored one by one, so only
+    the requests that fail on their own get an error.
+    Only useful if the server handles requests concurrently (e.g. gunicorn gthread workers).
+    The worker thread is started on first use in each process, so a batcher created before
+    gunicorn forks its workers (preload mode) works in every worker.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[pd.DataFrame], Any],
+        max_wait_ms: float = 2.0,
+        max_rows: int = 1024,
+        observe_queue_wait: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        """Initializes a new instance of MicroBatcher.
+
+        Args:
+            predict_fn (Callable[[pd.DataFrame], Any]): vectorized function returning one
+                prediction per input row, e.g. `model.predict`
+            max_wait_ms (float): maximum time to hold a request waiting for more requests
+            max_rows (int): number of rows that triggers scoring a batch immediately
+            observe_queue_wait (Optional[Callable[[float], None]]): called with the seconds every
+                request waited in the queue once its batch is scored
+        """
+        self.predict_fn = predict_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_rows = max_rows
+        self.observe_queue_wait = observe_queue_wait
+        self.stats = BatchingStats()
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._closed = False
+
+    def submit(self, data: pd.DataFrame) -> np.ndarray:
+        """Function to score rows as part of the next batch, blocking until done
+
+        Args:
+            data (pd.DataFrame): rows to generate predictions for
+
+        Returns:
+            np.ndarray: predictions for the submitted rows in input order
+        """
+        pending = _PendingRequest(data=data)
+        with self._lock:
+            if self._closed:
+                # late request on a batcher that was closed, e.g. after a model reload
+                return np.asarray(self.predict_fn(data))
+            self._ensure_worker()
+            self._queue.put(pending)
+        pending.done.wait()
+        self.stats.record_latency(time.perf_counter() - pending.enqueued_at)
+        if pending.error is not None:
+            raise pending.error
+        return pending.result  # type: ignore
+
+    def close(self) -> None:
+        """Function to stop the worker thread once the queued requests are served
+
+        Requests submitted afterwards are scored directly without batching.
+        """
+        with self._lock:
+            self._closed = True
+            if self._worker is None or self._worker_pid != os.getpid():
+                return
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def _ensure_worker(self) -> None:
+        # threads do not survive a fork, so (re)start the worker in the current process,
+        # called with the lock held
+        if self._worker_pid != os.getpid():
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def _collect(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        n_rows = len(first.data)
+        deadline = first.enqueued_at + self.max_wait
+        while n_rows < self.max_rows:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if pending is None:
+                # re-queue the shutdown signal so the worker exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(pending)
+            n_rows += len(pending.data)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            if self.observe_queue_wait is not None:
+                started = time.perf_counter()
+                for pending in batch:
+                    self.observe_queue_wait(started - pending.enqueued_at)
+            groups: Dict[frozenset, List[_PendingRequest]] = {}
+            for pending in batch:
+                groups.setdefault(frozenset(pending.data.columns), []).append(pending)
+            for group in groups.values():
+                self._score_group(group)
+            for pending in batch:
+                pending.done.set()
+
+    def _score_group(self, group: List[_PendingRequest]) -> None:
+        # requests with the same columns, scored one by one if the batch fails
+        try:
+            self._score(group)
+            return
+        except Exception as e:
+            if len(group) == 1:
+                logging.exception("Scoring micro-batch failed")
+                group[0].error = e
+                return
+        logging.warning(f"Scoring micro-batch of {len(group)} requests failed, scoring them alone")
+        for pending in group:
+            try:
+                self._score([pending])
+            except Exception as e:
+                pending.error = e
+
+    def _score(self, batch: List[_PendingRequest]) -> None:
+        if len(batch) == 1:
+            data = batch[0].data
+        else:
+            data = pd.concat([pending.data for pending in batch], ignore_index=True)
+
+        predictions = np.asarray(self.predict_fn(data))
+        self.stats.record_batch(len(batch), len(data))
+
+        # hand each request back its own slice of the batch result
+        offset = 0
+        for pending in batch:
+            n_rows = len(pending.data)
+            pending.result = predictions[offset : offset + n_rows]
+            offset += n_rows
@@ -0,0 +1,123 @@
+# in-process cache of per-row predictions for repeated requests
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class PredictionCache:
+    """LRU cache with TTL expiry of the raw model output per feature row.
+
+    Rows are keyed by a stable hash of their values (columns in sorted order, as the Featurizer
+    sees them) together with the column names and the version of the loaded model, so a new
+    model version never serves results of a previous one.
+    """
+
+    def __init__(self, max_entries: int = 100000, ttl_seconds: float = 300) -> None:
+        """Initializes a new instance of PredictionCache.
+
+        Args:
+            max_entries (int): maximum number of cached rows, least recently used are evicted
+            ttl_seconds (float): time after which a cached row is no longer served
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def row_keys(data: pd.DataFrame, model_version: str) -> List[Hashable]:
+        """Function to compute the cache key of every row
+
+        Args:
+            data (pd.DataFrame): feature rows
+            model_version (str): version of the model the rows are scored with
+
+        Returns:
+            List[Hashable]: one key per row
+        """
+        columns = tuple(sorted(data.columns))
+        row_hashes = pd.util.hash_pandas_object(data[list(columns)], index=False).tolist()
+        return [(model_version, columns, row_hash) for row_hash in row_hashes]
+
+    def predict(
+        self, score_fn: Callable[[pd.DataFrame], Any], data: pd.DataFrame, model_version: str
+    ) -> np.ndarray:
+        """Function to score rows, only passing rows without a valid cache entry to the model
+
+        Args:
+            score_fn (Callable[[pd.DataFrame], Any]): vectorized scoring function of the model
+            data (pd.DataFrame): feature rows
+            model_version (str): version of the model behind score_fn
+
+        Returns:
+            np.ndarray: model output for all rows in input order
+        """
+        keys = self.row_keys(data, model_version)
+        now = time.monotonic()
+        cached: Dict[int, Any] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._entries[key]
+                    self.evictions += 1
+                    continue
+                self._entries.move_to_end(key)
+                cached[i] = entry[1]
+            self.hits += len(cached)
+            self.misses += len(keys) - len(cached)
+
+        if len(cached) == len(keys):
+            return np.array([cached[i] for i in range(len(keys))])
+
+        missing = [i for i in range(len(keys)) if i not in cached]
+        scored = np.asarray(score_fn(data.iloc[missing] if cached else data))
+        self._store([keys[i] for i in missing], scored, now + self.ttl_seconds)
+        if not cached:
+            return scored
+
+        result = np.empty((len(keys),) + scored.shape[1:], dtype=scored.dtype)
+        result[missing] = scored
+        for i, value in cached.items():
+            result[i] = value
+        return result
+
+    def _store(self, keys: List[Hashable], values: np.ndarray, expires_at: float) -> None:
+        with self._lock:
+            for key, value in zip(keys, values):
+                # copy rows of 2d outputs so they do not keep the whole batch array alive
+                if isinstance(value, np.ndarray):
+                    value = value.copy()
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        """Function to get the cache counters
+
+        Returns:
+            Dict[str, int]: hits, misses, evictions and current number of entries
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
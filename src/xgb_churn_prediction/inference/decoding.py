@@ -0,0 +1,357 @@
+# decoding of prediction request bodies into dataframes
+import io
+import time
+import zlib
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+
+from xgb_churn_prediction.inference.json_stream import JsonRowParser
+from xgb_churn_prediction.inference.json_stream import columns_to_frame
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd request bodies are optional
+    zstandard = None  # type: ignore
+
+ARROW_STREAM_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+# most bytes a decompressor produces at once, so a small compressed chunk cannot expand in memory
+DECOMPRESS_PIECE_BYTES = 64 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    """Raised for a request body in a content encoding that cannot be decompressed."""
+
+
+class RequestTooLarge(ValueError):
+    """Raised for a request body that is larger than allowed once decompressed."""
+
+
+class Decompressor:
+    """Decompresses a body chunk by chunk, handing on the output in pieces of bounded size.
+
+    A highly compressed chunk is never expanded in memory as a whole: zlib stops after
+    `max_length` bytes and keeps the rest of the input, zstd writes its output through a sink.
+    """
+
+    def __init__(self, encoding: str) -> None:
+        """Initializes a new instance of Decompressor.
+
+        Args:
+            encoding (str): normalized content encoding, gzip, deflate or zstd
+        """
+        self._consume: Callable[[bytes], None] = lambda piece: None
+        self._zlib: Optional[Any] = None
+        self._zstd: Optional[Any] = None
+        if encoding == "zstd":
+            # the writer only calls `write` of its sink
+            self._zstd = zstandard.ZstdDecompressor().stream_writer(
+                self, write_size=DECOMPRESS_PIECE_BYTES, write_return_read=True  # type: ignore
+            )
+        elif encoding == "deflate":
+            self._zlib = zlib.decompressobj()
+        else:
+            self._zlib = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    @property
+    def eof(self) -> bool:
+        """bool: whether the end of the compressed stream has been reached, always True for zstd
+        where a truncated body is caught by the parser instead"""
+        return self._zlib is None or self._zlib.eof
+
+    def decompress(self, chunk: bytes, consume: Callable[[bytes], None]) -> None:
+        """Function to decompress the next chunk of the body
+
+        Args:
+            chunk (bytes): next compressed bytes of the body
+            consume (Callable[[bytes], None]): called with every piece of decompressed output,
+                at most `DECOMPRESS_PIECE_BYTES` long
+        """
+        if self._zstd is not None:
+            self._consume = consume
+            self._zstd.write(chunk)
+            return
+        assert self._zlib is not None
+        while True:
+            piece = self._zlib.decompress(chunk, DECOMPRESS_PIECE_BYTES)
+            if piece:
+                consume(piece)
+            chunk = self._zlib.unconsumed_tail
+            # a full piece may leave more output buffered even once all input is consumed
+            if not chunk and len(piece) < DECOMPRESS_PIECE_BYTES:
+                return
+
+    def write(self, piece: bytes) -> int:
+        """Function called by the zstd stream writer with decompressed output
+
+        Args:
+            piece (bytes): decompressed bytes
+
+        Returns:
+            int: number of bytes consumed
+        """
+        self._consume(piece)
+        return len(piece)
+
+
+def make_decompressor(content_encoding: str) -> Optional[Decompressor]:
+    """Function to create an incremental decompressor for a Content-Encoding header
+
+    Args:
+        content_encoding (str): value of the Content-Encoding header, empty if not given
+
+    Returns:
+        Optional[Decompressor]: decompressor for the body, None for uncompressed bodies
+
+    Raises:
+        UnsupportedEncoding: if the encoding is unknown, or zstd without `zstandard` installed
+    """
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return Decompressor("gzip")
+    if encoding in ("deflate", "zstd"):
+        if encoding == "zstd" and zstandard is None:
+            raise UnsupportedEncoding("zstd request bodies need the zstandard package")
+        return Decompressor(encoding)
+    raise UnsupportedEncoding(f"Unsupported content encoding '{content_encoding}'")
+
+
+def check_content_length(content_length: Optional[int], max_bytes: int) -> None:
+    """Function to reject a body by its Content-Length before it is received
+
+    Args:
+        content_length (Optional[int]): value of the Content-Length header, None if not given
+        max_bytes (int): largest body allowed, 0 for no limit
+
+    Raises:
+        RequestTooLarge: if the body is announced to be larger than `max_bytes`
+    """
+    if max_bytes and content_length is not None and content_length > max_bytes:
+        raise RequestTooLarge(f"Request body exceeds {max_bytes} bytes")
+
+
+def decode_instances(instances: List[dict]) -> pd.DataFrame:
+    """Function to decode the Vertex AI `instances` format (one dict per row)
+
+    Args:
+        instances (List[dict]): list of rows as dicts of column name to value
+
+    Returns:
+        pd.DataFrame: decoded rows
+    """
+    return pd.DataFrame(instances)
+
+
+def decode_columnar(columns: List[str], data: List[list]) -> pd.DataFrame:
+    """Function to decode the columnar format `{"columns": [...], "data": [[...], ...]}`
+
+    Values are transposed straight into one array per column without building a dict per row.
+    Columns are returned sorted, which is the order the Featurizer works in.
+
+    Args:
+        columns (List[str]): column names
+        data (List[list]): rows as lists of values in the order of `columns`
+
+    Returns:
+        pd.DataFrame: decoded rows
+
+    Raises:
+        ValueError: if a row does not have exactly one value per column
+    """
+    n_columns = len(columns)
+    if any(len(row) != n_columns for row in data):
+        raise ValueError(f"Every row in 'data' must have {n_columns} values")
+
+    values = zip(*data) if data else ([] for _ in columns)
+    df = pd.DataFrame(dict(zip(columns, values)), columns=columns)
+    return df[sorted(columns)]
+
+
+def decode_arrow(body: bytes) -> pd.DataFrame:
+    """Function to decode an Arrow IPC stream body
+
+    Args:
+        body (bytes): request body in Arrow IPC streaming format
+
+    Returns:
+        pd.DataFrame: decoded rows with columns sorted
+    """
+    # pyarrow is only needed for Arrow requests
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(io.BytesIO(body)).read_all()
+    table = table.select(sorted(table.column_names))
+    return table.to_pandas()
+
+
+def decode_json(obj: Dict[str, Any]) -> pd.DataFrame:
+    """Function to decode the rows of a parsed JSON request body in either supported format
+
+    Args:
+        obj (Dict[str, Any]): parsed request body with either `instances` or `columns` and `data`
+
+    Returns:
+        pd.DataFrame: decoded rows
+
+    Raises:
+        ValueError: if the body matches none of the supported formats
+    """
+    if "instances" in obj:
+        return decode_instances(obj["instances"])
+    if "columns" in obj and "data" in obj:
+        return decode_columnar(obj["columns"], obj["data"])
+    raise ValueError("Request body needs either 'instances' or 'columns' and 'data'")
+
+
+class RequestDecoder:
+    """Decodes a prediction request body chunk by chunk while it is being received.
+
+    Compressed bodies are decompressed incrementally and JSON bodies are parsed as the chunks
+    arrive, so decoding overlaps with receiving the request. Rows are collected into one list per
+    column instead of holding the raw body, the parsed objects and the dataframe at the same time.
+    The lists hold one Python object per value, about four times the size of a numeric column of
+    the dataframe and close to the size of the raw JSON. Arrow bodies are read as a whole once
+    complete, since reading them is zero-copy.
+    """
+
+    def __init__(
+        self, content_type: str = "", content_encoding: str = "", max_bytes: int = 0
+    ) -> None:
+        """Initializes a new instance of RequestDecoder.
+
+        Args:
+            content_type (str): content type of the request, JSON is assumed unless Arrow is given
+            content_encoding (str): Content-Encoding of the body, gzip, deflate, zstd or none
+            max_bytes (int): largest body allowed after decompression, 0 for no limit
+
+        Raises:
+            UnsupportedEncoding: if the content encoding cannot be decompressed
+        """
+        self.is_arrow = content_type.split(";")[0].strip() == ARROW_STREAM_CONTENT_TYPE
+        self.timings: Dict[str, float] = {"parse": 0.0}
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._decompressor = make_decompressor(content_encoding)
+        self._arrow_chunks: List[bytes] = []
+        self._json = JsonRowParser()
+
+    def feed(self, chunk: bytes) -> None:
+        """Function to decode the next chunk of the request body
+
+        Args:
+            chunk (bytes): next bytes of the body as received
+
+        Raises:
+            RequestTooLarge: if the decompressed body exceeds `max_bytes`
+            ValueError: if the body cannot be decompressed or is not valid JSON
+        """
+        start = time.perf_counter()
+        if self._decompressor is None:
+            self._consume(chunk)
+        else:
+            try:
+                self._decompressor.decompress(chunk, self._consume)
+            except ValueError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Request body cannot be decompressed: {e}") from e
+        self.timings["parse"] += time.perf_counter() - start
+
+    def _consume(self, piece: bytes) -> None:
+        self.n_bytes += len(piece)
+        if self.max_bytes and self.n_bytes > self.max_bytes:
+            raise RequestTooLarge(f"Request body exceeds {self.max_bytes} bytes")
+        if self.is_arrow:
+            self._arrow_chunks.append(piece)
+        elif piece:
+            self._json.feed(piece)
+
+    def finish(self) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Function to build the dataframe once the whole body has been fed
+
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, Any]]: decoded rows and the `parameters` of the request,
+                Arrow bodies carry no parameters
+
+        Raises:
+            ValueError: if the body is truncated or matches none of the supported formats
+        """
+        if self._decompressor is not None and not self._decompressor.eof:
+            raise ValueError("Compressed request body is truncated")
+        start = time.perf_counter()
+        if self.is_arrow:
+            body, self._arrow_chunks = b"".join(self._arrow_chunks), []
+            # reading the Arrow stream is zero-copy, the time goes into the conversion to pandas
+            data = decode_arrow(body)
+            self.timings["dataframe"] = time.perf_counter() - start
+            return data, {}
+
+        parser = self._json
+        parser.close()
+        parsed = time.perf_counter()
+        fields = parser.fields
+        if parser.row_key == "instances":
+            data = columns_to_frame(parser.columns())
+        elif "instances" in fields:
+            data = decode_instances(fields["instances"])
+        elif parser.row_key == "data" and "columns" in fields:
+            data = self._columnar_frame(fields["columns"])
+        else:
+            data = decode_json(fields)
+        self.timings["parse"] += parsed - start
+        self.timings["dataframe"] = time.perf_counter() - parsed
+        return data, fields.get("parameters") or {}
+
+    def _columnar_frame(self, names: List[str]) -> pd.DataFrame:
+        parser = self._json
+        n_columns = len(names)
+        if parser.row_lengths - {n_columns}:
+            raise ValueError(f"Every row in 'data' must have {n_columns} values")
+        if not parser.n_rows:
+            return decode_columnar(names, [])
+        columns = parser.columns()
+        if any(not isinstance(position, int) for position in columns):
+            raise ValueError("Every row in 'data' must be a JSON array")
+        data = columns_to_frame(
+            {names[position]: columns.pop(position) for position in range(n_columns)}
+        )
+        return data[sorted(names)]
+
+
+def decode_request(
+    body: bytes,
+    content_type: str,
+    timings: Optional[Dict[str, float]] = None,
+    content_encoding: str = "",
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Function to decode a complete prediction request body based on its content type
+
+    Args:
+        body (bytes): raw request body
+        content_type (str): content type of the request, JSON is assumed unless Arrow is given
+        timings (Optional[Dict[str, float]]): if given, the seconds spent parsing the body
+            (`parse`) and building the dataframe (`dataframe`) are added to it
+        content_encoding (str): Content-Encoding of the body, gzip, deflate, zstd or none
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, Any]]: decoded rows and the `parameters` of the request,
+            Arrow bodies carry no parameters
+
+    Raises:
+        UnsupportedEncoding: if the content encoding cannot be decompressed
+        ValueError: if the body cannot be decoded
+    """
+    decoder = RequestDecoder(content_type, content_encoding)
+    decoder.feed(body)
+    result = decoder.finish()
+    if timings is not None:
+        timings.update(decoder.timings)
+    return result
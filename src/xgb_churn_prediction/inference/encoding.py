@@ -0,0 +1,124 @@
+# encoding of prediction results into response bodies
+import io
+import json
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+import numpy as np
+
+from xgb_churn_prediction.inference.decoding import ARROW_STREAM_CONTENT_TYPE
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speed up
+    orjson = None  # type: ignore
+
+JSON_CONTENT_TYPE = "application/json"
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+def encode_json(outputs: Dict[str, np.ndarray]) -> bytes:
+    """Function to encode predictions in the Vertex AI response format
+    `{"predictions": [{"label": ...}, ...]}`
+
+    Every output array is converted to Python objects in one vectorized `tolist` call and the
+    result is serialized with orjson if it is installed, otherwise with the standard library.
+
+    Args:
+        outputs (Dict[str, np.ndarray]): output name to one value (or row of values) per row
+
+    Returns:
+        bytes: JSON response body
+    """
+    names = list(outputs)
+    columns = [np.asarray(values).tolist() for values in outputs.values()]
+    output = {"predictions": [dict(zip(names, row)) for row in zip(*columns)]}
+    if orjson is not None:
+        return orjson.dumps(output)
+    return json.dumps(output, separators=(",", ":")).encode()
+
+
+def encode_npy(outputs: Dict[str, np.ndarray]) -> bytes:
+    """Function to encode predictions as a binary NumPy `.npy` array
+
+    A single output is written as a plain array, several outputs as a structured array with
+    one field per output.
+
+    Args:
+        outputs (Dict[str, np.ndarray]): output name to one value (or row of values) per row
+
+    Returns:
+        bytes: `.npy` response body
+    """
+    arrays = {}
+    for name, values in outputs.items():
+        values = np.asarray(values)
+        # object arrays (e.g. string labels) can only be saved without pickle as unicode
+        arrays[name] = values.astype(str) if values.dtype == object else values
+    if len(arrays) == 1:
+        array = next(iter(arrays.values()))
+    else:
+        n_rows = len(next(iter(arrays.values())))
+        dtype = [(name, values.dtype, values.shape[1:]) for name, values in arrays.items()]
+        array = np.empty(n_rows, dtype=dtype)
+        for name, values in arrays.items():
+            array[name] = values
+
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def encode_arrow(outputs: Dict[str, np.ndarray]) -> bytes:
+    """Function to encode predictions as an Arrow IPC stream with one column per output
+
+    Args:
+        outputs (Dict[str, np.ndarray]): output name to one value (or row of values) per row
+
+    Returns:
+        bytes: Arrow IPC stream response body
+    """
+    # pyarrow is only needed for Arrow responses
+    import pyarrow as pa
+
+    columns = {}
+    for name, values in outputs.items():
+        values = np.asarray(values)
+        if values.ndim == 2:
+            # one list of fixed length per row, e.g. the class scores
+            flat = pa.array(np.ascontiguousarray(values).ravel())
+            columns[name] = pa.FixedSizeListArray.from_arrays(flat, values.shape[1])
+        else:
+            columns[name] = pa.array(values)
+    table = pa.table(columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+# response encoders by content type, the first one is the default
+ENCODERS: Dict[str, Callable[[Dict[str, np.ndarray]], bytes]] = {
+    JSON_CONTENT_TYPE: encode_json,
+    NPY_CONTENT_TYPE: encode_npy,
+    ARROW_STREAM_CONTENT_TYPE: encode_arrow,
+}
+
+
+def encode_predictions(outputs: Dict[str, np.ndarray], accept: str) -> Tuple[bytes, str]:
+    """Function to encode predictions with the encoder matching the Accept header
+
+    JSON is used unless the client explicitly asks for one of the binary formats.
+
+    Args:
+        outputs (Dict[str, np.ndarray]): output name to one value (or row of values) per row,
+            see `outputs.make_outputs`
+        accept (str): Accept header of the request
+
+    Returns:
+        Tuple[bytes, str]: response body and its content type
+    """
+    accepted = [media_range.split(";")[0].strip() for media_range in accept.split(",")]
+    content_type = next((ct for ct in accepted if ct in ENCODERS), JSON_CONTENT_TYPE)
+    return ENCODERS[content_type](outputs), content_type
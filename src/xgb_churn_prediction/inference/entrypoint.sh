@@ -3,4 +3,8 @@
 # shell script to execute as an entrypoint when base image is used as model serving image
 # this is only used if image is used as a serving image when uploading a model to the registry
 # doco: https://cloud.google.com/vertex-ai/docs/predictions/custom-container-requirements#server
+# set SERVING_MODE=asgi to serve the async ASGI app (asgi.py) instead of the Flask app (app.py)
+if [ "${SERVING_MODE}" = "asgi" ]; then
+    exec gunicorn -c app.gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+fi
 exec gunicorn -c app.gunicorn.conf.py app:app
@@ -0,0 +1,314 @@
+# incremental parsing of JSON request bodies into columns while they are received
+import codecs
+import json
+import re
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Set
+
+import pandas as pd
+
+# value of columns missing in a row, like pd.DataFrame fills them for a list of dicts
+_MISSING = float("nan")
+
+# top-level keys whose arrays are parsed row by row instead of as a whole
+ROW_KEYS = ("instances", "data")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_KEY = re.compile(r'"((?:[^"\\]|\\.)*)"[ \t\n\r]*:')
+# characters changing the nesting or string state of a value, outside and inside of strings
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# characters ending a number, true, false or null
+_SCALAR_END = re.compile(r"[,\]} \t\n\r]")
+
+# parser states, named after what is expected next
+(
+    _START,
+    _KEY_OR_END,
+    _KEY_STATE,
+    _VALUE,
+    _ROW_OR_END,
+    _ROW,
+    _ROW_SEPARATOR,
+    _AFTER_VALUE,
+    _END,
+) = range(9)
+
+
+class JsonRowParser:
+    """Parses a JSON request body fed in chunks, collecting the rows into columns.
+
+    The body must be a JSON object. Rows of its `instances` or `data` array are decoded one at a
+    time as soon as they are complete and their values appended to one list per column, so
+    neither the raw body nor a list of row dicts is ever held in memory. All other top-level
+    values, e.g. `columns` and `parameters`, are decoded as a whole.
+
+    A value split across chunks is not re-parsed with every chunk. Its nesting depth and string
+    state are tracked while the chunks are scanned and it is decoded once its end has arrived,
+    so parsing takes linear time however the body is chunked.
+    """
+
+    def __init__(self) -> None:
+        """Initializes a new instance of JsonRowParser."""
+        self.fields: Dict[str, Any] = {}
+        self.row_key: Optional[str] = None
+        self.n_rows = 0
+        self.row_lengths: Set[int] = set()
+        self._columns: Dict[Hashable, List[Any]] = {}
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._key = ""
+        # parts of a value spanning chunks, None if no value is pending, and its scan state
+        self._pending: Optional[List[str]] = None
+        self._complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._scalar = False
+
+    def feed(self, chunk: bytes) -> None:
+        """Function to parse the next chunk of the body
+
+        Args:
+            chunk (bytes): next bytes of the (decompressed) body
+
+        Raises:
+            ValueError: if the body is not valid JSON or has an unexpected structure
+        """
+        text = self._text.decode(chunk)
+        if self._pending is not None:
+            end = self._scan(text, 0)
+            if end is None:
+                self._pending.append(text)
+                return
+            # the value is complete, decode it from the joined parts and go on after it
+            self._pending.append(text)
+            self._buffer, self._pending = "".join(self._pending), None
+            self._complete = True
+        else:
+            self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        self._parse(final=False)
+
+    def close(self) -> None:
+        """Function to parse the rest of the body once it has been received completely
+
+        Raises:
+            ValueError: if the body is incomplete, not valid JSON or has an unexpected structure
+        """
+        text = self._text.decode(b"", final=True)
+        if self._pending is not None:
+            # a number at the very end, anything else is truncated and fails to decode
+            self._pending.append(text)
+            self._buffer, self._pending = "".join(self._pending), None
+        else:
+            self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        self._parse(final=True)
+        if self._state != _END:
+            raise ValueError("Request body is not a complete JSON object")
+
+    def columns(self) -> Dict[Hashable, List[Any]]:
+        """Function to hand over the collected columns, the parser keeps no reference to them
+
+        Returns:
+            Dict[Hashable, List[Any]]: values by column name for object rows or by position for
+                array rows, in order of first appearance
+        """
+        columns, self._columns = self._columns, {}
+        return columns
+
+    def _parse(self, final: bool) -> None:
+        buffer = self._buffer
+        while True:
+            pos = _WHITESPACE.match(buffer, self._pos).end()  # type: ignore
+            self._pos = pos
+            if pos == len(buffer):
+                return
+            char = buffer[pos]
+
+            if self._state == _START:
+                if char != "{":
+                    raise ValueError("Request body must be a JSON object")
+                self._pos += 1
+                self._state = _KEY_OR_END
+            elif self._state in (_KEY_OR_END, _KEY_STATE):
+                if char == "}" and self._state == _KEY_OR_END:
+                    self._pos += 1
+                    self._state = _END
+                    continue
+                match = _KEY.match(buffer, pos)
+                if match is None:
+                    if final or char != '"':
+                        raise ValueError(f"Expected a key in the request body at char {pos}")
+                    return
+                self._key = json.loads(f'"{match.group(1)}"')
+                self._pos = match.end()
+                self._state = _VALUE
+            elif self._state == _VALUE:
+                if self._key in ROW_KEYS and char == "[" and self.row_key is None:
+                    self.row_key = self._key
+                    self._pos += 1
+                    self._state = _ROW_OR_END
+                    continue
+                value = self._decode(final)
+                if value is _INCOMPLETE:
+                    return
+                self.fields[self._key] = value
+                self._state = _AFTER_VALUE
+            elif self._state in (_ROW_OR_END, _ROW):
+                if char == "]" and self._state == _ROW_OR_END:
+                    self._pos += 1
+                    self._state = _AFTER_VALUE
+                    continue
+                row = self._decode(final)
+                if row is _INCOMPLETE:
+                    return
+                self._add_row(row)
+                self._state = _ROW_SEPARATOR
+            elif self._state == _ROW_SEPARATOR:
+                if char == ",":
+                    self._state = _ROW
+                elif char == "]":
+                    self._state = _AFTER_VALUE
+                else:
+                    raise ValueError(f"Expected ',' or ']' in the request body at char {pos}")
+                self._pos += 1
+            elif self._state == _AFTER_VALUE:
+                if char == ",":
+                    self._pos += 1
+                    self._state = _KEY_STATE
+                elif char == "}":
+                    self._pos += 1
+                    self._state = _END
+                else:
+                    raise ValueError(f"Expected ',' or '}}' in the request body at char {pos}")
+            else:
+                raise ValueError(f"Unexpected data after the JSON object at char {pos}")
+
+    def _decode(self, final: bool) -> Any:
+        buffer, start = self._buffer, self._pos
+        if self._complete:
+            # the end of the value is known to be in the buffer, see `feed`
+            self._complete = False
+            value, self._pos = self._decoder.raw_decode(buffer, start)
+            return value
+        try:
+            value, end = self._decoder.raw_decode(buffer, start)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            self._start_scan(buffer[start])
+            if self._scan(buffer, start) is not None:
+                # the value ends within the buffer, so it is invalid rather than incomplete
+                raise
+        else:
+            # a number is only complete once a delimiter follows it, e.g. `12.` may continue
+            # with `5` in the next chunk, where the decoder stops before the `.`
+            if final or buffer[start] in '{["' or _SCALAR_END.search(buffer, start) is not None:
+                self._pos = end
+                return value
+            self._start_scan(buffer[start])
+        # keep the value until its end arrives, the buffer is scanned only this once
+        self._pending = [buffer[start:]]
+        self._buffer = ""
+        self._pos = 0
+        return _INCOMPLETE
+
+    def _start_scan(self, first: str) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._scalar = first not in '{["'
+
+    def _scan(self, text: str, pos: int) -> Optional[int]:
+        # position after the end of the pending value in text, None if it does not end in it
+        if self._scalar:
+            match = _SCALAR_END.search(text, pos)
+            return None if match is None else match.start()
+        while True:
+            if self._escape:
+                if pos == len(text):
+                    return None
+                self._escape = False
+                pos += 1
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                    continue
+                self._in_string = False
+                if self._depth == 0:
+                    return pos
+                continue
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                return None
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth <= 0:
+                    return pos
+
+    def _add_row(self, row: Any) -> None:
+        if isinstance(row, dict):
+            items: Any = row.items()
+        elif isinstance(row, list):
+            items = enumerate(row)
+        else:
+            raise ValueError(f"Every row in '{self.row_key}' must be a JSON object or array")
+        columns = self._columns
+        n_rows = self.n_rows
+        for key, value in items:
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [_MISSING] * n_rows
+            column.append(value)
+        self.n_rows = n_rows + 1
+        self.row_lengths.add(len(row))
+        if len(row) != len(columns):
+            # fill columns missing in this row, like pd.DataFrame does for a list of dicts
+            for column in columns.values():
+                if len(column) == n_rows:
+                    column.append(_MISSING)
+
+
+class _Incomplete:
+    pass
+
+
+_INCOMPLETE = _Incomplete()
+
+
+def columns_to_frame(columns: Dict[Hashable, List[Any]]) -> pd.DataFrame:
+    """Function to build a dataframe from lists of values per column
+
+    Every list is released as soon as its column has been converted, so only one column exists
+    twice at any time.
+
+    Args:
+        columns (Dict[Hashable, List[Any]]): values by column name, emptied by this function
+
+    Returns:
+        pd.DataFrame: dataframe with one column per list, dtypes inferred like pd.DataFrame does
+    """
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    arrays = {}
+    for name in list(columns):
+        arrays[name] = pd.Series(columns.pop(name), dtype=None if n_rows else object)
+    return pd.DataFrame(arrays, copy=False)
@@ -0,0 +1,128 @@
+# loading of the model artifact served by the inference containers
+import os
+import pickle
+from typing import Any
+from typing import Optional
+
+import google.cloud.storage as storage
+from google.api_core.exceptions import NotFound
+
+from xgb_churn_prediction.clients import storage_client
+from xgb_churn_prediction.model.artifact import BLOB_TYPE
+from xgb_churn_prediction.model.artifact import MANIFEST_TYPE
+from xgb_churn_prediction.model.artifact import decompress_artifact
+from xgb_churn_prediction.model.artifact import load_artifact
+from xgb_churn_prediction.model.artifact import verify_artifact
+from xgb_churn_prediction.model.compression import decompress_bytes
+from xgb_churn_prediction.model.compression import decompressed_reader
+from xgb_churn_prediction.model.download import download_blob
+from xgb_churn_prediction.model.download import download_blob_bytes
+from xgb_churn_prediction.model.model_cache import ModelCache
+from xgb_churn_prediction.model.model_cache import cache_key
+
+MODEL_FILE_NAME = "model.pkl"
+
+# artifact saved as manifest and memory-mappable array blobs, preferred over the pickle
+MODEL_ARTIFACT_NAME = "model"
+MANIFEST_FILE_NAME = f"{MODEL_ARTIFACT_NAME}.{MANIFEST_TYPE}"
+BLOB_FILE_NAME = f"{MODEL_ARTIFACT_NAME}.{BLOB_TYPE}"
+
+
+def download_model(
+    model_gcs_uri: str, compiled: bool = True, cache: Optional[ModelCache] = None
+) -> Any:
+    """Function to load model from gcs uri
+
+    An artifact (manifest and array blobs) is loaded with its node arrays memory-mapped, so
+    loading takes no time for deserialization. It is downloaded into the local model cache,
+    keyed by the generation of its manifest, so all workers of a container, and all reloads of
+    the same generation, map the same file and share its pages instead of each downloading its
+    own copy. Models saved as pickle are unpickled. Compressed models are detected and
+    decompressed. The blob file of an artifact is checked against the checksum in its manifest
+    before it is cached, so e.g. a download overlapping with an upload fails instead of mixing
+    two versions.
+
+    Args:
+        model_gcs_uri (str): gcs uri of the directory containing the model artifact,
+            i.e. AIP_STORAGE_URI. A local directory can be given for local testing.
+        compiled (bool): whether to load the forest of an artifact as CompiledForest instead of
+            RandomForestClassifier
+        cache (Optional[ModelCache]): local cache of downloaded artifacts, see ModelCache for
+            the default location and size limit
+
+    Returns:
+        object: The deserialized Python object, which is of the same type as the
+        original pickled object.
+
+    Raises:
+        ValueError: if the downloaded blob file does not match the manifest of the artifact
+    """
+    if not model_gcs_uri.startswith("gs://"):
+        if os.path.exists(f"{model_gcs_uri}/{MANIFEST_FILE_NAME}"):
+            return load_artifact(
+                f"{model_gcs_uri}/{MODEL_ARTIFACT_NAME}", compiled=compiled, verify_checksum=True
+            )
+        with open(f"{model_gcs_uri}/{MODEL_FILE_NAME}", "rb") as file:
+            return pickle.load(decompressed_reader(file))
+
+    bucket_name, prefix = model_gcs_uri[len("gs://") :].rstrip("/").split("/", 1)
+    bucket = storage_client().bucket(bucket_name)
+    manifest = bucket.get_blob(f"{prefix}/{MANIFEST_FILE_NAME}")
+    if manifest is not None:
+        cache = cache if cache is not None else ModelCache()
+        key = cache_key(model_gcs_uri, manifest.name, str(manifest.generation))
+        path = cache.get(key)
+        if path is None:
+
+            def download(directory: str) -> None:
+                # the array blobs are fetched in concurrent byte ranges straight into the file
+                # that is memory-mapped afterwards
+                download_blob(
+                    bucket.blob(f"{prefix}/{BLOB_FILE_NAME}"), f"{directory}/{BLOB_FILE_NAME}"
+                )
+                download_blob(manifest, f"{directory}/{MANIFEST_FILE_NAME}")
+                # compressed blobs are decompressed once, so they can still be memory-mapped
+                decompress_artifact(f"{directory}/{MODEL_ARTIFACT_NAME}")
+                verify_artifact(f"{directory}/{MODEL_ARTIFACT_NAME}")
+
+            path = cache.put(key, download)
+        # artifacts are verified before they are cached, mapped arrays stay valid if the entry
+        # is evicted later on
+        return load_artifact(
+            f"{path}/{MODEL_ARTIFACT_NAME}", compiled=compiled, verify_checksum=False
+        )
+
+    blob = bucket.get_blob(f"{prefix}/{MODEL_FILE_NAME}")
+    if blob is None:
+        raise FileNotFoundError(f"No model artifact found at {model_gcs_uri}")
+    return pickle.loads(decompress_bytes(download_blob_bytes(blob)))
+
+
+def model_generation(model_gcs_uri: str) -> str:
+    """Function to get the generation of the model artifact, which changes on every upload
+
+    The manifest of an artifact is written last, its generation versions the whole artifact.
+
+    Args:
+        model_gcs_uri (str): gcs uri of the directory containing the model artifact,
+            or a local directory for local testing
+
+    Returns:
+        str: object generation on gcs, modification time for local files
+    """
+    if not model_gcs_uri.startswith("gs://"):
+        path = f"{model_gcs_uri}/{MANIFEST_FILE_NAME}"
+        if not os.path.exists(path):
+            path = f"{model_gcs_uri}/{MODEL_FILE_NAME}"
+        return str(os.stat(path).st_mtime_ns)
+
+    client = storage_client()
+    manifest = storage.Blob.from_string(f"{model_gcs_uri}/{MANIFEST_FILE_NAME}", client=client)
+    try:
+        manifest.reload()
+        return str(manifest.generation)
+    except NotFound:
+        pass
+    blob = storage.Blob.from_string(f"{model_gcs_uri}/{MODEL_FILE_NAME}", client=client)
+    blob.reload()
+    return str(blob.generation)
@@ -0,0 +1,193 @@
+# request metrics of the inference app in the Prometheus text exposition format
+import os
+import time
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Mapping
+
+import pandas as pd
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# directory the metrics of all gunicorn workers are written to, set by app.gunicorn.conf.py,
+# without it every process only exposes its own metrics
+MULTIPROC_DIR_VARIABLE = "PROMETHEUS_MULTIPROC_DIR"
+
+# bucket upper bounds in seconds, from 50us to 10s
+DURATION_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    10.0,
+)
+ROWS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class _ScrapeTimeCollector:
+    """Exposes values computed at scrape time as gauges, e.g. micro-batching stats."""
+
+    def __init__(
+        self, collects: List[Callable[[], Mapping[str, Mapping[str, Any]]]], worker: str = ""
+    ) -> None:
+        self._collects = collects
+        self._worker = worker
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        label_names = ["worker"] if self._worker else []
+        label_values = [self._worker] if self._worker else []
+        for collect in self._collects:
+            for group, values in collect().items():
+                for name, value in values.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauge = GaugeMetricFamily(
+                            f"inference_{group}_{name}", f"{group} {name}", labels=label_names
+                        )
+                        gauge.add_metric(label_values, value)
+                        yield gauge
+
+
+class ServingMetrics:
+    """Metrics of a serving worker, exposed on the metrics route for Prometheus to scrape.
+
+    If `PROMETHEUS_MULTIPROC_DIR` is set, as app.gunicorn.conf.py does, every gunicorn worker
+    writes its metrics to files in that directory and a scrape answered by any worker returns
+    the sum over all workers, incl. workers that were recycled, so counters stay monotonic.
+    Values computed at scrape time by collectors only cover the answering worker and are
+    labelled with its pid.
+    """
+
+    def __init__(self) -> None:
+        """Initializes a new instance of ServingMetrics with the metrics of the inference app."""
+        self.registry = CollectorRegistry()
+        self.request_bytes = Histogram(
+            "inference_request_bytes",
+            "Size of prediction request bodies",
+            buckets=BYTES_BUCKETS,
+            registry=self.registry,
+        )
+        self.request_rows = Histogram(
+            "inference_request_rows",
+            "Number of rows per prediction request",
+            buckets=ROWS_BUCKETS,
+            registry=self.registry,
+        )
+        self.stage_seconds = Histogram(
+            "inference_stage_duration_seconds",
+            "Time spent per stage of a prediction request",
+            ["stage"],
+            buckets=DURATION_BUCKETS,
+            registry=self.registry,
+        )
+        self.pipeline_step_seconds = Histogram(
+            "inference_pipeline_step_duration_seconds",
+            "Time spent per step of the sklearn Pipeline, the last step is the estimator",
+            ["step"],
+            buckets=DURATION_BUCKETS,
+            registry=self.registry,
+        )
+        self.queue_wait_seconds = Histogram(
+            "inference_queue_wait_seconds",
+            "Time requests wait before their prediction starts",
+            ["queue"],
+            buckets=DURATION_BUCKETS,
+            registry=self.registry,
+        )
+        self.errors = Counter(
+            "inference_errors",
+            "Failed requests by exception type",
+            ["exception"],
+            registry=self.registry,
+        )
+        self.rejections = Counter(
+            "inference_rejections",
+            "Requests shed by admission control by reason",
+            ["reason"],
+            registry=self.registry,
+        )
+        self._collects: List[Callable[[], Mapping[str, Mapping[str, Any]]]] = []
+        self.registry.register(_ScrapeTimeCollector(self._collects))
+
+    def add_collector(self, collect: Callable[[], Mapping[str, Mapping[str, Any]]]) -> None:
+        """Function to export gauges computed at scrape time, e.g. micro-batching stats
+
+        Args:
+            collect (Callable[[], Mapping[str, Mapping[str, Any]]]): function returning numeric
+                values by name per group, exposed as `inference_<group>_<name>` gauges
+        """
+        self._collects.append(collect)
+
+    def instrument(self, model: Any, score_fn: Callable[[pd.DataFrame], Any]) -> Callable:
+        """Function to time every step of a Pipeline when scoring it
+
+        The Pipeline is scored step by step the way `Pipeline.predict_proba` and
+        `Pipeline.predict` do it, with the time of every step recorded.
+
+        Args:
+            model (Any): fitted model or sklearn Pipeline
+            score_fn (Callable[[pd.DataFrame], Any]): bound scoring method of the model,
+                see `outputs.prediction_function`
+
+        Returns:
+            Callable: scoring function with the same output as score_fn
+        """
+        steps = getattr(model, "steps", None)
+        if not steps:
+            return score_fn
+        method_name = score_fn.__name__
+        transformers = [
+            (name, step) for name, step in steps[:-1] if step not in (None, "passthrough")
+        ]
+        estimator_name, estimator = steps[-1]
+        estimator_method = getattr(estimator, method_name)
+        observe_steps = [
+            (step, self.pipeline_step_seconds.labels(name).observe) for name, step in transformers
+        ]
+        observe_estimator = self.pipeline_step_seconds.labels(estimator_name).observe
+
+        def timed_score(data: pd.DataFrame) -> Any:
+            Xt = data
+            for step, observe in observe_steps:
+                start = time.perf_counter()
+                Xt = step.transform(Xt)
+                observe(time.perf_counter() - start)
+            start = time.perf_counter()
+            result = estimator_method(Xt)
+            observe_estimator(time.perf_counter() - start)
+            return result
+
+        return timed_score
+
+    def expose(self) -> str:
+        """Function to render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: exposition of all metrics, of all workers if `PROMETHEUS_MULTIPROC_DIR` is set
+        """
+        registry = self.registry
+        if os.environ.get(MULTIPROC_DIR_VARIABLE):
+            # the metrics of all workers are read from their files instead of this registry
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(_ScrapeTimeCollector(self._collects, str(os.getpid())))
+        return generate_latest(registry).decode()
@@ -0,0 +1,419 @@
+# the models served by a worker, their hot reload and routing of requests to model versions
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from xgb_churn_prediction.inference.batching import MicroBatcher
+from xgb_churn_prediction.inference.cache import PredictionCache
+from xgb_churn_prediction.inference.loading import download_model
+from xgb_churn_prediction.inference.loading import model_generation
+from xgb_churn_prediction.inference.metrics import ServingMetrics
+from xgb_churn_prediction.inference.outputs import OutputOptions
+from xgb_churn_prediction.inference.outputs import make_outputs
+from xgb_churn_prediction.inference.outputs import prediction_function
+from xgb_churn_prediction.inference.warmup import warm_up
+from xgb_churn_prediction.model.compiled_forest import MAX_COMPILED_ROWS
+from xgb_churn_prediction.model.compiled_forest import CompiledForest
+from xgb_churn_prediction.model.compiled_forest import compile_pipeline
+from xgb_churn_prediction.model.compiled_forest import forest_nbytes
+
+DEFAULT_VERSION = "default"
+# header and query parameter selecting the model version of a request
+MODEL_VERSION_HEADER = "X-Model-Version"
+MODEL_VERSION_PARAMETER = "model_version"
+
+
+@dataclass
+class LoadedModel:
+    """A model loaded into the serving process together with everything derived from it.
+
+    Attributes:
+        model (Any): fitted model or sklearn Pipeline
+        version (str): identifies the artifact the model was loaded from
+        batching_max_wait_ms (float): micro-batching window, 0 to disable micro-batching
+        batching_max_rows (int): number of rows that triggers scoring a micro-batch
+        metrics (Optional[ServingMetrics]): metrics to record pipeline step and queue times in
+    """
+
+    model: Any
+    version: str
+    batching_max_wait_ms: float = 0
+    batching_max_rows: int = 1024
+    metrics: Optional[ServingMetrics] = None
+    score_fn: Callable[[pd.DataFrame], Any] = field(init=False)
+    classes: Optional[np.ndarray] = field(init=False)
+    batcher: Optional[MicroBatcher] = field(init=False)
+    nbytes: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.nbytes = model_nbytes(self.model)
+        # single vectorized call per request, labels and class scores are derived from its output
+        self.score_fn, self.classes = prediction_function(self.model)
+        observe_queue_wait: Optional[Callable[[float], None]] = None
+        if self.metrics is not None:
+            self.score_fn = self.metrics.instrument(self.model, self.score_fn)
+            observe_queue_wait = self.metrics.queue_wait_seconds.labels("batcher").observe
+        self.batcher = (
+            MicroBatcher(
+                self.score_fn,
+                max_wait_ms=self.batching_max_wait_ms,
+                max_rows=self.batching_max_rows,
+                observe_queue_wait=observe_queue_wait,
+            )
+            if self.batching_max_wait_ms > 0
+            else None
+        )
+
+    def score(self, data: pd.DataFrame) -> np.ndarray:
+        """Function to score rows with the model, as part of a micro-batch if enabled
+
+        Args:
+            data (pd.DataFrame): rows to score
+
+        Returns:
+            np.ndarray: raw model output, see `outputs.prediction_function`
+        """
+        if self.batcher is not None:
+            return self.batcher.submit(data)
+        return self.score_fn(data)
+
+    def predict(
+        self,
+        data: pd.DataFrame,
+        options: OutputOptions,
+        cache: Optional[PredictionCache] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Function to generate the requested outputs for a prediction request
+
+        Args:
+            data (pd.DataFrame): rows to predict
+            options (OutputOptions): requested outputs
+            cache (Optional[PredictionCache]): prediction cache to serve repeated rows from
+
+        Returns:
+            Dict[str, np.ndarray]: outputs per row, see `outputs.make_outputs`
+        """
+        if cache is not None:
+            raw = cache.predict(self.score, data, model_version=self.version)
+        else:
+            raw = self.score(data)
+        return make_outputs(raw, self.classes, options)
+
+    def warm_up(self, sizes: Sequence[int]) -> bool:
+        """Function to run synthetic batches through the model, see `warmup.warm_up`"""
+        # score without instrumentation so warm-up does not show up in the request metrics
+        score_fn, _ = prediction_function(self.model)
+        return warm_up(self.model, score_fn, sizes)
+
+    def close(self) -> None:
+        """Function to release the micro-batching thread once queued requests are served"""
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+def model_nbytes(model: Any) -> int:
+    """Function to estimate the memory a loaded model takes up
+
+    Forests are measured by their node arrays, other models by the numpy arrays among their
+    attributes, e.g. the fitted parameters of sklearn transformers. Nothing is copied or
+    serialized, so this is cheap even for large models.
+
+    Args:
+        model (Any): fitted model or sklearn Pipeline
+
+    Returns:
+        int: estimated size in bytes
+    """
+    steps = getattr(model, "steps", None)
+    if steps:
+        return sum(model_nbytes(step) for _, step in steps)
+    if isinstance(model, CompiledForest):
+        return model.nbytes
+    nbytes = forest_nbytes(model)
+    if nbytes:
+        return nbytes
+    for value in getattr(model, "__dict__", {}).values():
+        if isinstance(value, (list, tuple)):
+            nbytes += sum(item.nbytes for item in value if isinstance(item, np.ndarray))
+        elif isinstance(value, np.ndarray):
+            nbytes += value.nbytes
+    return nbytes
+
+
+def load_model(
+    model_gcs_uri: str,
+    compile_model: bool = True,
+    max_compiled_rows: Optional[int] = MAX_COMPILED_ROWS,
+    **kwargs: Any,
+) -> LoadedModel:
+    """Function to download the model artifact and prepare it for serving
+
+    Args:
+        model_gcs_uri (str): gcs uri of the directory containing the model artifact
+        compile_model (bool): whether to serve the forest with the compiled inference engine,
+            see `compiled_forest.compile_pipeline`
+        max_compiled_rows (Optional[int]): number of rows per call up to which the compiled
+            engine scores, larger calls are scored by sklearn, the engine scores all calls if None
+        **kwargs (Any): micro-batching settings and metrics passed on to LoadedModel
+
+    Returns:
+        LoadedModel: loaded model, versioned by the generation of the artifact
+    """
+    # read the generation first, so an upload during the download is picked up by the next poll
+    generation = model_generation(model_gcs_uri)
+    model = download_model(model_gcs_uri, compiled=compile_model)
+    if compile_model:
+        model = compile_pipeline(model, max_compiled_rows=max_compiled_rows)
+    return LoadedModel(model=model, version=f"{model_gcs_uri}#{generation}", **kwargs)
+
+
+class ModelWatcher:
+    """Keeps the served model up to date with the artifact on GCS.
+
+    A background thread first warms up the model loaded at startup, the worker reports ready
+    only once that has finished. It then polls the generation of the model artifact. When it
+    changes, the new artifact is loaded and warmed up off the request path and then swapped in
+    with a single reference assignment. Requests hold on to the LoadedModel they started with,
+    so in-flight requests finish on the old model.
+    """
+
+    def __init__(
+        self,
+        model_gcs_uri: str,
+        current: LoadedModel,
+        load_fn: Callable[[], LoadedModel],
+        interval_seconds: float = 60,
+        warm_up_sizes: Sequence[int] = (1,),
+    ) -> None:
+        """Initializes a new instance of ModelWatcher.
+
+        Args:
+            model_gcs_uri (str): gcs uri of the directory containing the model artifact
+            current (LoadedModel): model currently served
+            load_fn (Callable[[], LoadedModel]): function loading the latest artifact
+            interval_seconds (float): time between two generation checks, 0 disables reloading
+            warm_up_sizes (Sequence[int]): number of rows of the synthetic warm-up batches,
+                empty to skip warm-up
+        """
+        self.model_gcs_uri = model_gcs_uri
+        self.current = current
+        self.load_fn = load_fn
+        self.interval_seconds = interval_seconds
+        self.warm_up_sizes = tuple(warm_up_sizes)
+        self._lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+        self._ready_pid: Optional[int] = None
+
+    @property
+    def ready(self) -> bool:
+        """bool: whether the model has been warmed up in the current process"""
+        return self._ready_pid == os.getpid()
+
+    def ensure_running(self) -> None:
+        """Function to start the watcher thread in the current process if it is not running
+
+        Threads do not survive a fork and warm-up should happen in the process serving the
+        requests, so this is called on requests rather than at import time.
+        """
+        if self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid != os.getpid():
+                thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+                thread.start()
+                self._watcher_pid = os.getpid()
+
+    def check(self) -> bool:
+        """Function to reload the model if its artifact has a new generation
+
+        Returns:
+            bool: True if a new model was swapped in
+        """
+        generation = model_generation(self.model_gcs_uri)
+        if self.current.version == f"{self.model_gcs_uri}#{generation}":
+            return False
+
+        start = time.perf_counter()
+        new = self.load_fn()
+        new.warm_up(self.warm_up_sizes)
+        old, self.current = self.current, new
+        old.close()
+        logging.info(
+            f"Swapped in model {new.version} (was {old.version}) "
+            f"after {time.perf_counter() - start:.1f}s"
+        )
+        return True
+
+    def warm_up(self) -> None:
+        """Function to warm up the current model and mark the current process as ready"""
+        start = time.perf_counter()
+        try:
+            self.current.warm_up(self.warm_up_sizes)
+        except Exception:
+            # a failing warm-up must not keep the worker from serving
+            logging.exception("Warm-up of the model failed")
+        logging.info(f"Model ready after {time.perf_counter() - start:.3f}s of warm-up")
+        self._ready_pid = os.getpid()
+
+    def _run(self) -> None:
+        self.warm_up()
+        if self.interval_seconds <= 0:
+            return
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                self.check()
+            except Exception:
+                logging.exception("Checking for a new model version failed")
+
+
+def parse_model_versions(value: str) -> Dict[str, str]:
+    """Function to parse the model versions to serve next to the default model
+
+    Args:
+        value (str): comma separated `name=gcs uri` pairs, e.g. from MODEL_VERSIONS
+
+    Returns:
+        Dict[str, str]: gcs uri of the model artifact by version name
+
+    Raises:
+        ValueError: if a pair is malformed or uses the name of the default model
+    """
+    versions = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        name, sep, uri = pair.partition("=")
+        if not sep or not name or not uri or name == DEFAULT_VERSION:
+            raise ValueError(f"Invalid model version '{pair}', expected name=uri")
+        versions[name.strip()] = uri.strip()
+    return versions
+
+
+class ModelRouter:
+    """Routes requests to the default model or to one of several other model versions.
+
+    The default model is the one served from AIP_STORAGE_URI and kept up to date by the watcher.
+    Other versions are loaded on their first request and kept in memory as long as the total
+    estimated size of all loaded models stays within the memory limit; beyond that the least
+    recently used versions are evicted. The default model is never evicted.
+
+    A version is loaded while holding a lock of its own, so requests to other versions are not
+    held up by the load and concurrent first requests to the same version load it only once.
+    """
+
+    def __init__(
+        self,
+        watcher: ModelWatcher,
+        versions: Dict[str, str],
+        load_fn: Callable[[str], LoadedModel],
+        memory_limit_bytes: Optional[int] = None,
+    ) -> None:
+        """Initializes a new instance of ModelRouter.
+
+        Args:
+            watcher (ModelWatcher): watcher of the default model
+            versions (Dict[str, str]): gcs uri of the model artifact by version name
+            load_fn (Callable[[str], LoadedModel]): function loading the model from a gcs uri
+            memory_limit_bytes (Optional[int]): limit of the estimated size of all loaded
+                models, None for no limit
+        """
+        self.watcher = watcher
+        self.versions = versions
+        self.load_fn = load_fn
+        self.memory_limit_bytes = memory_limit_bytes
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {name: threading.Lock() for name in versions}
+        self._lock = threading.Lock()
+
+    def get(self, version: Optional[str] = None) -> LoadedModel:
+        """Function to get the model of a version, loading it if it is not in memory
+
+        Args:
+            version (Optional[str]): version name, None or `default` for the default model
+
+        Returns:
+            LoadedModel: model to serve the request with
+
+        Raises:
+            KeyError: if the version is not configured
+        """
+        if not version or version == DEFAULT_VERSION:
+            return self.watcher.current
+        if version not in self.versions:
+            raise KeyError(f"Unknown model version '{version}'")
+
+        loaded = self._lookup(version)
+        if loaded is not None:
+            return loaded
+        with self._loading[version]:
+            # another request may have loaded the version while this one waited for the lock
+            loaded = self._lookup(version)
+            if loaded is not None:
+                return loaded
+            start = time.perf_counter()
+            loaded = self.load_fn(self.versions[version])
+            logging.info(
+                f"Loaded model version {version} ({loaded.nbytes / 2**20:.1f} MiB) "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+            with self._lock:
+                self._loaded[version] = loaded
+                evicted = self._evict()
+        for model in evicted:
+            model.close()
+        return loaded
+
+    def _lookup(self, version: str) -> Optional[LoadedModel]:
+        with self._lock:
+            loaded = self._loaded.get(version)
+            if loaded is not None:
+                self._loaded.move_to_end(version)
+            return loaded
+
+    def _evict(self) -> List[LoadedModel]:
+        # called with the lock held, the evicted models are closed by the caller after releasing it
+        if self.memory_limit_bytes is None:
+            return []
+        evicted: Dict[str, LoadedModel] = {}
+        # the most recently used version is kept even if it exceeds the limit on its own
+        while len(self._loaded) > 1 and self.nbytes() > self.memory_limit_bytes:
+            version, loaded = self._loaded.popitem(last=False)
+            evicted[version] = loaded
+        if evicted:
+            self.evictions += len(evicted)
+            logging.info(f"Evicted model versions {list(evicted)} to stay within the memory limit")
+        return list(evicted.values())
+
+    def nbytes(self) -> int:
+        """Function to get the estimated size of all loaded models incl. the default model
+
+        Returns:
+            int: estimated size in bytes
+        """
+        return self.watcher.current.nbytes + sum(m.nbytes for m in self._loaded.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Function to get the loaded versions and memory counters
+
+        Returns:
+            Dict[str, Any]: loaded versions, estimated bytes and number of evictions
+        """
+        with self._lock:
+            return {
+                "loaded_versions": len(self._loaded),
+                "loaded_bytes": self.nbytes(),
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,120 @@
+# prediction outputs (labels, class scores, top-k) requested via request parameters
+from dataclasses import dataclass
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+OUTPUT_LABEL = "label"
+OUTPUT_PROBA = "proba"
+
+
+@dataclass
+class OutputOptions:
+    """Options controlling which outputs are returned for a prediction request.
+
+    Attributes:
+        output (str): `label` for labels only or `proba` to add class scores
+        top_k (Optional[int]): only return the k classes with the highest scores
+        threshold (Optional[float]): cut-off on the positive class score for binary labels
+    """
+
+    output: str = OUTPUT_LABEL
+    top_k: Optional[int] = None
+    threshold: Optional[float] = None
+
+    @classmethod
+    def from_parameters(cls, parameters: Mapping[str, Any]) -> "OutputOptions":
+        """Function to parse and validate the `parameters` of a request
+
+        Args:
+            parameters (Mapping[str, Any]): request parameters, values may be strings if they
+                come from the query string
+
+        Returns:
+            OutputOptions: validated output options
+
+        Raises:
+            ValueError: if a parameter has an invalid value
+        """
+        output = str(parameters.get("output", OUTPUT_LABEL))
+        if output not in (OUTPUT_LABEL, OUTPUT_PROBA):
+            raise ValueError(f"Parameter 'output' must be '{OUTPUT_LABEL}' or '{OUTPUT_PROBA}'")
+
+        top_k = parameters.get("top_k")
+        if top_k is not None:
+            top_k = int(top_k)
+            if top_k < 1:
+                raise ValueError("Parameter 'top_k' must be at least 1")
+            output = OUTPUT_PROBA
+
+        threshold = parameters.get("threshold")
+        if threshold is not None:
+            threshold = float(threshold)
+            if not 0 <= threshold <= 1:
+                raise ValueError("Parameter 'threshold' must be between 0 and 1")
+
+        return cls(output=output, top_k=top_k, threshold=threshold)
+
+
+def prediction_function(model: Any) -> Tuple[Callable, Optional[np.ndarray]]:
+    """Function to pick the single vectorized call used to score a model
+
+    Classifiers are scored with `predict_proba` only, labels are derived from the scores so that
+    requesting scores does not need a second pass over the model.
+
+    Args:
+        model (Any): fitted model or sklearn Pipeline
+
+    Returns:
+        Tuple[Callable, Optional[np.ndarray]]: scoring function and the classes its score
+            columns belong to, None if the model does not provide scores
+    """
+    if hasattr(model, "predict_proba") and hasattr(model, "classes_"):
+        return model.predict_proba, np.asarray(model.classes_)
+    return model.predict, None
+
+
+def make_outputs(
+    raw: np.ndarray, classes: Optional[np.ndarray], options: OutputOptions
+) -> Dict[str, np.ndarray]:
+    """Function to derive the requested outputs from the raw model output
+
+    Args:
+        raw (np.ndarray): output of the scoring function from `prediction_function`
+        classes (Optional[np.ndarray]): classes of the score columns, None if raw are labels
+        options (OutputOptions): requested outputs
+
+    Returns:
+        Dict[str, np.ndarray]: `label` and, if requested, `scores` and `classes` per row
+
+    Raises:
+        ValueError: if scores are requested from a model that does not provide them
+    """
+    raw = np.asarray(raw)
+    if classes is None:
+        if options.output == OUTPUT_PROBA or options.threshold is not None:
+            raise ValueError("The served model does not provide class scores")
+        return {"label": raw}
+
+    if options.threshold is not None:
+        if len(classes) != 2:
+            raise ValueError("Parameter 'threshold' is only supported for binary classification")
+        labels = classes[(raw[:, 1] >= options.threshold).astype(int)]
+    else:
+        labels = classes.take(np.argmax(raw, axis=1))
+
+    outputs = {"label": labels}
+    if options.output == OUTPUT_PROBA:
+        if options.top_k is not None:
+            order = np.argsort(-raw, axis=1, kind="stable")[:, : options.top_k]
+            outputs["scores"] = np.take_along_axis(raw, order, axis=1)
+            outputs["classes"] = classes[order]
+        else:
+            outputs["scores"] = raw
+            outputs["classes"] = np.broadcast_to(classes, raw.shape)
+    return outputs
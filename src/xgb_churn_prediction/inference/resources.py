@@ -0,0 +1,108 @@
+# gunicorn settings derived from the resources available to the serving container
+import math
+import os
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# anything above this is the "no limit" value of cgroup v1
+UNLIMITED_MEMORY = 2**60
+
+# rough memory need of one worker on top of the shared preloaded model
+DEFAULT_WORKER_MEMORY_MB = 512
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit(cgroup_root: Path = CGROUP_ROOT) -> float:
+    """Function to detect the number of CPUs available to the container
+
+    Args:
+        cgroup_root (Path): mount point of the cgroup file system
+
+    Returns:
+        float: CPU quota of the cgroup (v2 or v1), otherwise the number of usable CPUs
+    """
+    cpu_max = _read(cgroup_root / "cpu.max")
+    if cpu_max:
+        quota, period = cpu_max.split()
+        if quota != "max":
+            return int(quota) / int(period)
+
+    quota_v1 = _read(cgroup_root / "cpu" / "cpu.cfs_quota_us")
+    period_v1 = _read(cgroup_root / "cpu" / "cpu.cfs_period_us")
+    if quota_v1 and period_v1 and int(quota_v1) > 0:
+        return int(quota_v1) / int(period_v1)
+
+    return float(len(os.sched_getaffinity(0)))
+
+
+def memory_limit(cgroup_root: Path = CGROUP_ROOT) -> Optional[int]:
+    """Function to detect the memory available to the container
+
+    Args:
+        cgroup_root (Path): mount point of the cgroup file system
+
+    Returns:
+        Optional[int]: memory limit of the cgroup (v2 or v1) in bytes, None if unlimited
+    """
+    for path in [cgroup_root / "memory.max", cgroup_root / "memory" / "memory.limit_in_bytes"]:
+        value = _read(path)
+        if value and value != "max" and int(value) < UNLIMITED_MEMORY:
+            return int(value)
+    return None
+
+
+def gunicorn_settings(
+    cpus: float,
+    memory_bytes: Optional[int],
+    environ: Mapping[str, str] = os.environ,
+) -> Dict[str, Any]:
+    """Function to derive gunicorn settings from the container resources
+
+    Predictions are CPU bound, so there is one worker process per CPU, capped by how many
+    workers fit into the memory limit. Each worker runs a few threads so I/O (request bodies,
+    responses) and micro-batching overlap with prediction. Every setting can be overridden with
+    an environment variable `GUNICORN_<SETTING>`, e.g. `GUNICORN_WORKERS=4`.
+
+    Args:
+        cpus (float): number of CPUs available, see `cpu_limit`
+        memory_bytes (Optional[int]): memory available in bytes, see `memory_limit`
+        environ (Mapping[str, str]): environment to read overrides from
+
+    Returns:
+        Dict[str, Any]: gunicorn settings by name
+    """
+    workers = max(1, math.ceil(cpus))
+    if memory_bytes is not None:
+        worker_memory_mb = int(environ.get("GUNICORN_WORKER_MEMORY_MB", DEFAULT_WORKER_MEMORY_MB))
+        workers = max(1, min(workers, memory_bytes // (worker_memory_mb * 1024 * 1024)))
+
+    settings: Dict[str, Any] = {
+        "worker_class": "gthread",
+        "workers": workers,
+        "threads": 4,
+        # recycle workers regularly to bound memory growth, jittered to not restart all at once
+        "max_requests": 10000,
+        "max_requests_jitter": 1000,
+        # keep connections from the Vertex AI frontend open between requests
+        "keepalive": 75,
+        "timeout": 120,
+        "graceful_timeout": 30,
+    }
+
+    for name, default in settings.items():
+        override = environ.get(f"GUNICORN_{name.upper()}")
+        if override is not None:
+            settings[name] = type(default)(override)
+
+    return settings
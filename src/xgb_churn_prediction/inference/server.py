@@ -0,0 +1,319 @@
+# framework free ASGI server for the Vertex AI custom container contract
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from urllib.parse import parse_qsl
+
+from xgb_churn_prediction.inference.admission import DEADLINE_HEADER
+from xgb_churn_prediction.inference.admission import ROWS_HEADER
+from xgb_churn_prediction.inference.admission import AdmissionController
+from xgb_churn_prediction.inference.admission import AdmissionRejected
+from xgb_churn_prediction.inference.admission import parse_deadline
+from xgb_churn_prediction.inference.cache import PredictionCache
+from xgb_churn_prediction.inference.decoding import RequestDecoder
+from xgb_churn_prediction.inference.decoding import RequestTooLarge
+from xgb_churn_prediction.inference.decoding import UnsupportedEncoding
+from xgb_churn_prediction.inference.decoding import check_content_length
+from xgb_churn_prediction.inference.encoding import encode_predictions
+from xgb_churn_prediction.inference.metrics import PROMETHEUS_CONTENT_TYPE
+from xgb_churn_prediction.inference.metrics import ServingMetrics
+from xgb_churn_prediction.inference.model_store import DEFAULT_VERSION
+from xgb_churn_prediction.inference.model_store import MODEL_VERSION_PARAMETER
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.outputs import OutputOptions
+from xgb_churn_prediction.inference.shadow import ShadowScorer
+
+Scope = Dict[str, Any]
+Headers = Sequence[Tuple[bytes, bytes]]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+
+class AsgiPredictionServer:
+    """ASGI application serving the health and predict routes required by Vertex AI.
+
+    Request bodies are decoded chunk by chunk as they are received, in the default thread pool so
+    decoding large bodies does not stall the event loop, while the CPU bound prediction runs in
+    a bounded thread pool, so health checks keep answering while the model is busy.
+    `max_concurrency` predictions run at the same time and at most `max_pending` requests are
+    admitted in total; any request beyond that is rejected straight away with a 503. Within
+    those, an optional AdmissionController limits the rows in flight and sheds requests that
+    cannot be answered within their deadline, checked before the body is received and again
+    once it is decoded.
+    """
+
+    def __init__(
+        self,
+        get_model: Callable[[Optional[str]], LoadedModel],
+        health_route: str,
+        predict_route: str,
+        cache: Optional[PredictionCache] = None,
+        shadow: Optional[ShadowScorer] = None,
+        is_ready: Optional[Callable[[], bool]] = None,
+        max_concurrency: int = 1,
+        max_pending: int = 32,
+        metrics: Optional[ServingMetrics] = None,
+        metrics_route: str = "/metrics",
+        admission: Optional[AdmissionController] = None,
+        default_deadline_ms: float = 0,
+        max_body_bytes: int = 0,
+    ) -> None:
+        """Initializes a new instance of AsgiPredictionServer.
+
+        Args:
+            get_model (Callable[[Optional[str]], LoadedModel]): function returning the model to
+                serve a request with, called once per request with the model version selected by
+                the request, None for the default model, see `ModelRouter.get`
+            health_route (str): route for health checks, i.e. AIP_HEALTH_ROUTE
+            predict_route (str): route for prediction requests, i.e. AIP_PREDICT_ROUTE
+            cache (Optional[PredictionCache]): prediction cache to serve repeated rows from
+            shadow (Optional[ShadowScorer]): challenger to score requests to the default model
+                with in the background
+            is_ready (Optional[Callable[[], bool]]): function telling whether the model is warmed
+                up, health checks fail with a 503 until it returns True
+            max_concurrency (int): number of predictions running at the same time
+            max_pending (int): number of admitted predict requests incl. the running ones
+            metrics (Optional[ServingMetrics]): metrics to record requests in, e.g. shared with
+                the loaded models to include pipeline step times
+            metrics_route (str): route exposing the metrics in the Prometheus text format
+            admission (Optional[AdmissionController]): admission control of the predictions
+            default_deadline_ms (float): deadline of requests without the
+                `x-request-deadline-ms` header, no deadline if 0
+            max_body_bytes (int): largest request body after decompression, larger ones are
+                rejected with a 413, no limit if 0
+        """
+        self.get_model = get_model
+        self.health_route = health_route
+        self.predict_route = predict_route
+        self.cache = cache
+        self.shadow = shadow
+        self.is_ready = is_ready
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else ServingMetrics()
+        self.metrics_route = metrics_route
+        self.admission = admission
+        self.default_deadline_ms = default_deadline_ms
+        self.max_body_bytes = max_body_bytes
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="predict"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] == self.health_route:
+            if self.is_ready is not None and not self.is_ready():
+                await self._respond(send, 503, {"exception": "Model is warming up"})
+            else:
+                await self._respond(send, 200, {})
+        elif scope["path"] == self.predict_route:
+            if scope["method"] == "POST":
+                await self._predict(scope, receive, send)
+            else:
+                self.metrics.errors.labels("MethodNotAllowed").inc()
+                await self._respond(
+                    send,
+                    405,
+                    {"exception": f"Method {scope['method']} not allowed"},
+                    [(b"allow", b"POST")],
+                )
+        elif scope["path"] == self.metrics_route:
+            body = self.metrics.expose().encode()
+            await self._send(send, 200, body, PROMETHEUS_CONTENT_TYPE)
+        else:
+            self.metrics.errors.labels("NotFound").inc()
+            await self._respond(send, 404, {"exception": f"Route {scope['path']} not found"})
+
+    async def _predict(self, scope: Scope, receive: Receive, send: Send) -> None:
+        metrics = self.metrics
+        if self.pending >= self.max_pending:
+            metrics.errors.labels("ServiceUnavailable").inc()
+            metrics.rejections.labels("max_pending").inc()
+            await self._respond(send, 503, {"exception": "Server overloaded, retry later"})
+            return
+
+        self.pending += 1
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            try:
+                deadline = parse_deadline(
+                    _header(scope, DEADLINE_HEADER.lower().encode()),
+                    time.monotonic(),
+                    self.default_deadline_ms,
+                )
+                body_format = (
+                    _header(scope, b"content-type"),
+                    _header(scope, b"content-encoding"),
+                )
+                content_length = _header(scope, b"content-length")
+                n_announced = int(content_length) if content_length.isdigit() else None
+                check_content_length(n_announced, self.max_body_bytes)
+                if self.admission is not None:
+                    # shed overload before receiving, decompressing and decoding the body
+                    expected_rows = self.admission.expected_rows(
+                        _header(scope, ROWS_HEADER.lower().encode()), body_format, n_announced
+                    )
+                    if not await self._precheck(send, self.admission, expected_rows, deadline):
+                        return
+                decoder = RequestDecoder(*body_format, max_bytes=self.max_body_bytes)
+                n_bytes = await self._receive_body(receive, decoder)
+                metrics.request_bytes.observe(n_bytes)
+                data_df, parameters = await loop.run_in_executor(None, decoder.finish)
+                if self.admission is not None:
+                    self.admission.observe_body(body_format, n_bytes, len(data_df))
+                timings = decoder.timings
+                query = dict(parse_qsl(scope.get("query_string", b"").decode()))
+                options = OutputOptions.from_parameters({**parameters, **query})
+            except ValueError as e:
+                metrics.errors.labels(type(e).__name__).inc()
+                if isinstance(e, UnsupportedEncoding):
+                    status = 415
+                elif isinstance(e, RequestTooLarge):
+                    status = 413
+                else:
+                    status = 400
+                await self._respond(send, status, {"exception": repr(e)})
+                return
+            metrics.request_rows.observe(len(data_df))
+
+            # the request finishes on this model even if a new version is swapped in meanwhile
+            version = _header(scope, b"x-model-version") or query.get(MODEL_VERSION_PARAMETER)
+            try:
+                if version:
+                    # loading a version that is not in memory must not block the event loop
+                    model = await loop.run_in_executor(None, self.get_model, version)
+                else:
+                    model = self.get_model(None)
+            except KeyError as e:
+                metrics.errors.labels("NotFound").inc()
+                await self._respond(send, 404, {"exception": e.args[0]})
+                return
+            if self.admission is not None:
+                admission_start = time.perf_counter()
+                try:
+                    await self.admission.admit_async(len(data_df), deadline)
+                except AdmissionRejected as e:
+                    await self._reject(send, e)
+                    return
+                metrics.queue_wait_seconds.labels("admission").observe(
+                    time.perf_counter() - admission_start
+                )
+            submitted = time.perf_counter()
+
+            def predict() -> Tuple[float, Dict[str, Any]]:
+                return time.perf_counter(), model.predict(data_df, options, self.cache)
+
+            try:
+                predict_start, outputs = await loop.run_in_executor(self._executor, predict)
+            except ValueError as e:
+                metrics.errors.labels(type(e).__name__).inc()
+                await self._respond(send, 400, {"exception": repr(e)})
+                return
+            finally:
+                if self.admission is not None:
+                    self.admission.release(len(data_df), time.perf_counter() - submitted)
+            metrics.queue_wait_seconds.labels("executor").observe(predict_start - submitted)
+            timings["predict"] = time.perf_counter() - predict_start
+            if self.shadow is not None and version in (None, "", DEFAULT_VERSION):
+                self.shadow.submit(data_df, options, model, outputs)
+
+            encode_start = time.perf_counter()
+            body, content_type = encode_predictions(outputs, _header(scope, b"accept"))
+            timings["encode"] = time.perf_counter() - encode_start
+            timings["total"] = time.perf_counter() - start
+            for stage, seconds in timings.items():
+                metrics.stage_seconds.labels(stage).observe(seconds)
+            await self._send(send, 200, body, content_type)
+        except Exception as e:
+            logging.exception("Prediction request failed")
+            metrics.errors.labels(type(e).__name__).inc()
+            await self._respond(send, 500, {"exception": repr(e)})
+        finally:
+            self.pending -= 1
+
+    async def _precheck(
+        self, send: Send, admission: AdmissionController, rows: int, deadline: Optional[float]
+    ) -> bool:
+        # whether the request may be received, rejects it otherwise, see `admission.precheck`
+        try:
+            admission.precheck(rows, deadline)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+            return False
+        return True
+
+    async def _reject(self, send: Send, e: AdmissionRejected) -> None:
+        self.metrics.rejections.labels(e.reason).inc()
+        self.metrics.errors.labels(
+            "TooManyRequests" if e.status == 429 else "ServiceUnavailable"
+        ).inc()
+        await self._respond(send, e.status, {"exception": str(e)})
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _receive_body(receive: Receive, decoder: RequestDecoder) -> int:
+        # every chunk is decoded as soon as it arrives instead of joining the whole body first,
+        # off the event loop and one chunk at a time, as the decoder is not thread-safe
+        loop = asyncio.get_running_loop()
+        n_bytes = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get("body", b"")
+            n_bytes += len(chunk)
+            if chunk:
+                await loop.run_in_executor(None, decoder.feed, chunk)
+            more_body = message.get("more_body", False)
+        return n_bytes
+
+    @classmethod
+    async def _respond(
+        cls, send: Send, status: int, payload: Dict, extra_headers: Headers = ()
+    ) -> None:
+        body = json.dumps(payload).encode()
+        await cls._send(send, status, body, "application/json", extra_headers)
+
+    @staticmethod
+    async def _send(
+        send: Send, status: int, body: bytes, content_type: str, extra_headers: Headers = ()
+    ) -> None:
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            *extra_headers,
+        ]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope: Scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
@@ -0,0 +1,148 @@
+# settings and models shared by the Flask app in app.py and the ASGI app in asgi.py
+# doco: https://cloud.google.com/vertex-ai/docs/predictions/custom-container-requirements#image
+import os
+from functools import partial
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+from xgb_churn_prediction.inference.admission import AdmissionController
+from xgb_churn_prediction.inference.cache import PredictionCache
+from xgb_churn_prediction.inference.metrics import ServingMetrics
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.model_store import ModelRouter
+from xgb_churn_prediction.inference.model_store import ModelWatcher
+from xgb_churn_prediction.inference.model_store import load_model
+from xgb_churn_prediction.inference.model_store import parse_model_versions
+from xgb_churn_prediction.inference.shadow import ShadowScorer
+from xgb_churn_prediction.model.compiled_forest import MAX_COMPILED_ROWS
+
+health_endpoint = os.environ["AIP_HEALTH_ROUTE"]
+predict_endpoint = os.environ["AIP_PREDICT_ROUTE"]
+model_gcs_uri = os.environ["AIP_STORAGE_URI"]
+metrics_endpoint = os.environ.get("METRICS_ROUTE", "/metrics")
+
+# optional micro-batching of concurrent requests, disabled if max wait is 0
+batching_max_wait_ms = float(os.environ.get("BATCHING_MAX_WAIT_MS", "0"))
+batching_max_rows = int(os.environ.get("BATCHING_MAX_ROWS", "1024"))
+
+# optional cache of predictions per feature row, disabled if size is 0
+prediction_cache_size = int(os.environ.get("PREDICTION_CACHE_SIZE", "0"))
+prediction_cache_ttl_s = float(os.environ.get("PREDICTION_CACHE_TTL_S", "300"))
+
+# admission control: rows predicted at the same time per worker (no limit if 0), requests
+# waiting for them and the deadline of requests without a deadline header (none if 0)
+max_inflight_rows = int(os.environ.get("PREDICT_MAX_INFLIGHT_ROWS", "0"))
+max_queued = int(os.environ.get("PREDICT_MAX_QUEUED", "16"))
+default_deadline_ms = float(os.environ.get("PREDICT_DEADLINE_MS", "0"))
+
+# largest request body after decompression, larger ones are rejected with a 413 (no limit if 0)
+max_body_bytes = int(float(os.environ.get("PREDICT_MAX_BODY_MB", "256")) * 1024 * 1024)
+
+# interval to check for a new model artifact, disabled if 0
+model_reload_interval_s = float(os.environ.get("MODEL_RELOAD_INTERVAL_S", "0"))
+
+# serve the forest with the compiled inference engine for calls of up to COMPILED_MAX_ROWS rows,
+# where it is faster than sklearn, larger calls (e.g. micro-batches) are scored by sklearn
+compile_model = os.environ.get("COMPILE_MODEL", "true").lower() == "true"
+compiled_max_rows = int(os.environ.get("COMPILED_MAX_ROWS", str(MAX_COMPILED_ROWS)))
+
+# number of rows of the synthetic batches run through the model before reporting ready
+warm_up_sizes = [
+    int(size) for size in os.environ.get("WARMUP_BATCH_SIZES", "1,32,1024").split(",") if size
+]
+
+# other model versions (`name=uri,...`) served to requests selecting them by header or query
+# parameter, loaded on first use and evicted least recently used beyond the memory limit
+model_versions = parse_model_versions(os.environ.get("MODEL_VERSIONS", ""))
+model_memory_limit_mb = float(os.environ.get("MODEL_MEMORY_LIMIT_MB", "0"))
+
+# optional version scored in the background for requests to the default model
+shadow_model_version = os.environ.get("SHADOW_MODEL_VERSION", "")
+if shadow_model_version and shadow_model_version not in model_versions:
+    raise ValueError(f"SHADOW_MODEL_VERSION {shadow_model_version} is not in MODEL_VERSIONS")
+
+metrics = ServingMetrics()
+load = partial(
+    load_model,
+    compile_model=compile_model,
+    max_compiled_rows=compiled_max_rows,
+    batching_max_wait_ms=batching_max_wait_ms,
+    batching_max_rows=batching_max_rows,
+    metrics=metrics,
+)
+# the loaded model is swapped by the watcher when a new artifact is uploaded
+watcher = ModelWatcher(
+    model_gcs_uri,
+    load(model_gcs_uri),
+    partial(load, model_gcs_uri),
+    interval_seconds=model_reload_interval_s,
+    warm_up_sizes=warm_up_sizes,
+)
+router = ModelRouter(
+    watcher,
+    model_versions,
+    load,
+    memory_limit_bytes=int(model_memory_limit_mb * 2**20) if model_memory_limit_mb > 0 else None,
+)
+shadow = ShadowScorer(partial(router.get, shadow_model_version)) if shadow_model_version else None
+cache = (
+    PredictionCache(max_entries=prediction_cache_size, ttl_seconds=prediction_cache_ttl_s)
+    if prediction_cache_size > 0
+    else None
+)
+admission = AdmissionController(max_inflight_rows=max_inflight_rows, max_queued=max_queued)
+
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    """Function to collect the micro-batching, prediction cache, model and admission counters
+
+    Returns:
+        Dict[str, Dict[str, Any]]: stats of micro-batching, prediction cache, model versions and
+            shadow scoring, if enabled, and of admission control
+    """
+    output: Dict[str, Dict[str, Any]] = {}
+    batcher = watcher.current.batcher
+    if batcher is not None:
+        output["batching"] = batcher.stats.snapshot()
+    if cache is not None:
+        output["cache"] = cache.snapshot()
+    if model_versions:
+        output["models"] = router.snapshot()
+    if shadow is not None:
+        output["shadow"] = shadow.snapshot()
+    output["admission"] = admission.snapshot()
+    return output
+
+
+metrics.add_collector(collect_stats)
+
+
+def get_model(version: Optional[str] = None) -> LoadedModel:
+    """Function to get the model to serve the next request with, see `ModelRouter.get`
+
+    The request finishes on this model even if a new version is swapped in meanwhile.
+
+    Args:
+        version (Optional[str]): version selected by the request, None for the default model
+
+    Returns:
+        LoadedModel: model to serve the request with
+
+    Raises:
+        KeyError: if the version is not configured
+    """
+    watcher.ensure_running()
+    return router.get(version)
+
+
+def ready() -> bool:
+    """Function to check whether the model has been warmed up in this worker
+
+    The first call starts the warm-up of the model in the worker.
+
+    Returns:
+        bool: True once warm-up has finished
+    """
+    watcher.ensure_running()
+    return watcher.ready
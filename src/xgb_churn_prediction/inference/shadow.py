@@ -0,0 +1,169 @@
+# shadow scoring of a challenger model next to the model answering the requests
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.outputs import OutputOptions
+
+SHADOW_LOGGER = logging.getLogger("xgb_churn_prediction.shadow")
+
+
+class ShadowScorer:
+    """Scores the rows of served requests with a challenger model off the response path.
+
+    The challenger runs on a single background thread after the response has been computed, so
+    it only takes CPU time that is not spent on requests. At most `max_pending` requests are
+    queued; requests beyond that are not shadowed and counted as dropped. Both models are
+    compared in one JSON record per request, with the label agreement rate, the mean and maximum
+    difference of the class scores if they were requested and at most `max_logged_rows` of the
+    rows the models disagree on, so the log volume does not grow with the request size.
+    """
+
+    def __init__(
+        self,
+        get_challenger: Callable[[], LoadedModel],
+        max_pending: int = 16,
+        max_logged_rows: int = 5,
+        logger: logging.Logger = SHADOW_LOGGER,
+    ) -> None:
+        """Initializes a new instance of ShadowScorer.
+
+        Args:
+            get_challenger (Callable[[], LoadedModel]): function returning the challenger model
+            max_pending (int): maximum number of requests waiting to be shadowed
+            max_logged_rows (int): maximum number of disagreeing rows logged per request
+            logger (logging.Logger): logger to write the comparison records to
+        """
+        self.get_challenger = get_challenger
+        self.max_pending = max_pending
+        self.max_logged_rows = max_logged_rows
+        self.logger = logger
+        self.pending = 0
+        self.shadowed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+
+    def submit(
+        self,
+        data: pd.DataFrame,
+        options: OutputOptions,
+        champion: LoadedModel,
+        champion_outputs: Dict[str, np.ndarray],
+    ) -> None:
+        """Function to queue a served request for scoring with the challenger
+
+        Args:
+            data (pd.DataFrame): rows of the request
+            options (OutputOptions): requested outputs, the challenger returns the same
+            champion (LoadedModel): model that answered the request
+            champion_outputs (Dict[str, np.ndarray]): outputs returned to the client
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending += 1
+            executor = self._ensure_executor()
+        executor.submit(self._score, data, options, champion, champion_outputs)
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        # threads do not survive a fork, so (re)start the executor in the current process,
+        # called with the lock held
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _score(
+        self,
+        data: pd.DataFrame,
+        options: OutputOptions,
+        champion: LoadedModel,
+        champion_outputs: Dict[str, np.ndarray],
+    ) -> None:
+        try:
+            challenger = self.get_challenger()
+            start = time.perf_counter()
+            challenger_outputs = challenger.predict(data, options)
+            duration = time.perf_counter() - start
+            record: Dict[str, Any] = {
+                "champion_version": champion.version,
+                "challenger_version": challenger.version,
+                "challenger_ms": duration * 1000,
+                **self._compare(champion_outputs, challenger_outputs),
+            }
+            self.logger.info(json.dumps(record))
+            with self._lock:
+                self.shadowed += 1
+        except Exception:
+            logging.exception("Shadow scoring with the challenger failed")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _compare(
+        self, champion_outputs: Dict[str, np.ndarray], challenger_outputs: Dict[str, np.ndarray]
+    ) -> Dict[str, Any]:
+        # summary of the differences between the outputs of both models
+        champion_labels = np.asarray(champion_outputs["label"])
+        challenger_labels = np.asarray(challenger_outputs["label"])
+        disagreeing = np.flatnonzero(champion_labels != challenger_labels)
+        summary: Dict[str, Any] = {
+            "rows": len(champion_labels),
+            "agreement": 1 - len(disagreeing) / len(champion_labels)
+            if len(champion_labels)
+            else 1.0,
+            "disagreements": len(disagreeing),
+            "mean_score_delta": None,
+            "max_score_delta": None,
+        }
+        # scores are only comparable if both models return them for the same classes
+        if "scores" in champion_outputs and "scores" in challenger_outputs:
+            champion_scores = np.asarray(champion_outputs["scores"], dtype=float)
+            challenger_scores = np.asarray(challenger_outputs["scores"], dtype=float)
+            if champion_scores.shape == challenger_scores.shape and np.array_equal(
+                champion_outputs["classes"], challenger_outputs["classes"]
+            ):
+                delta = np.abs(champion_scores - challenger_scores)
+                summary["mean_score_delta"] = float(delta.mean()) if delta.size else 0.0
+                summary["max_score_delta"] = float(delta.max()) if delta.size else 0.0
+        sample = disagreeing[: self.max_logged_rows]
+        summary["disagreeing_rows"] = [
+            {"row": row, "champion": champion, "challenger": challenger}
+            for row, champion, challenger in zip(
+                sample.tolist(),
+                champion_labels[sample].tolist(),
+                challenger_labels[sample].tolist(),
+            )
+        ]
+        return summary
+
+    def snapshot(self) -> Dict[str, int]:
+        """Function to get the shadow scoring counters
+
+        Returns:
+            Dict[str, int]: shadowed, dropped, failed and pending requests
+        """
+        with self._lock:
+            return {
+                "shadowed": self.shadowed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "pending": self.pending,
+            }
@@ -0,0 +1,68 @@
+# warm-up of freshly loaded models before they serve requests
+import logging
+import time
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def input_feature_names(model: Any) -> Optional[np.ndarray]:
+    """Function to get the names of the input columns a fitted model expects
+
+    Args:
+        model (Any): fitted model or sklearn Pipeline
+
+    Returns:
+        Optional[np.ndarray]: input column names, None if the model does not record them
+    """
+    try:
+        return model.feature_names_in_
+    except AttributeError:
+        pass
+    # models trained before the Featurizer recorded its input columns
+    steps = getattr(model, "steps", None)
+    if steps:
+        return getattr(steps[-1][1], "feature_names_in_", None)
+    return None
+
+
+def synthetic_batch(model: Any, n_rows: int) -> Optional[pd.DataFrame]:
+    """Function to build a batch of zero-valued rows in the input format of the model
+
+    Args:
+        model (Any): fitted model or sklearn Pipeline
+        n_rows (int): number of rows
+
+    Returns:
+        Optional[pd.DataFrame]: synthetic batch, None if the input columns are unknown
+    """
+    feature_names = input_feature_names(model)
+    if feature_names is None:
+        return None
+    return pd.DataFrame(np.zeros((n_rows, len(feature_names))), columns=list(feature_names))
+
+
+def warm_up(model: Any, score_fn: Callable[[pd.DataFrame], Any], sizes: Sequence[int]) -> bool:
+    """Function to run synthetic batches through a model to pay lazy initialisation costs
+
+    Args:
+        model (Any): fitted model or sklearn Pipeline, used to derive the input columns
+        score_fn (Callable[[pd.DataFrame], Any]): scoring function to warm up
+        sizes (Sequence[int]): number of rows of each synthetic batch
+
+    Returns:
+        bool: True if all batches were scored, False if warm-up was not possible
+    """
+    for n_rows in sizes:
+        batch = synthetic_batch(model, n_rows)
+        if batch is None:
+            logging.warning("Skipping warm-up, model does not record its input features")
+            return False
+        start = time.perf_counter()
+        score_fn(batch)
+        logging.info(f"Warm-up batch of {n_rows} rows took {time.perf_counter() - start:.3f}s")
+    return True
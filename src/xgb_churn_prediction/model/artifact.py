@@ -0,0 +1,351 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import platform
+import shutil
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.pipeline import Pipeline
+
+from .compiled_forest import CompiledForest
+from .compression import COPY_BYTES
+from .compression import codec_reader
+from .compression import compress_file
+
+# name and version of the artifact format written to the manifest
+ARTIFACT_FORMAT = "xgb_churn_prediction.compiled_forest"
+ARTIFACT_FORMAT_VERSION = 1
+
+# file suffixes of manifest and array blobs, next to the `pkl` of pickled models
+MANIFEST_TYPE = "json"
+BLOB_TYPE = "bin"
+
+# arrays are aligned in the blob file so every one of them can be memory-mapped
+ALIGNMENT = 64
+
+
+def library_versions() -> Dict[str, str]:
+    """Function to get the versions of the libraries the artifact depends on
+
+    Returns:
+        Dict[str, str]: versions of python, numpy, pandas and scikit-learn
+    """
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def _split_model(model: Any) -> Tuple[List[Tuple[str, Any]], str, CompiledForest]:
+    # preprocessing steps, name of the final step and its compiled forest
+    if isinstance(model, Pipeline):
+        name, estimator = model.steps[-1]
+        steps = list(model.steps[:-1])
+    else:
+        name, estimator, steps = "", model, []
+    if not isinstance(estimator, CompiledForest):
+        estimator = CompiledForest.from_estimator(estimator)
+    return steps, name, estimator
+
+
+def _write_blob(file: BinaryIO, data: bytes, digest: Any) -> Dict[str, int]:
+    offset = file.tell()
+    padding = -offset % ALIGNMENT
+    file.write(b"\0" * padding)
+    file.write(data)
+    digest.update(b"\0" * padding)
+    digest.update(data)
+    return {"offset": offset + padding, "nbytes": len(data)}
+
+
+def save_artifact(
+    model: Any,
+    path: str,
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+    threads: int = 0,
+) -> str:
+    """Function to save a fitted forest or Pipeline ending in one as manifest and array blobs
+
+    The forest is stored as the node arrays of its CompiledForest in one blob file
+    `<path>.bin`, each array contiguous and aligned, so loading can memory-map them instead of
+    deserializing. The tree statistics of a RandomForestClassifier are stored as arrays too and
+    its hyperparameters and the preprocessing steps of a Pipeline are pickled into the same
+    file, so the forest is restored exactly, see `CompiledForest.to_estimator`. The
+    manifest `<path>.json` describes the arrays and records the model version (the SHA-256 of
+    the blob file), the input feature order and the library versions. It is written last, so a
+    manifest always refers to a complete blob file.
+
+    A compressed blob file is smaller to store and download but cannot be memory-mapped, it is
+    decompressed into memory on load unless it was decompressed after downloading, see
+    `decompress_artifact`. The codec is recorded in the manifest, the model version does not
+    depend on it.
+
+    Args:
+        model (Any): fitted forest classifier, CompiledForest or Pipeline ending in either
+        path (str): path to save the artifact to, without suffix
+        compression (Optional[str]): codec to compress the blob file with, see
+            `compression.CODECS`, uncompressed if None
+        level (Optional[int]): compression level, the default of the codec if None
+        threads (int): number of threads compressing in parallel, see
+            `compression.compressed_writer`
+
+    Returns:
+        str: model version of the artifact
+
+    Raises:
+        ValueError: if the model does not end in a forest that can be compiled, or the codec
+            is unknown or not installed
+    """
+    steps, step_name, forest = _split_model(model)
+    feature_names = getattr(model, "feature_names_in_", None)
+    digest = hashlib.sha256()
+    arrays = {}
+    blob_path = f"{path}.{BLOB_TYPE}"
+    with open(f"{blob_path}.tmp", "wb") as file:
+        for name, array in {**forest.arrays, **(forest.tree_arrays or {})}.items():
+            array = np.ascontiguousarray(array)
+            arrays[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                **_write_blob(file, array.tobytes(), digest),
+            }
+        preprocessing = _write_blob(file, pickle.dumps(steps), digest)
+        params = (
+            None
+            if forest.params is None
+            else _write_blob(file, pickle.dumps(forest.params), digest)
+        )
+    if compression is not None:
+        compress_file(f"{blob_path}.tmp", compression, level, threads)
+    os.replace(f"{blob_path}.tmp", blob_path)
+
+    model_version = digest.hexdigest()
+    forest_features = getattr(forest, "feature_names_in_", None)
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_version": model_version,
+        "feature_names": None if feature_names is None else list(feature_names),
+        "libraries": library_versions(),
+        "compression": compression,
+        "pipeline": isinstance(model, Pipeline),
+        "preprocessing": preprocessing,
+        "estimator": {
+            "step": step_name,
+            "max_depth": int(forest.max_depth),
+            "classes": forest.classes_.tolist(),
+            "feature_names": None if forest_features is None else list(forest_features),
+            "arrays": arrays,
+            "params": params,
+        },
+    }
+    _write_manifest(path, manifest)
+    return model_version
+
+
+def _write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    with open(f"{path}.{MANIFEST_TYPE}.tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(f"{path}.{MANIFEST_TYPE}.tmp", f"{path}.{MANIFEST_TYPE}")
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """Function to read and check the manifest of an artifact
+
+    Args:
+        path (str): path of the artifact, without suffix
+
+    Returns:
+        Dict[str, Any]: manifest
+
+    Raises:
+        ValueError: if the manifest is not of a supported artifact format
+    """
+    with open(f"{path}.{MANIFEST_TYPE}") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path}.{MANIFEST_TYPE} is not a {ARTIFACT_FORMAT} manifest")
+    if manifest.get("format_version", 0) > ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Artifact format version {manifest['format_version']} is newer than the supported "
+            f"version {ARTIFACT_FORMAT_VERSION}"
+        )
+    for library, version in library_versions().items():
+        saved = manifest.get("libraries", {}).get(library)
+        if library != "python" and saved != version:
+            logging.warning(f"Artifact was saved with {library} {saved}, loading with {version}")
+    return manifest
+
+
+def decompress_artifact(path: str) -> Optional[str]:
+    """Function to decompress the blob file of an artifact in place, e.g. after downloading it
+
+    The blob file is decompressed with the codec recorded in the manifest, which is rewritten
+    without it, so the arrays can be memory-mapped on every later load.
+
+    Args:
+        path (str): path of the artifact, without suffix
+
+    Returns:
+        Optional[str]: codec the blob file was compressed with, None if it was not compressed
+
+    Raises:
+        ValueError: if the blob file is not compressed with the codec of the manifest
+    """
+    with open(f"{path}.{MANIFEST_TYPE}") as file:
+        manifest = json.load(file)
+    codec = manifest.get("compression")
+    if codec is None:
+        return None
+    blob_path = f"{path}.{BLOB_TYPE}"
+    with open(blob_path, "rb") as source, codec_reader(source, codec) as reader:
+        with open(f"{blob_path}.tmp", "wb") as file:
+            shutil.copyfileobj(reader, file, COPY_BYTES)
+    os.replace(f"{blob_path}.tmp", blob_path)
+    _write_manifest(path, {**manifest, "compression": None})
+    return codec
+
+
+def _read_blob(blob_path: str, manifest: Dict[str, Any]) -> Optional[bytes]:
+    # content of a compressed blob file, decompressed with the codec of the manifest, or None
+    # for an uncompressed one, which is mapped or read array by array
+    spec = manifest["estimator"]
+    regions = [*spec["arrays"].values(), manifest["preprocessing"]]
+    if spec.get("params") is not None:
+        regions.append(spec["params"])
+    nbytes = max(region["offset"] + region["nbytes"] for region in regions)
+    codec = manifest["compression"]
+    if codec is None:
+        if os.path.getsize(blob_path) != nbytes:
+            raise ValueError(f"{blob_path} is not the uncompressed blob file of its manifest")
+        return None
+    with open(blob_path, "rb") as file, codec_reader(file, codec) as reader:
+        content = reader.read()
+    if len(content) != nbytes:
+        raise ValueError(f"{blob_path} does not decompress to the blob file of its manifest")
+    return content
+
+
+def _read_array(
+    blob_path: str, spec: Dict[str, Any], mmap: bool, content: Optional[bytes]
+) -> np.ndarray:
+    dtype = np.dtype(spec["dtype"])
+    shape = tuple(spec["shape"])
+    if spec["nbytes"] != dtype.itemsize * int(np.prod(shape)):
+        raise ValueError(f"Array of shape {shape} and dtype {dtype} does not fit its size")
+    if spec["nbytes"] == 0:
+        return np.empty(shape, dtype=dtype)
+    if content is not None:
+        count = int(np.prod(shape))
+        return np.frombuffer(content, dtype=dtype, count=count, offset=spec["offset"]).reshape(
+            shape
+        )
+    if mmap:
+        array = np.memmap(blob_path, dtype=dtype, mode="r", offset=spec["offset"], shape=shape)
+        # a plain ndarray view keeps the mapping alive without the memmap subclass overhead
+        return array.view(np.ndarray)
+    with open(blob_path, "rb") as file:
+        file.seek(spec["offset"])
+        return np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def verify_artifact(path: str) -> None:
+    """Function to check that the blob file of an artifact is the one its manifest describes
+
+    The blobs and the manifest of an artifact are separate objects, so a download running
+    while a new version is uploaded can get the blob file of one and the manifest of the other.
+
+    Args:
+        path (str): path of the artifact, without suffix
+
+    Raises:
+        ValueError: if the manifest is not supported, the blob file is not compressed as the
+            manifest records or the checksum does not match
+    """
+    blob_path = f"{path}.{BLOB_TYPE}"
+    manifest = read_manifest(path)
+    _verify_checksum(blob_path, manifest, _read_blob(blob_path, manifest))
+
+
+def _verify_checksum(blob_path: str, manifest: Dict[str, Any], content: Optional[bytes]) -> None:
+    digest = hashlib.sha256()
+    if content is not None:
+        digest.update(content)
+    else:
+        with open(blob_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    if digest.hexdigest() != manifest["model_version"]:
+        raise ValueError(f"Checksum of {blob_path} does not match its manifest")
+
+
+def load_artifact(
+    path: str, mmap: bool = True, compiled: bool = True, verify_checksum: bool = False
+) -> Any:
+    """Function to load an artifact saved with `save_artifact`
+
+    Args:
+        path (str): path of the artifact, without suffix
+        mmap (bool): whether to memory-map the node arrays instead of reading them, mapped pages
+            are loaded lazily and shared between processes. Blob files compressed with the
+            codec of the manifest are always decompressed into memory
+        compiled (bool): whether to return the forest as CompiledForest, which is faster for
+            few rows per call, or as RandomForestClassifier, which is faster for large batches
+        verify_checksum (bool): whether to check the blob file against the model version, which
+            reads the whole file
+
+    Returns:
+        Any: model as it was saved, with the forest as CompiledForest or RandomForestClassifier
+
+    Raises:
+        ValueError: if the manifest is not supported, the blob file is not compressed as the
+            manifest records, the checksum does not match or the arrays do not form a valid
+            forest
+    """
+    manifest = read_manifest(path)
+    blob_path = f"{path}.{BLOB_TYPE}"
+    content = _read_blob(blob_path, manifest)
+    if verify_checksum:
+        _verify_checksum(blob_path, manifest, content)
+
+    spec = manifest["estimator"]
+    arrays = {
+        name: _read_array(blob_path, array, mmap, content) for name, array in spec["arrays"].items()
+    }
+    feature_names = spec["feature_names"]
+    params = spec.get("params")
+    forest = CompiledForest.from_arrays(
+        arrays,
+        max_depth=spec["max_depth"],
+        classes=np.asarray(spec["classes"]),
+        feature_names_in=None if feature_names is None else np.asarray(feature_names, dtype=object),
+        params=None if params is None else _read_pickle(blob_path, params, content),
+    )
+    estimator = forest if compiled else forest.to_estimator()
+    if not manifest["pipeline"]:
+        return estimator
+
+    steps = _read_pickle(blob_path, manifest["preprocessing"], content)
+    return Pipeline(steps + [(spec["step"], estimator)])
+
+
+def _read_pickle(blob_path: str, spec: Dict[str, Any], content: Optional[bytes]) -> Any:
+    offset, nbytes = spec["offset"], spec["nbytes"]
+    if content is not None:
+        return pickle.loads(content[offset : offset + nbytes])
+    with open(blob_path, "rb") as file:
+        file.seek(offset)
+        return pickle.loads(file.read(nbytes))
@@ -0,0 +1,225 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+from typing import BinaryIO
+from typing import Optional
+from typing import Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd compression is optional
+    zstandard = None  # type: ignore
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - lz4 compression is optional
+    lz4_frame = None  # type: ignore
+
+# codecs a model file can be compressed with, zstd and lz4 need their optional packages
+CODECS = ("zstd", "lz4", "gzip", "lzma")
+
+# compressed files are recognized by the magic bytes of their frame format, so pickled models
+# load without a hint of how they were saved
+MAGIC_BYTES = {
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "lz4": b"\x04\x22\x4d\x18",
+    "gzip": b"\x1f\x8b",
+    "lzma": b"\xfd7zXZ\x00",
+}
+
+DEFAULT_LEVELS = {"zstd": 3, "lz4": 0, "gzip": 6, "lzma": 6}
+
+COPY_BYTES = 1 << 20
+
+
+def check_codec(codec: str) -> None:
+    """Function to check that a codec is known and its package installed
+
+    Args:
+        codec (str): name of the codec
+
+    Raises:
+        ValueError: if the codec is unknown or its package is not installed
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec '{codec}', expected one of {CODECS}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    if codec == "lz4" and lz4_frame is None:
+        raise ValueError("lz4 compression needs the lz4 package")
+
+
+def detect_codec(header: bytes) -> Optional[str]:
+    """Function to detect the codec of compressed data from its first bytes
+
+    Args:
+        header (bytes): at least the first 6 bytes of the data
+
+    Returns:
+        Optional[str]: codec of the data, None if it is not compressed
+    """
+    for codec, magic in MAGIC_BYTES.items():
+        if header[: len(magic)] == magic:
+            return codec
+    return None
+
+
+def file_codec(path: str) -> Optional[str]:
+    """Function to detect the codec of a file
+
+    Args:
+        path (str): path of the file
+
+    Returns:
+        Optional[str]: codec of the file, None if it is not compressed
+    """
+    with open(path, "rb") as file:
+        return detect_codec(file.read(8))
+
+
+def compressed_writer(
+    file: BinaryIO, codec: str, level: Optional[int] = None, threads: int = 0
+) -> BinaryIO:
+    """Function to wrap a file so everything written to it is compressed
+
+    Closing the returned stream finishes the compressed frame but leaves `file` open.
+
+    Args:
+        file (BinaryIO): file opened for binary writing
+        codec (str): one of CODECS
+        level (Optional[int]): compression level of the codec, its default if None
+        threads (int): number of threads compressing in parallel, 0 to compress in the calling
+            thread and -1 for one per core, only zstd compresses with several threads
+
+    Returns:
+        BinaryIO: stream to write the uncompressed data to
+
+    Raises:
+        ValueError: if the codec is unknown or its package is not installed
+    """
+    check_codec(codec)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        return compressor.stream_writer(file, closefd=False)  # type: ignore
+    if codec == "lz4":
+        return lz4_frame.LZ4FrameFile(file, "wb", compression_level=level)  # type: ignore
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="wb", compresslevel=level)  # type: ignore
+    return lzma.LZMAFile(file, "wb", preset=level)  # type: ignore
+
+
+def codec_reader(file: BinaryIO, codec: str) -> BinaryIO:
+    """Function to wrap a file compressed with a known codec so it is read decompressed
+
+    Args:
+        file (BinaryIO): file opened for binary reading, positioned at its start
+        codec (str): one of CODECS the file was compressed with
+
+    Returns:
+        BinaryIO: stream of the decompressed data
+
+    Raises:
+        ValueError: if the file does not start with the frame of the codec, or the codec is
+            unknown or its package is not installed
+    """
+    check_codec(codec)
+    if detect_codec(file.peek(8) if hasattr(file, "peek") else b"") != codec:
+        raise ValueError(f"{getattr(file, 'name', 'File')} is not compressed with {codec}")
+    if codec == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(file, closefd=False)
+        return io.BufferedReader(reader)  # type: ignore
+    if codec == "lz4":
+        return lz4_frame.LZ4FrameFile(file, "rb")  # type: ignore
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="rb")  # type: ignore
+    return lzma.LZMAFile(file, "rb")  # type: ignore
+
+
+def decompressed_reader(file: BinaryIO) -> BinaryIO:
+    """Function to wrap a file so it is read decompressed, uncompressed files are returned as is
+
+    The codec is detected from the magic bytes of the file, for files saved without a record
+    of their codec such as pickled models.
+
+    Args:
+        file (BinaryIO): file opened for binary reading, positioned at its start
+
+    Returns:
+        BinaryIO: stream of the decompressed data
+
+    Raises:
+        ValueError: if the file is compressed with a codec whose package is not installed
+    """
+    codec = detect_codec(file.peek(8) if hasattr(file, "peek") else b"")
+    if codec is None:
+        return file
+    return codec_reader(file, codec)
+
+
+def decompress_bytes(data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+    """Function to decompress data of any of CODECS, uncompressed data is returned as is
+
+    Args:
+        data (Union[bytes, memoryview]): possibly compressed data, e.g. a downloaded model file
+
+    Returns:
+        Union[bytes, memoryview]: decompressed data
+
+    Raises:
+        ValueError: if the data is compressed with a codec whose package is not installed
+    """
+    codec = detect_codec(bytes(data[:8]))
+    if codec is None:
+        return data
+    check_codec(codec)
+    if codec == "zstd":
+        # frames written by a stream writer do not record their content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == "lz4":
+        return lz4_frame.decompress(data)  # type: ignore
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return lzma.decompress(data)
+
+
+def compress_file(path: str, codec: str, level: Optional[int] = None, threads: int = 0) -> None:
+    """Function to compress a file in place
+
+    Args:
+        path (str): path of the uncompressed file
+        codec (str): one of CODECS
+        level (Optional[int]): compression level of the codec, its default if None
+        threads (int): number of threads compressing in parallel, see `compressed_writer`
+
+    Raises:
+        ValueError: if the codec is unknown or its package is not installed
+    """
+    with open(path, "rb") as source, open(f"{path}.tmp", "wb") as file:
+        with compressed_writer(file, codec, level, threads) as writer:
+            shutil.copyfileobj(source, writer, COPY_BYTES)
+    os.replace(f"{path}.tmp", path)
+
+
+def decompress_file(path: str) -> Optional[str]:
+    """Function to decompress a file in place if it is compressed, e.g. after downloading it
+
+    Args:
+        path (str): path of the possibly compressed file
+
+    Returns:
+        Optional[str]: codec the file was compressed with, None if it was not compressed
+
+    Raises:
+        ValueError: if the file is compressed with a codec whose package is not installed
+    """
+    with open(path, "rb") as source:
+        codec = detect_codec(source.peek(8))
+        if codec is None:
+            return None
+        with decompressed_reader(source) as reader, open(f"{path}.tmp", "wb") as file:
+            shutil.copyfileobj(reader, file, COPY_BYTES)
+    os.replace(f"{path}.tmp", path)
+    return codec
@@ -0,0 +1,135 @@
+import base64
+import os
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Deque
+from typing import Tuple
+
+import google_crc32c
+
+# size of the byte ranges fetched concurrently, smaller blobs are downloaded in one request
+CHUNK_BYTES = 16 * 2**20
+MAX_WORKERS = 8
+
+
+def _download_ranges(
+    blob: Any, write: Callable[[int, bytes], None], chunk_bytes: int, max_workers: int
+) -> None:
+    # ranges are fetched concurrently but checksummed and written in order, at most two
+    # ranges per worker are held in memory
+    ranges = [
+        (start, min(start + chunk_bytes, blob.size) - 1)
+        for start in range(0, blob.size, chunk_bytes)
+    ]
+    checksum = google_crc32c.Checksum()
+
+    def fetch(byte_range: Tuple[int, int]) -> bytes:
+        # pinned to the generation the checksum belongs to, a concurrent upload fails the
+        # download instead of mixing two versions
+        return blob.download_as_bytes(
+            start=byte_range[0],
+            end=byte_range[1],
+            raw_download=True,
+            checksum=None,
+            if_generation_match=blob.generation,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download") as executor:
+        pending: Deque[Tuple[int, Future]] = deque()
+        remaining = iter(ranges)
+        for start, end in remaining:
+            pending.append((start, executor.submit(fetch, (start, end))))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            start, future = pending.popleft()
+            data = future.result()
+            checksum.update(data)
+            write(start, data)
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append((next_range[0], executor.submit(fetch, next_range)))
+
+    crc32c = base64.b64encode(checksum.digest()).decode()
+    if crc32c != blob.crc32c:
+        raise ValueError(
+            f"CRC32C of the downloaded {blob.name} is {crc32c}, expected {blob.crc32c}"
+        )
+
+
+def download_blob(
+    blob: Any, path: str, chunk_bytes: int = CHUNK_BYTES, max_workers: int = MAX_WORKERS
+) -> None:
+    """Function to download a blob into a file, fetching byte ranges of large blobs concurrently
+
+    The file is preallocated and every range written to its position as soon as it is its
+    turn, so the file can be memory-mapped afterwards without another copy. The CRC32C of the
+    downloaded bytes is verified against the blob's metadata. All requests are pinned to the
+    generation of that metadata.
+
+    Args:
+        blob (Any): google.cloud.storage.Blob to download, its metadata is fetched if missing
+        path (str): file to write to
+        chunk_bytes (int): size of the byte ranges fetched concurrently
+        max_workers (int): number of concurrent range requests
+
+    Raises:
+        ValueError: if the checksum of the downloaded file does not match
+        google.api_core.exceptions.PreconditionFailed: if the blob was overwritten since its
+            metadata was fetched
+    """
+    if blob.size is None or blob.crc32c is None:
+        blob.reload()
+    if blob.size <= chunk_bytes:
+        blob.download_to_filename(
+            path, raw_download=True, checksum="crc32c", if_generation_match=blob.generation
+        )
+        return
+
+    with open(path, "wb") as file:
+        fd = file.fileno()
+        os.ftruncate(fd, blob.size)
+
+        def write(offset: int, data: bytes) -> None:
+            os.pwrite(fd, data, offset)
+
+        _download_ranges(blob, write, chunk_bytes, max_workers)
+
+
+def download_blob_bytes(
+    blob: Any, chunk_bytes: int = CHUNK_BYTES, max_workers: int = MAX_WORKERS
+) -> memoryview:
+    """Function to download a blob into memory, fetching byte ranges concurrently
+
+    Args:
+        blob (Any): google.cloud.storage.Blob to download, its metadata is fetched if missing
+        chunk_bytes (int): size of the byte ranges fetched concurrently
+        max_workers (int): number of concurrent range requests
+
+    Returns:
+        memoryview: content of the blob, e.g. to unpickle without another copy
+
+    Raises:
+        ValueError: if the checksum of the downloaded bytes does not match
+        google.api_core.exceptions.PreconditionFailed: if the blob was overwritten since its
+            metadata was fetched
+    """
+    if blob.size is None or blob.crc32c is None:
+        blob.reload()
+    if blob.size <= chunk_bytes:
+        return memoryview(
+            blob.download_as_bytes(
+                raw_download=True, checksum="crc32c", if_generation_match=blob.generation
+            )
+        )
+
+    buffer = bytearray(blob.size)
+
+    def write(offset: int, data: bytes) -> None:
+        buffer[offset : offset + len(data)] = data
+
+    _download_ranges(blob, write, chunk_bytes, max_workers)
+    return memoryview(buffer)
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator
 from sklearn.base import TransformerMixin
@@ -12,6 +13,9 @@ class Featurizer(BaseEstimator, TransformerMixin):
         """
 
     def fit(self, X: pd.DataFrame, y: pd.Series = None) -> "Featurizer":
+        # record the input columns, e.g. to build synthetic batches for warm-up at inference time
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
         return self
 
     def transform(self, X: pd.DataFrame) -> pd.DataFrame:
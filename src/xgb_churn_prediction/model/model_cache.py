@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# default location and size limit of the local model cache, overridable by environment variables
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "xgb_churn_prediction")
+DEFAULT_MAX_MB = 4096
+
+
+def cache_key(*parts: str) -> str:
+    """Function to derive the cache key of a model artifact from what identifies its content
+
+    Args:
+        *parts (str): e.g. model resource name, model version and blob generation
+
+    Returns:
+        str: hex digest of the parts
+    """
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class ModelCache:
+    """Local on-disk cache of downloaded model artifacts.
+
+    Every entry is a directory named by a key derived from what identifies the artifact's
+    content, e.g. its blob generation, so an entry never has to be invalidated: a changed
+    artifact gets a different key. Entries are written into a temporary directory that is
+    renamed into place once complete, so concurrent loads never see partial downloads. Once
+    the cache exceeds `max_bytes`, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+        """Initializes a new instance of ModelCache.
+
+        Args:
+            directory (Optional[str]): directory of the cache, defaults to MODEL_CACHE_DIR or
+                `~/.cache/xgb_churn_prediction`
+            max_bytes (Optional[int]): size limit of the cache, defaults to MODEL_CACHE_MAX_MB
+                or 4096 MB
+        """
+        if directory is None:
+            directory = os.environ.get("MODEL_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("MODEL_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 2**20)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[str]:
+        """Function to look up a cached entry, marking it as recently used
+
+        Args:
+            key (str): cache key, see `cache_key`
+
+        Returns:
+            Optional[str]: directory of the entry, None if it is not cached
+        """
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, key: str, write: Callable[[str], None]) -> str:
+        """Function to add an entry, e.g. by downloading an artifact into it
+
+        Args:
+            key (str): cache key, see `cache_key`
+            write (Callable[[str], None]): function writing the files of the entry into the
+                directory it is given
+
+        Returns:
+            str: directory of the entry
+        """
+        path = os.path.join(self.directory, key)
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            write(staging)
+            os.rename(staging, path)
+        except OSError:
+            # another process added the same entry meanwhile, which has the same content
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+        return path
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """Function to list the complete entries of the cache
+
+        Returns:
+            List[Tuple[float, int, str]]: last use, size in bytes and key of every entry, least
+                recently used first
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            size = sum(file.stat().st_size for file in os.scandir(entry.path) if file.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.name))
+        return sorted(entries)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Function to remove least recently used entries until the cache fits its size limit
+
+        Args:
+            keep (Optional[str]): key of an entry to keep in any case, e.g. the one just added
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            logging.info(f"Evicting {key} from the local cache {self.directory}")
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= size
@@ -0,0 +1,294 @@
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+
+from .compiled_forest import CompiledForest
+from .compiled_forest import compile_pipeline
+
+
+@dataclass
+class OptimizationReport:
+    """Size, latency and metric of a forest before and after `optimize_model`.
+
+    Attributes:
+        n_trees_before (int): number of trees of the trained forest
+        n_trees_after (int): number of trees kept
+        n_nodes_before (int): number of nodes of the trained forest
+        n_nodes_after (int): number of nodes left after merging leaves and dropping trees
+        nbytes_before (int): size of the node arrays of the trained forest
+        nbytes_after (int): size of the node arrays of the optimized forest
+        latency_before_s (float): time to score the validation set with the trained forest
+        latency_after_s (float): time to score the validation set with the optimized forest
+        metric_before (float): validation metric of the trained forest
+        metric_after (float): validation metric of the optimized forest
+        max_proba_delta (float): largest change of a class probability on the validation set
+        downcast (Dict[str, str]): node arrays stored in a smaller dtype, by name
+    """
+
+    n_trees_before: int
+    n_trees_after: int
+    n_nodes_before: int
+    n_nodes_after: int
+    nbytes_before: int
+    nbytes_after: int
+    latency_before_s: float
+    latency_after_s: float
+    metric_before: float
+    metric_after: float
+    max_proba_delta: float
+    downcast: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Function to convert the report, e.g. to attach it to the model artifact's metadata
+
+        Returns:
+            Dict[str, Any]: report as dict
+        """
+        return dataclasses.asdict(self)
+
+
+def _select_nodes(forest: CompiledForest, keep: np.ndarray, roots: np.ndarray) -> CompiledForest:
+    # keeps the nodes of the mask in their order and renumbers the child and root indices
+    index = np.cumsum(keep, dtype=np.int32) - 1
+    missing = forest.missing_go_to_left
+    return CompiledForest(
+        feature=forest.feature[keep],
+        threshold=forest.threshold[keep],
+        left=index[forest.left[keep]],
+        right=index[forest.right[keep]],
+        value=forest.value[keep],
+        roots=index[roots],
+        max_depth=forest.max_depth,
+        classes=forest.classes_,
+        missing_go_to_left=None if missing is None else missing[keep],
+        feature_names_in=getattr(forest, "feature_names_in_", None),
+    )
+
+
+def merge_leaves(forest: CompiledForest) -> CompiledForest:
+    """Function to merge sibling leaves with identical class probabilities into their parent
+
+    Merging repeats bottom-up until no such pair is left, nodes that are no longer reachable are
+    removed. Predicted probabilities do not change.
+
+    Args:
+        forest (CompiledForest): compiled forest
+
+    Returns:
+        CompiledForest: compiled forest with the merged leaves
+    """
+    left, right = forest.left.copy(), forest.right.copy()
+    value = forest.value.copy()
+    node_ids = np.arange(len(left), dtype=left.dtype)
+    while True:
+        is_leaf = left == node_ids
+        mergeable = np.flatnonzero(
+            ~is_leaf & is_leaf[left] & is_leaf[right] & (value[left] == value[right]).all(axis=1)
+        )
+        if not mergeable.size:
+            break
+        value[mergeable] = value[left[mergeable]]
+        left[mergeable] = right[mergeable] = mergeable
+
+    reachable = np.zeros(len(left), dtype=bool)
+    frontier = forest.roots
+    while frontier.size:
+        reachable[frontier] = True
+        inner = frontier[left[frontier] != frontier]
+        frontier = np.concatenate([left[inner], right[inner]])
+
+    merged = CompiledForest(
+        feature=np.where(left == node_ids, 0, forest.feature).astype(forest.feature.dtype),
+        threshold=np.where(left == node_ids, 0.0, forest.threshold).astype(forest.threshold.dtype),
+        left=left,
+        right=right,
+        value=value,
+        roots=forest.roots,
+        max_depth=forest.max_depth,
+        classes=forest.classes_,
+        missing_go_to_left=forest.missing_go_to_left,
+        feature_names_in=getattr(forest, "feature_names_in_", None),
+    )
+    return _select_nodes(merged, reachable, forest.roots)
+
+
+def drop_trees(forest: CompiledForest, trees: np.ndarray) -> CompiledForest:
+    """Function to remove trees from a compiled forest
+
+    Args:
+        forest (CompiledForest): compiled forest
+        trees (np.ndarray): indices of the trees to remove
+
+    Returns:
+        CompiledForest: compiled forest of the remaining trees
+    """
+    bounds = np.append(forest.roots, len(forest.feature))
+    tree_of_node = np.repeat(np.arange(len(forest.roots)), np.diff(bounds))
+    kept = np.setdiff1d(np.arange(len(forest.roots)), trees)
+    return _select_nodes(forest, np.isin(tree_of_node, kept), forest.roots[kept])
+
+
+def downcast_thresholds(forest: CompiledForest) -> CompiledForest:
+    """Function to store thresholds as float32 and feature indices in the smallest integer type
+
+    Inputs are compared as float32, so every threshold is rounded down to the largest float32
+    not above it, which sends every float32 input down the same branch as before.
+
+    Args:
+        forest (CompiledForest): compiled forest
+
+    Returns:
+        CompiledForest: compiled forest with the same predictions and smaller node arrays
+    """
+    threshold = forest.threshold.astype(np.float32)
+    rounded_up = threshold.astype(np.float64) > forest.threshold
+    threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+    n_features = int(forest.feature.max()) + 1 if len(forest.feature) else 0
+    feature_dtype = np.int16 if n_features <= np.iinfo(np.int16).max else forest.feature.dtype
+    return _replace(forest, feature=forest.feature.astype(feature_dtype), threshold=threshold)
+
+
+def _replace(forest: CompiledForest, **arrays: np.ndarray) -> CompiledForest:
+    # compiled forest with some of its node arrays replaced
+    def array(name: str) -> Any:
+        return arrays.get(name, getattr(forest, name))
+
+    return CompiledForest(
+        feature=array("feature"),
+        threshold=array("threshold"),
+        left=array("left"),
+        right=array("right"),
+        value=array("value"),
+        roots=array("roots"),
+        max_depth=forest.max_depth,
+        classes=forest.classes_,
+        missing_go_to_left=array("missing_go_to_left"),
+        feature_names_in=getattr(forest, "feature_names_in_", None),
+    )
+
+
+def _latency(forest: CompiledForest, X: np.ndarray, repeats: int) -> float:
+    # best of several runs, the least disturbed by other processes
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        forest.predict_proba(X)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def _ranked_trees(
+    forest: CompiledForest, X: np.ndarray, y: Any, metric: Callable[[Any, Any], float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    # trees ordered by the metric of the forest without them, best first, and the class
+    # probabilities of every tree for every row of the validation set
+    proba = forest.value[forest.apply(X)]
+    total = proba.sum(axis=1)
+    scores = [
+        metric(y, forest.classes_.take(np.argmax(total - proba[:, tree], axis=1)))
+        for tree in range(proba.shape[1])
+    ]
+    return np.argsort(scores, kind="stable")[::-1], proba
+
+
+def optimize_model(
+    model: Any,
+    X_validation: Any,
+    y_validation: Any,
+    metric: Callable[[Any, Any], float] = accuracy_score,
+    tolerance: float = 0.0,
+    drop: bool = False,
+    min_trees: int = 1,
+    repeats: int = 5,
+) -> Tuple[Any, OptimizationReport]:
+    """Function to shrink a trained forest before saving it, checked on a validation set
+
+    The forest is compiled and its sibling leaves with identical probabilities are merged and
+    thresholds downcast to float32, neither of which changes any prediction. Node probabilities
+    are downcast to float32 if the predicted labels on the validation set stay the same. With
+    `drop`, the trees whose removal costs the least are removed one by one as long as the metric
+    stays within `tolerance` of the trained forest's.
+
+    Args:
+        model (Any): fitted forest or Pipeline ending in one, e.g. from `train_model`
+        X_validation (Any): validation features, as passed to the model
+        y_validation (Any): validation labels
+        metric (Callable[[Any, Any], float]): metric of true and predicted labels, higher is
+            better
+        tolerance (float): how much the metric may decrease by dropping trees
+        drop (bool): whether to drop trees
+        min_trees (int): number of trees to keep at least
+        repeats (int): number of runs to measure the latency of scoring the validation set
+
+    Returns:
+        Tuple[Any, OptimizationReport]: model with the optimized CompiledForest as final step
+            and the report of size, latency and metric deltas
+
+    Raises:
+        ValueError: if the model does not end in a forest that can be compiled
+    """
+    compiled = compile_pipeline(model)
+    forest = compiled.steps[-1][1] if isinstance(compiled, Pipeline) else compiled
+    if not isinstance(forest, CompiledForest):
+        raise ValueError(f"Cannot optimize {type(forest).__name__}, expected a fitted forest")
+    X = compiled[:-1].transform(X_validation) if isinstance(compiled, Pipeline) else X_validation
+    X = forest._to_array(X)
+
+    proba_before = forest.predict_proba(X)
+    labels_before = forest.classes_.take(np.argmax(proba_before, axis=1))
+    metric_before = float(metric(y_validation, labels_before))
+
+    optimized = downcast_thresholds(merge_leaves(forest))
+    downcast = {
+        "threshold": str(optimized.threshold.dtype),
+        "feature": str(optimized.feature.dtype),
+    }
+    candidate = _replace(optimized, value=optimized.value.astype(np.float32))
+    if np.array_equal(candidate.predict(X), labels_before):
+        optimized = candidate
+        downcast["value"] = "float32"
+
+    if drop:
+        ranking, proba = _ranked_trees(optimized, X, y_validation, metric)
+        total = proba.sum(axis=1)
+        dropped = 0
+        for tree in ranking[: len(ranking) - min_trees]:
+            total = total - proba[:, tree]
+            labels = optimized.classes_.take(np.argmax(total, axis=1))
+            if metric(y_validation, labels) < metric_before - tolerance:
+                break
+            dropped += 1
+        if dropped:
+            optimized = drop_trees(optimized, ranking[:dropped])
+
+    proba_after = optimized.predict_proba(X)
+    report = OptimizationReport(
+        n_trees_before=len(forest.roots),
+        n_trees_after=len(optimized.roots),
+        n_nodes_before=len(forest.feature),
+        n_nodes_after=len(optimized.feature),
+        nbytes_before=forest.nbytes,
+        nbytes_after=optimized.nbytes,
+        latency_before_s=_latency(forest, X, repeats),
+        latency_after_s=_latency(optimized, X, repeats),
+        metric_before=metric_before,
+        metric_after=float(
+            metric(y_validation, optimized.classes_.take(np.argmax(proba_after, axis=1)))
+        ),
+        max_proba_delta=float(np.abs(proba_after - proba_before).max(initial=0.0)),
+        downcast=downcast,
+    )
+    logging.info(f"Optimized the forest: {report}")
+    if isinstance(compiled, Pipeline):
+        return Pipeline(compiled.steps[:-1] + [(compiled.steps[-1][0], optimized)]), report
+    return optimized, report
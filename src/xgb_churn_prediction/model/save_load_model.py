@@ -1,71 +1,163 @@
+import logging
+import os
 import pickle
 from typing import Any
+from typing import Optional
 from typing import Tuple
 
 from google.cloud import aiplatform
-from google.cloud import storage
 
-# Define type of model file, e.g.
+from ..clients import storage_client
+from .artifact import BLOB_TYPE
+from .artifact import MANIFEST_TYPE
+from .artifact import decompress_artifact
+from .artifact import load_artifact
+from .artifact import save_artifact
+from .artifact import verify_artifact
+from .compression import check_codec
+from .compression import compressed_writer
+from .compression import decompress_file
+from .compression import decompressed_reader
+from .download import download_blob
+from .model_cache import ModelCache
+from .model_cache import cache_key
+
+# Define type of model file for models that cannot be saved as artifact (manifest and arrays)
 TYPE = "pkl"
 
 
-def save_model(model: Any, path: str) -> None:
+def save_model(
+    model: Any,
+    path: str,
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+    threads: int = 0,
+) -> None:
     """Function to save the model to a dedicated path
 
+    Forests and Pipelines ending in a forest are saved in the artifact format, a manifest
+    `<path>.json` and memory-mappable array blobs `<path>.bin`, any other model is pickled to
+    `<path>.pkl`. With a compression codec the blobs or the pickle are compressed, which makes
+    upload, storage and download smaller. Loading decompresses artifacts with the codec recorded
+    in their manifest and detects the codec of a pickle from the file itself.
+
     Args:
         model (Any): Model to be saved
         path (str): Path where model should be saved to
+        compression (Optional[str]): codec to compress with, one of `compression.CODECS`,
+            uncompressed if None
+        level (Optional[int]): compression level, the default of the codec if None
+        threads (int): number of threads compressing in parallel, -1 for one per core, only
+            used by zstd
 
     Returns:
         None
 
+    Raises:
+        ValueError: if the codec is unknown or its package is not installed
     """
+    if compression is not None:
+        check_codec(compression)
+    try:
+        save_artifact(model, path, compression=compression, level=level, threads=threads)
+        return
+    except ValueError as e:
+        logging.warning(f"Saving the model as pickle: {e}")
+
     path = f"{path}.{TYPE}"
 
     with open(path, "wb") as file:
-        pickle.dump(model, file)
+        if compression is None:
+            pickle.dump(model, file)
+            return
+        with compressed_writer(file, compression, level, threads) as writer:
+            pickle.dump(model, writer)
 
 
-def load_model(path: str) -> Any:
+def load_model(path: str, compiled: bool = False, verify_checksum: bool = True) -> Any:
     """Function to load the model from a dedicated path
 
     Args:
         path (str): Path to load model from
+        compiled (bool): whether to load the forest of an artifact as CompiledForest, which is
+            faster for few rows per call, instead of RandomForestClassifier
+        verify_checksum (bool): whether to check the blob file of an artifact against the
+            model version in its manifest, which reads the whole file
 
     Returns:
         Any: Loaded model
+
+    Raises:
+        ValueError: if the blob file of an artifact does not match its manifest
     """
+    if os.path.exists(f"{path}.{MANIFEST_TYPE}"):
+        return load_artifact(path, compiled=compiled, verify_checksum=verify_checksum)
+
     path = f"{path}.{TYPE}"
 
-    with open(path, "rb") as file:
-        model = pickle.load(file)
+    with open(path, "rb") as file, decompressed_reader(file) as reader:
+        model = pickle.load(reader)
 
     return model
 
 
-def load_model_from_gcs(model_name: str) -> Tuple[Any, str]:
+def load_model_from_gcs(model_name: str, cache: Optional[ModelCache] = None) -> Tuple[Any, str]:
     """Function to load model file from gcs
 
+    Downloaded artifacts are kept in a local cache keyed by model resource name, version and
+    blob generation, so loading an unchanged model again only costs the metadata calls to
+    resolve the model and the generation of its artifact. The blob file of an artifact is
+    checked against the checksum in its manifest before it is cached, so a download
+    overlapping with an upload is not cached as a mix of two versions.
+
     Args:
         model_name (str): model as resource name
+        cache (Optional[ModelCache]): local cache of downloaded artifacts, see ModelCache for
+            the default location and size limit
 
     Returns:
         Tuple[Any, str]: tuple of model and its model version
+
+    Raises:
+        ValueError: if the downloaded blob file does not match the manifest of the artifact
     """
     # Get default model
     vertex_model = aiplatform.Model(model_name=model_name)
-    # Create a client to interact with Google Cloud Storage
-    client = storage.Client()
+    cache = cache if cache is not None else ModelCache()
+    # Get the shared client to interact with Google Cloud Storage
+    client = storage_client()
     # Get the bucket and blob names from the artifact URI
-    bucket_name, blob_name = f"{vertex_model.uri}model.{TYPE}".replace("gs://", "").split("/", 1)
-    # Get the blob object
-    bucket = client.get_bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-    # Download the blob to a local file
-    local_path = f"model.{TYPE}"
-    blob.download_to_filename(local_path)
-    # Load the pickle file
-    with open(local_path, "rb") as file:
-        trained_model = pickle.load(file)
-
-    return trained_model, vertex_model.version_id
+    bucket_name, prefix = f"{vertex_model.uri}model".replace("gs://", "").split("/", 1)
+    # Get the bucket object without a request, blobs are fetched with their metadata
+    bucket = client.bucket(bucket_name)
+    # The manifest of an artifact (manifest and array blobs) is written last and versions it,
+    # models saved as pickle have a single blob
+    blob = bucket.get_blob(f"{prefix}.{MANIFEST_TYPE}")
+    if blob is not None:
+        blobs = [bucket.blob(f"{prefix}.{BLOB_TYPE}"), blob]
+    else:
+        blob = bucket.get_blob(f"{prefix}.{TYPE}")
+        if blob is None:
+            raise FileNotFoundError(f"No model artifact found at {vertex_model.uri}")
+        blobs = [blob]
+
+    key = cache_key(model_name, str(vertex_model.version_id), blob.name, str(blob.generation))
+    path = cache.get(key)
+    if path is None:
+        logging.info(f"Downloading model {model_name} version {vertex_model.version_id}")
+
+        def download(directory: str) -> None:
+            for model_blob in blobs:
+                suffix = model_blob.name.rsplit(".", 1)[-1]
+                download_blob(model_blob, os.path.join(directory, f"model.{suffix}"))
+            # cached uncompressed, so artifacts can be memory-mapped on every later load
+            if len(blobs) > 1:
+                decompress_artifact(os.path.join(directory, "model"))
+                verify_artifact(os.path.join(directory, "model"))
+            else:
+                decompress_file(os.path.join(directory, f"model.{TYPE}"))
+
+        path = cache.put(key, download)
+
+    # artifacts are verified before they are cached
+    return load_model(os.path.join(path, "model"), verify_checksum=False), vertex_model.version_id
@@ -9,6 +9,9 @@ import numpy as np
 from google.cloud import bigquery
 from google.cloud import monitoring_v3
 
+from ..clients import bigquery_client
+from ..clients import metric_service_client
+
 
 def python_type_to_bq_type(input_type: type, default: Optional[str] = None) -> str:
     type_map = {int: "INT64", float: "FLOAT64", bool: "BOOL", str: "STRING", np.float64: "FLOAT64"}
@@ -61,7 +64,7 @@ def write_metrics_to_table(
         **metrics,
     }
 
-    bq_client = bigquery.Client(project=project)
+    bq_client = bigquery_client(project)
     job_config = bigquery.LoadJobConfig()
     job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
     job_config.create_disposition = bigquery.CreateDisposition.CREATE_IF_NEEDED
@@ -120,8 +123,8 @@ def write_metrics_to_cloud_monitoring(
     # Define the type prefix for metric names
     type_prefix = f"custom.googleapis.com/machine_learning/monitoring/{prefix}"
 
-    # Initialize a Cloud Monitoring client
-    monitor_client = monitoring_v3.MetricServiceClient()
+    # Get the shared Cloud Monitoring client
+    monitor_client = metric_service_client()
 
     # Iterate through the metrics and create time series
     for name, value in metrics.items():
@@ -5,6 +5,17 @@ from pytest import fixture
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.pipeline import Pipeline
 
+from xgb_churn_prediction import clients
+
+
+@fixture(autouse=True)
+def fresh_clients():
+    """Drop shared cloud clients before and after every test, so tests patching or faking a
+    client never see a client created by another test"""
+    clients.reset()
+    yield
+    clients.reset()
+
 
 @fixture()
 def dummy_model(tmp_path):
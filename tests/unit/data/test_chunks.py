@@ -0,0 +1,50 @@
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from xgb_churn_prediction.data.chunks import prefetch
+from xgb_churn_prediction.data.chunks import rechunk
+
+
+def test_rechunk_bounds_rows_and_bytes():
+    """Test that batches of any size are regrouped into chunks of bounded rows and bytes"""
+    batches = [
+        pa.record_batch({"x": np.arange(start, start + n)})
+        for start, n in [(0, 5), (5, 0), (5, 23), (28, 2)]
+    ]
+
+    by_rows = list(rechunk(batches, chunk_rows=8))
+    by_bytes = list(rechunk(batches, chunk_bytes=80))
+
+    assert [chunk.num_rows for chunk in by_rows] == [8, 8, 8, 6]
+    assert [chunk.num_rows for chunk in by_bytes] == [10, 10, 10]
+    assert pa.concat_tables(by_rows)["x"].to_pylist() == list(range(30))
+    with pytest.raises(ValueError):
+        list(rechunk(batches))
+
+
+def test_prefetch_runs_ahead_and_raises_errors():
+    """Test that prefetching keeps the order, stays bounded and passes on producer errors"""
+    produced = []
+    started = threading.Event()
+
+    def items():
+        for item in range(10):
+            produced.append(item)
+            started.set()
+            yield item
+        raise RuntimeError("query failed")
+
+    iterator = prefetch(items(), depth=2)
+    started.wait(timeout=5)
+
+    assert next(iterator) == 0
+    assert len(produced) <= 4
+    rest = []
+    with pytest.raises(RuntimeError):
+        for item in iterator:
+            rest.append(item)
+    assert rest == list(range(1, 10))
+    assert list(prefetch(range(3), depth=0)) == [0, 1, 2]
@@ -1,7 +1,19 @@
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pytest
+from google.cloud.bigquery.table import RowIterator
 
+from benchmarks.fake_bq_storage import FakeReadClient
+from xgb_churn_prediction.data.data_ingestion import build_query
 from xgb_churn_prediction.data.data_ingestion import create_data_query
 from xgb_churn_prediction.data.data_ingestion import execute_bq_query
+from xgb_churn_prediction.data.data_ingestion import iter_bq_query
+from xgb_churn_prediction.data.data_ingestion import projected_columns
+from xgb_churn_prediction.data.data_ingestion import sql_literal
 
 
 def test_create_data_query():
@@ -19,6 +31,53 @@ def test_create_data_query():
     assert query == expected_query
 
 
+def test_build_query():
+    """Test that queries read only the declared columns and matching rows"""
+    columns = projected_columns(["feature_2", "feature_1"], ["label", "feature_1"])
+
+    projected = build_query("project.data.table", columns, {"split": "TEST"}, exclude=["split"])
+    filtered = build_query("project.data.table", filters={"split": ["TRAIN", "it's"]}, limit=10)
+    all_columns = projected_columns(["feature_1"], None)
+
+    assert (
+        projected
+        == """
+        SELECT `feature_2`, `feature_1`, `label`
+        FROM `project.data.table`
+        WHERE `split` = 'TEST'
+    """
+    )
+    assert (
+        filtered
+        == """
+        SELECT *
+        FROM `project.data.table`
+        WHERE `split` IN ('TRAIN', 'it\\'s')
+        LIMIT 10
+    """
+    )
+    assert all_columns is None
+
+
+def test_build_query_empty_projection():
+    """Test that a query without columns to read is rejected"""
+    with pytest.raises(ValueError):
+        build_query("project.data.table", columns=[])
+    with pytest.raises(ValueError):
+        build_query("project.data.table", columns=["split"], exclude=["split"])
+
+
+def test_sql_literal():
+    """Test that values are rendered as valid BigQuery literals"""
+    assert sql_literal(None) == "NULL"
+    assert sql_literal(np.bool_(True)) == "TRUE"
+    assert sql_literal(np.int64(3)) == "3"
+    assert sql_literal(0.5) == "0.5"
+    assert sql_literal(float("nan")) == "CAST('NaN' AS FLOAT64)"
+    assert sql_literal(np.float32("inf")) == "CAST('inf' AS FLOAT64)"
+    assert sql_literal(float("-inf")) == "CAST('-inf' AS FLOAT64)"
+
+
 def test_execute_bq_query(mocker):
     # Set test values
     project = "test"
@@ -41,3 +100,92 @@ def test_execute_bq_query(mocker):
 
     # Check that the columns and values of the dataframe are correct
     assert df.equals(df_expected)
+
+
+def test_execute_bq_query_storage_api(mocker):
+    """Test reading a query result in parallel arrow streams with dtypes applied while reading"""
+    table = "projects/test/datasets/_anon/tables/result"
+    data = pa.table(
+        {
+            "id": np.arange(1000),
+            "column_1": np.arange(1000) % 7,
+            "amount": np.linspace(0, 1, 1000),
+            "segment": pa.array(["a", "b", None, "c"] * 250),
+        }
+    )
+    read_client = FakeReadClient(batch_rows=128)
+    read_client.put(table, data)
+    read_client.put(f"{table}_empty", data.slice(0, 0))
+    mock_client = mocker.patch("google.cloud.bigquery.Client")
+    query_job = mock_client.return_value.query.return_value
+    query_job.destination = SimpleNamespace(project="test", dataset_id="_anon", table_id="result")
+    dtypes = {"column_1": str, "amount": "float32", "segment": "category", "id": "Int32"}
+
+    df = execute_bq_query(
+        "test", "SELECT 1", dtypes, use_storage_api=True, read_client=read_client, max_streams=3
+    )
+    arrow_df = execute_bq_query(
+        "test", "SELECT 1", use_storage_api=True, read_client=read_client, arrow_backed=True
+    )
+    query_job.destination.table_id = "result_empty"
+    empty = execute_bq_query("test", "SELECT 1", dtypes, True, read_client)
+
+    expected = data.to_pandas().astype(dtypes)
+    assert df.sort_values("id").reset_index(drop=True).equals(expected)
+    assert dict(df.dtypes) == dict(expected.dtypes)
+    assert isinstance(arrow_df["amount"].dtype, pd.ArrowDtype)
+    assert len(empty) == 0 and str(empty["amount"].dtype) == "float32"
+
+
+def test_iter_bq_query(mocker):
+    """Test iterating over a query result in chunks of bounded rows with dtypes applied"""
+    data = pa.table({"id": np.arange(1000), "column_1": np.arange(1000) % 7})
+    read_client = FakeReadClient(batch_rows=300)
+    read_client.put("projects/test/datasets/_anon/tables/result", data)
+    mock_client = mocker.patch("google.cloud.bigquery.Client")
+    query_job = mock_client.return_value.query.return_value
+    query_job.destination = SimpleNamespace(project="test", dataset_id="_anon", table_id="result")
+    query_job.result.return_value.to_arrow_iterable.return_value = iter(data.to_batches(250))
+
+    chunks = list(
+        iter_bq_query(
+            "test",
+            "SELECT 1",
+            {"column_1": str},
+            chunk_rows=400,
+            use_storage_api=True,
+            read_client=read_client,
+        )
+    )
+    rest_chunks = list(iter_bq_query("test", "SELECT 1", chunk_rows=400, prefetch_chunks=0))
+
+    assert [len(chunk) for chunk in chunks] == [400, 400, 200]
+    assert [len(chunk) for chunk in rest_chunks] == [400, 400, 200]
+    assert pd.concat(chunks, ignore_index=True).equals(data.to_pandas().astype({"column_1": str}))
+
+
+def test_iter_bq_query_dtypes_match_to_dataframe(mocker):
+    """Test that REST chunks have the dtypes of the unchunked result, e.g. Int64 with NULLs"""
+    data = pa.table(
+        {
+            "id": pa.array([1, None, 3, 4]),
+            "flag": pa.array([True, None, False, True]),
+            "day": pa.array([datetime.date(2024, 1, day) for day in range(1, 5)]),
+            "amount": pa.array([0.5, None, 1.0, 2.0]),
+            "name": pa.array(["a", None, "c", "d"]),
+        }
+    )
+    rows = RowIterator(client=None, api_request=None, path=None, schema=[])
+    mocker.patch.object(RowIterator, "to_arrow", return_value=data)
+    mocker.patch.object(RowIterator, "to_arrow_iterable", return_value=iter(data.to_batches(2)))
+    mock_client = mocker.patch("google.cloud.bigquery.Client")
+    mock_client.return_value.query.return_value.result.return_value = rows
+
+    for dtypes in (None, {"amount": "float32"}):
+        expected = execute_bq_query("test", "SELECT 1", dtypes)
+        mocker.patch.object(RowIterator, "to_arrow_iterable", return_value=iter(data.to_batches(2)))
+        chunks = list(iter_bq_query("test", "SELECT 1", dtypes, chunk_rows=2, prefetch_chunks=0))
+
+        assert len(chunks) == 2
+        assert dict(chunks[0].dtypes) == dict(expected.dtypes)
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
@@ -2,6 +2,7 @@ import pandas as pd
 from google.cloud import bigquery
 
 from xgb_churn_prediction.data.data_output import output_data
+from xgb_churn_prediction.data.data_output import table_schema
 
 
 def test_output_data(mocker):
@@ -28,3 +29,17 @@ def test_output_data(mocker):
 
     # Assert that the job was waited for
     mock_job.result.assert_called_once_with()
+
+
+def test_table_schema(mocker):
+    """Test that the schema of a table is returned as output_data takes it"""
+    mock_client = mocker.patch("google.cloud.bigquery.Client")
+    mock_client.return_value.get_table.return_value = bigquery.Table(
+        "test_project.test_dataset.test_table",
+        schema=[bigquery.SchemaField("id", "STRING"), bigquery.SchemaField("score", "FLOAT")],
+    )
+
+    schema = table_schema("test_project", "test_dataset.test_table")
+
+    assert schema == [("id", "STRING"), ("score", "FLOAT")]
+    mock_client.return_value.get_table.assert_called_once_with("test_dataset.test_table")
@@ -0,0 +1,181 @@
+from datetime import date
+from datetime import datetime
+from datetime import time
+from datetime import timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from xgb_churn_prediction.data.data_ingestion import execute_bq_query
+from xgb_churn_prediction.data.data_ingestion import iter_bq_query
+from xgb_churn_prediction.data.query_cache import QueryCache
+from xgb_churn_prediction.data.query_cache import normalize_sql
+from xgb_churn_prediction.data.query_cache import query_cache_key
+
+
+class FakeTables:
+    """Stand-in for the table metadata a dry run of a query resolves"""
+
+    def __init__(self, **tables):
+        self.tables = {
+            name: SimpleNamespace(
+                modified=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                streaming_buffer=None,
+                table_type="TABLE",
+            )
+            for name in tables
+        }
+        self.references = [
+            SimpleNamespace(path=f"/projects/test/datasets/data/tables/{name}", name=name)
+            for name in tables
+        ]
+
+    def install(self, client):
+        client.query.side_effect = self.query
+        client.get_table.side_effect = lambda reference: self.tables[reference.name]
+
+    def query(self, sql_query, job_config=None):
+        if job_config is not None and job_config.dry_run:
+            return SimpleNamespace(referenced_tables=self.references)
+        return self.job
+
+    def touch(self, name):
+        self.tables[name].modified = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+def test_normalize_sql():
+    """Test that formatting and comments are removed outside of literals"""
+    query = """
+        -- training rows
+        SELECT *  # all columns
+        FROM `project.data.table`   /* multi
+        line */ WHERE split = 'TRAIN  -- not a comment';
+    """
+
+    normalized = normalize_sql(query)
+
+    assert normalized == (
+        "SELECT * FROM `project.data.table` WHERE split = 'TRAIN  -- not a comment'"
+    )
+
+
+def test_query_cache_key(mocker):
+    """Test that keys change with tables and dtypes and nondeterministic queries are not cached"""
+    client = mocker.Mock()
+    tables = FakeTables(features=True)
+    tables.install(client)
+    query = "SELECT * FROM `data.features` WHERE split = 'TRAIN'"
+
+    key = query_cache_key(client, query, {"column_1": str})
+    reformatted = query_cache_key(client, f"  {query}\n", {"column_1": str})
+    other_dtypes = query_cache_key(client, query)
+    tables.touch("features")
+    modified = query_cache_key(client, query, {"column_1": str})
+    random = query_cache_key(client, "SELECT * FROM `data.features` ORDER BY rand() LIMIT 10")
+    tables.tables["features"].streaming_buffer = SimpleNamespace(estimated_rows=10)
+    streamed = query_cache_key(client, query)
+
+    assert key == reformatted
+    assert len({key, other_dtypes, modified}) == 3
+    assert random is None and streamed is None
+
+
+@pytest.mark.parametrize("use_storage_api", [False, True])
+def test_execute_bq_query_cache(mocker, tmp_path, use_storage_api):
+    """Test that a repeated query is read from the cache until its table changes"""
+    df = pd.DataFrame({"id": np.arange(100), "column_1": np.arange(100) % 7, "segment": "a"})
+    dtypes = {"column_1": str, "segment": "category"}
+    client = mocker.patch("google.cloud.bigquery.Client").return_value
+    tables = FakeTables(features=True)
+    tables.install(client)
+    tables.job = mocker.Mock()
+    tables.job.result.return_value.to_dataframe.return_value = df.astype(dtypes)
+    mocker.patch(
+        "xgb_churn_prediction.data.data_ingestion.read_table", return_value=df.astype(dtypes)
+    )
+    cache = QueryCache(str(tmp_path), max_bytes=2**20)
+    query = "SELECT * FROM `data.features`"
+
+    first = execute_bq_query("test", query, dtypes, use_storage_api, cache=cache)
+    second = execute_bq_query("test", query, dtypes, use_storage_api, cache=cache)
+    runs = tables.job.result.call_count
+    tables.touch("features")
+    execute_bq_query("test", query, dtypes, use_storage_api, cache=cache)
+
+    assert runs == 1 and tables.job.result.call_count == 2
+    assert second.equals(first)
+    assert dict(second.dtypes) == dict(first.dtypes)
+    assert len(cache.entries()) == 2
+
+
+def test_execute_bq_query_cache_dtypes(mocker, tmp_path):
+    """Test that a cache hit returns the dtypes of a miss, incl. the db-dtypes of the REST API"""
+    df = pd.DataFrame(
+        {
+            "day": pd.Series([date(2024, 1, 1), None], dtype="dbdate"),
+            "hour": pd.Series([time(1, 30), time(2, 0)], dtype="dbtime"),
+            "count": pd.Series([1, None], dtype="Int64"),
+            "churned": pd.Series([True, None], dtype="boolean"),
+            "segment": pd.Series(["a", "b"], dtype="category"),
+        }
+    )
+    client = mocker.patch("google.cloud.bigquery.Client").return_value
+    tables = FakeTables(features=True)
+    tables.install(client)
+    tables.job = mocker.Mock()
+    tables.job.result.return_value.to_dataframe.return_value = df
+    cache = QueryCache(str(tmp_path), max_bytes=2**20)
+    query = "SELECT * FROM `data.features`"
+
+    # arrow-backed columns only apply to the Storage Read API, neither to misses nor to hits
+    miss = execute_bq_query("test", query, {"segment": "category"}, arrow_backed=True, cache=cache)
+    hit = execute_bq_query("test", query, {"segment": "category"}, arrow_backed=True, cache=cache)
+
+    assert tables.job.result.call_count == 1
+    assert dict(hit.dtypes) == dict(miss.dtypes)
+    pd.testing.assert_frame_equal(hit, miss)
+
+
+def test_execute_bq_query_cache_write_is_best_effort(mocker, tmp_path):
+    """Test that a result arrow cannot represent is returned without being cached"""
+    df = pd.DataFrame({"mixed": [1, "a", 2.5]})
+    client = mocker.patch("google.cloud.bigquery.Client").return_value
+    tables = FakeTables(features=True)
+    tables.install(client)
+    tables.job = mocker.Mock()
+    tables.job.result.return_value.to_dataframe.return_value = df
+    cache = QueryCache(str(tmp_path), max_bytes=2**20)
+
+    result = execute_bq_query("test", "SELECT * FROM `data.features`", cache=cache)
+
+    assert result is df
+    assert cache.entries() == []
+
+
+def test_iter_bq_query_cache(mocker, tmp_path, monkeypatch):
+    """Test that chunks are cached once fully read and read back from the cache in chunks"""
+    data = pa.table({"id": np.arange(1000), "column_1": np.arange(1000) % 7})
+    client = mocker.patch("google.cloud.bigquery.Client").return_value
+    tables = FakeTables(inference=True)
+    tables.install(client)
+    tables.job = mocker.Mock()
+    tables.job.result.return_value.to_arrow_iterable.side_effect = lambda: iter(
+        data.to_batches(250)
+    )
+    monkeypatch.setenv("QUERY_CACHE_DIR", str(tmp_path))
+    query = "SELECT * FROM `data.inference`"
+
+    partial = iter_bq_query("test", query, chunk_rows=400, prefetch_chunks=0)
+    next(partial)
+    partial.close()
+    partly_cached = len(QueryCache().entries())
+    first = list(iter_bq_query("test", query, {"column_1": str}, chunk_rows=400))
+    second = list(iter_bq_query("test", query, {"column_1": str}, chunk_rows=400))
+
+    assert partly_cached == 0
+    assert tables.job.result.call_count == 2
+    assert [len(chunk) for chunk in second] == [400, 400, 200]
+    assert pd.concat(second, ignore_index=True).equals(pd.concat(first, ignore_index=True))
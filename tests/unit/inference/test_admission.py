@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from xgb_churn_prediction.inference.admission import AdmissionController
+from xgb_churn_prediction.inference.admission import AdmissionRejected
+from xgb_churn_prediction.inference.admission import parse_deadline
+
+
+def test_admission_limits_inflight_rows():
+    """Test that requests beyond the row limit wait, and are rejected once the queue is full"""
+    admission = AdmissionController(max_inflight_rows=10, max_queued=1)
+    admission.admit(8)
+    admitted = threading.Event()
+    waiting = threading.Thread(target=lambda: (admission.admit(5), admitted.set()))
+    waiting.start()
+    time.sleep(0.05)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(1)
+    assert rejected.value.status == 429
+    assert not admitted.is_set()
+
+    admission.release(8, 0.008)
+    waiting.join(timeout=5)
+    assert admitted.is_set()
+    assert admission.snapshot() == {
+        "inflight_rows": 5,
+        "inflight_requests": 1,
+        "queued": 0,
+        "admitted": 2,
+        "rejected_queue_full": 1,
+        "rejected_deadline": 0,
+    }
+    # a request larger than the limit is admitted on its own
+    admission.release(5)
+    admission.admit(50)
+
+
+def test_admission_deadline():
+    """Test that requests that cannot make their deadline are rejected with a 503"""
+    admission = AdmissionController(max_inflight_rows=1)
+    admission.admit(1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(1, parse_deadline("20", time.monotonic()))
+    assert rejected.value.status == 503
+    assert admission.snapshot()["queued"] == 0
+
+    # 1ms per row expected from the released request, 100 rows do not fit into 50ms
+    admission.release(1, 0.001)
+    with pytest.raises(AdmissionRejected):
+        admission.admit(100, parse_deadline("50", time.monotonic()))
+    admission.admit(10, parse_deadline("50", time.monotonic()))
+
+    assert parse_deadline("", 100.0) is None
+    assert parse_deadline("", 100.0, default_ms=500) == 100.5
+    with pytest.raises(ValueError):
+        parse_deadline("soon", 100.0)
+
+
+def test_admission_async():
+    """Test that requests waiting on the event loop are admitted once capacity is released"""
+    admission = AdmissionController(max_inflight_rows=1)
+
+    async def scenario():
+        await admission.admit_async(1)
+        waiting = asyncio.ensure_future(admission.admit_async(1))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        admission.release(1)
+        await asyncio.wait_for(waiting, timeout=5)
+
+    asyncio.run(scenario())
+
+    assert admission.snapshot()["inflight_requests"] == 1
+
+
+def test_admission_precheck():
+    """Test that full queues and missed deadlines are rejected before the body is read"""
+    admission = AdmissionController(max_inflight_rows=10, max_queued=0)
+    admission.admit(8)
+
+    admission.precheck(2)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.precheck(5)
+    assert rejected.value.status == 429
+
+    admission.release(8, 0.008)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.precheck(100, parse_deadline("50", time.monotonic()))
+    assert rejected.value.status == 503
+    # nothing is reserved by the precheck
+    assert admission.snapshot()["inflight_rows"] == 0
+
+
+def test_admission_expected_rows():
+    """Test that rows come from the header, else are estimated from the size of past bodies"""
+    admission = AdmissionController()
+    body_format = ("application/json", "gzip")
+
+    assert admission.expected_rows("", body_format, 1000) == 0
+    admission.observe_body(body_format, 1000, 100)
+
+    assert admission.expected_rows("", body_format, 5000) == 500
+    assert admission.expected_rows("", ("application/json", ""), 5000) == 0
+    assert admission.expected_rows("", body_format, None) == 0
+    assert admission.expected_rows("7", body_format, 5000) == 7
+    with pytest.raises(ValueError):
+        admission.expected_rows("-1", body_format, 5000)
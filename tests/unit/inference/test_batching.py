@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xgb_churn_prediction.inference.batching import MicroBatcher
+
+
+def test_micro_batcher_returns_own_slice():
+    """Test that concurrent requests are coalesced and each caller gets its own rows"""
+    calls = []
+
+    def predict_fn(data):
+        calls.append(len(data))
+        return data["x"].to_numpy() * 2
+
+    batcher = MicroBatcher(predict_fn, max_wait_ms=50, max_rows=1000)
+    frames = [pd.DataFrame({"x": np.arange(i * 10, i * 10 + 3)}) for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher.submit, frames))
+    batcher.close()
+
+    for frame, result in zip(frames, results):
+        assert np.array_equal(result, frame["x"].to_numpy() * 2)
+    assert sum(calls) == 24
+    assert len(calls) < 8
+
+    stats = batcher.stats.snapshot()
+    assert stats["requests"] == 8
+    assert stats["rows"] == 24
+    assert stats["latency_p99_ms"] >= stats["latency_p50_ms"] > 0
+
+
+def test_micro_batcher_propagates_errors():
+    """Test that a failing batch raises the error for the waiting caller"""
+
+    def predict_fn(data):
+        raise ValueError("broken model")
+
+    batcher = MicroBatcher(predict_fn, max_wait_ms=1)
+
+    with pytest.raises(ValueError, match="broken model"):
+        batcher.submit(pd.DataFrame({"x": [1]}))
+    batcher.close()
+
+
+def test_micro_batcher_isolates_malformed_requests():
+    """Test that a malformed request in a batch fails alone and does not change other rows"""
+    batches = []
+
+    def predict_fn(data):
+        batches.append(list(data.columns))
+        return data["x"].astype(float).to_numpy() * 2
+
+    batcher = MicroBatcher(predict_fn, max_wait_ms=200, max_rows=1000)
+    valid = pd.DataFrame({"x": [1, 2]})
+    requests = [valid, pd.DataFrame({"x": ["not a number"]}), pd.DataFrame({"y": [3]}), valid]
+
+    def submit(data):
+        try:
+            return batcher.submit(data)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(submit, requests))
+    batcher.close()
+
+    assert np.array_equal(results[0], [2, 4]) and np.array_equal(results[3], [2, 4])
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], KeyError)
+    # requests with other columns are never concatenated into the same frame
+    assert ["x", "y"] not in batches and ["y", "x"] not in batches
+
+
+def test_micro_batcher_restarts_worker_after_fork():
+    """Test that a batcher inherited from another process starts its own worker thread"""
+    batcher = MicroBatcher(lambda data: data["x"].to_numpy(), max_wait_ms=1)
+    batcher.submit(pd.DataFrame({"x": [1]}))
+
+    # pretend the batcher was created in the gunicorn master before forking
+    batcher._worker_pid = -1
+
+    assert np.array_equal(batcher.submit(pd.DataFrame({"x": [2, 3]})), [2, 3])
+    batcher.close()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from xgb_churn_prediction.inference.cache import PredictionCache
+
+
+def score_fn_counting(calls):
+    def score_fn(data):
+        calls.append(len(data))
+        return np.column_stack([data["a"].to_numpy(), data["b"].to_numpy()]).astype(float)
+
+    return score_fn
+
+
+def test_cache_hits_skip_model():
+    """Test that cached rows are not scored again and results keep input order"""
+    calls = []
+    cache = PredictionCache(max_entries=100)
+    score_fn = score_fn_counting(calls)
+
+    first = cache.predict(score_fn, pd.DataFrame({"a": [1, 2], "b": [3, 4]}), "v1")
+    # same rows with a different column order plus one new row
+    second = cache.predict(score_fn, pd.DataFrame({"b": [5, 4, 3], "a": [9, 2, 1]}), "v1")
+
+    assert np.array_equal(first, [[1, 3], [2, 4]])
+    assert np.array_equal(second, [[9, 5], [2, 4], [1, 3]])
+    assert calls == [2, 1]
+    assert cache.snapshot() == {"hits": 2, "misses": 3, "evictions": 0, "entries": 3}
+
+
+def test_cache_version_ttl_and_eviction():
+    """Test that model version is part of the key and entries expire and are evicted"""
+    calls = []
+    score_fn = score_fn_counting(calls)
+    data = pd.DataFrame({"a": [1, 2, 3], "b": [1, 2, 3]})
+
+    cache = PredictionCache(max_entries=2)
+    cache.predict(score_fn, data, "v1")
+    cache.predict(score_fn, data.tail(2), "v2")
+    assert calls == [3, 2]
+    assert cache.snapshot()["evictions"] == 3
+
+    expiring = PredictionCache(ttl_seconds=-1)
+    expiring.predict(score_fn, data, "v1")
+    expiring.predict(score_fn, data, "v1")
+    assert expiring.snapshot()["hits"] == 0
@@ -0,0 +1,160 @@
+import gzip
+import io
+import json
+import zlib
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+import zstandard
+
+from xgb_churn_prediction.inference.decoding import ARROW_STREAM_CONTENT_TYPE
+from xgb_churn_prediction.inference.decoding import DECOMPRESS_PIECE_BYTES
+from xgb_churn_prediction.inference.decoding import RequestDecoder
+from xgb_churn_prediction.inference.decoding import RequestTooLarge
+from xgb_churn_prediction.inference.decoding import UnsupportedEncoding
+from xgb_churn_prediction.inference.decoding import decode_columnar
+from xgb_churn_prediction.inference.decoding import decode_request
+from xgb_churn_prediction.inference.json_stream import JsonRowParser
+from xgb_churn_prediction.inference.json_stream import columns_to_frame
+
+
+def test_decode_columnar_matches_instances():
+    """Test that the columnar format decodes to the same data as the instances format"""
+    instances = [{"b": 1, "a": 0.5, "c": "x"}, {"b": 2, "a": None, "c": "y"}]
+    expected = pd.DataFrame(instances).sort_index(axis=1)
+
+    df = decode_columnar(["b", "a", "c"], [[1, 0.5, "x"], [2, None, "y"]])
+
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_decode_columnar_rejects_ragged_rows():
+    """Test that rows with a wrong number of values are rejected"""
+    with pytest.raises(ValueError):
+        decode_columnar(["a", "b"], [[1, 2], [3]])
+
+
+def test_decode_request_formats():
+    """Test decoding of instances, columnar and Arrow request bodies"""
+    expected = pd.DataFrame({"a": [1, 2], "b": [0.1, 0.2]})
+
+    instances = json.dumps({"instances": expected.to_dict("records")}).encode()
+    columnar = json.dumps({"columns": ["b", "a"], "data": [[0.1, 1], [0.2, 2]]}).encode()
+    sink = io.BytesIO()
+    table = pa.Table.from_pandas(expected[["b", "a"]], preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    pd.testing.assert_frame_equal(decode_request(instances, "application/json")[0], expected)
+    pd.testing.assert_frame_equal(decode_request(columnar, "")[0], expected)
+    pd.testing.assert_frame_equal(
+        decode_request(sink.getvalue(), ARROW_STREAM_CONTENT_TYPE)[0], expected
+    )
+
+
+def test_decode_request_parameters():
+    """Test that request parameters are returned alongside the rows"""
+    body = json.dumps({"instances": [{"a": 1}], "parameters": {"output": "proba"}}).encode()
+
+    _, parameters = decode_request(body, "application/json")
+
+    assert parameters == {"output": "proba"}
+
+
+def decode_chunked(body, chunk_size, content_type="", content_encoding=""):
+    """Feed a body to a RequestDecoder in chunks of the given size"""
+    decoder = RequestDecoder(content_type, content_encoding)
+    for start in range(0, len(body), chunk_size):
+        decoder.feed(body[start : start + chunk_size])
+    return decoder.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_request_decoder_chunks(chunk_size):
+    """Test that bodies fed in chunks decode like complete bodies, also when compressed"""
+    instances = [{"a": 1, "b": 0.5}, {"a": 2, "c": "x"}, {"b": -1e3, "c": None}]
+    body = json.dumps({"instances": instances, "parameters": {"output": "proba"}}).encode()
+    columnar = json.dumps({"data": [[0.5, 1], [None, 2]], "columns": ["b", "a"]}).encode()
+
+    for encoded, encoding in [(body, ""), (gzip.compress(body), "gzip")]:
+        data, parameters = decode_chunked(encoded, chunk_size, content_encoding=encoding)
+        pd.testing.assert_frame_equal(data, pd.DataFrame(instances))
+        assert parameters == {"output": "proba"}
+    data, _ = decode_chunked(columnar, chunk_size)
+    pd.testing.assert_frame_equal(data, decode_columnar(["b", "a"], [[0.5, 1], [None, 2]]))
+
+
+def test_request_decoder_values_split_anywhere():
+    """Test that values split at any byte decode alike, incl. escapes, brackets in strings"""
+    instances = [
+        {"a": 12345.678, "b": 'x "[{" \\ ]}', "c": {"nested": [1, [2, "]"]]}, "d": True},
+        {"a": -0.5e-3, "b": "\u00e9\u00e8 \U0001f600", "c": None, "d": False},
+    ]
+    body = json.dumps({"instances": instances, "parameters": {"k": ["v", {"w": 1}]}}).encode()
+    expected = pd.DataFrame(instances)
+
+    for split in range(1, len(body)):
+        decoder = RequestDecoder("application/json")
+        decoder.feed(body[:split])
+        decoder.feed(body[split:])
+        data, parameters = decoder.finish()
+        pd.testing.assert_frame_equal(data, expected)
+        assert parameters == {"k": ["v", {"w": 1}]}
+
+
+NUMBERS_BODY = (
+    b'{"instances": [{"a": 12.5, "b": -0.25e-3, "c": 7}, {"a": 1E+10, "b": 12.5e3, "c": -42}],'
+    b' "parameters": {"threshold": 0.75}, "weight": 12.5e-1, "scale": -3.75, "n": 10}'
+)
+
+
+@pytest.mark.parametrize("split", range(1, len(NUMBERS_BODY)))
+def test_json_row_parser_numbers_split_anywhere(split):
+    """Test that floats and exponents split at any byte decode to the same numbers"""
+    parser = JsonRowParser()
+    parser.feed(NUMBERS_BODY[:split])
+    parser.feed(NUMBERS_BODY[split:])
+    parser.close()
+
+    expected = json.loads(NUMBERS_BODY)
+    pd.testing.assert_frame_equal(
+        columns_to_frame(parser.columns()), pd.DataFrame(expected["instances"])
+    )
+    assert parser.fields == {key: expected[key] for key in ("parameters", "weight", "scale", "n")}
+
+
+def test_request_decoder_rejects_invalid_bodies():
+    """Test that truncated, malformed and ragged bodies and unknown encodings are rejected"""
+    body = json.dumps({"instances": [{"a": 1}, {"a": 2}]}).encode()
+
+    for invalid, encoding in [
+        (body[:-2], ""),
+        (gzip.compress(body)[:-4], "gzip"),
+        (b'{"instances": [{"a": 1} {"a": 2}]}', ""),
+        (b'{"instances": [{"a": tru}]}', ""),
+        (b'{"instances": [{"a": 1}], "parameters": {"a": 1]}', ""),
+        (b'{"columns": ["a", "b"], "data": [[1, 2], [3]]}', ""),
+    ]:
+        with pytest.raises(ValueError):
+            decode_chunked(invalid, 4, content_encoding=encoding)
+    with pytest.raises(UnsupportedEncoding):
+        RequestDecoder("application/json", "br")
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "zstd"])
+def test_request_decoder_limits_decompressed_size(encoding):
+    """Test that a decompression bomb is rejected without expanding it in memory"""
+    bomb = b'{"instances": [' + b" " * (64 << 20)
+    if encoding == "zstd":
+        compressed = zstandard.ZstdCompressor().compress(bomb)
+    elif encoding == "deflate":
+        compressed = zlib.compress(bomb)
+    else:
+        compressed = gzip.compress(bomb)
+    decoder = RequestDecoder("", encoding, max_bytes=1 << 20)
+
+    with pytest.raises(RequestTooLarge):
+        decoder.feed(compressed)
+    # decompression stops within one piece of the limit instead of expanding the whole chunk
+    assert decoder.n_bytes <= (1 << 20) + DECOMPRESS_PIECE_BYTES
@@ -0,0 +1,33 @@
+import io
+import json
+
+import numpy as np
+import pyarrow as pa
+
+from xgb_churn_prediction.inference.encoding import NPY_CONTENT_TYPE
+from xgb_churn_prediction.inference.encoding import encode_predictions
+
+
+def test_encode_json_default():
+    """Test that the default response keeps the Vertex AI JSON schema"""
+    predictions = np.array([1, 0, 1], dtype=np.int64)
+
+    body, content_type = encode_predictions({"label": predictions}, "*/*")
+
+    assert content_type == "application/json"
+    assert json.loads(body) == {"predictions": [{"label": 1}, {"label": 0}, {"label": 1}]}
+
+
+def test_encode_binary_formats():
+    """Test NumPy and Arrow responses when requested via the Accept header"""
+    outputs = {"label": np.array(["a", "b"], dtype=object), "scores": np.array([[0.9], [0.6]])}
+
+    npy_body, npy_type = encode_predictions(outputs, f"{NPY_CONTENT_TYPE}, */*")
+    arrow_body, _ = encode_predictions(outputs, "application/vnd.apache.arrow.stream")
+
+    assert npy_type == NPY_CONTENT_TYPE
+    array = np.load(io.BytesIO(npy_body))
+    assert array["label"].tolist() == ["a", "b"]
+    assert np.array_equal(array["scores"], outputs["scores"])
+    table = pa.ipc.open_stream(arrow_body).read_all()
+    assert table.to_pydict() == {"label": ["a", "b"], "scores": [[0.9], [0.6]]}
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.inference.metrics import MULTIPROC_DIR_VARIABLE
+from xgb_churn_prediction.inference.metrics import ServingMetrics
+from xgb_churn_prediction.model.features import Featurizer
+
+# records metrics in a separate process, like a gunicorn worker
+WORKER = """
+from xgb_churn_prediction.inference.metrics import ServingMetrics
+metrics = ServingMetrics()
+metrics.errors.labels("BadRequest").inc()
+metrics.stage_seconds.labels("parse").observe(0.5)
+"""
+
+
+def test_histogram_exposition():
+    """Test cumulative buckets, sum and count in the text exposition format"""
+    metrics = ServingMetrics()
+    for value in (0.00001, 0.5, 50.0):
+        metrics.stage_seconds.labels("parse").observe(value)
+
+    lines = metrics.expose().splitlines()
+
+    assert 'inference_stage_duration_seconds_bucket{le="5e-05",stage="parse"} 1.0' in lines
+    assert 'inference_stage_duration_seconds_bucket{le="1.0",stage="parse"} 2.0' in lines
+    assert 'inference_stage_duration_seconds_bucket{le="+Inf",stage="parse"} 3.0' in lines
+    assert 'inference_stage_duration_seconds_count{stage="parse"} 3.0' in lines
+
+
+def test_metrics_of_all_workers(tmp_path, monkeypatch):
+    """Test that a scrape returns the sum over all worker processes, incl. exited ones"""
+    env = {
+        **os.environ,
+        MULTIPROC_DIR_VARIABLE: str(tmp_path),
+        "PYTHONPATH": os.pathsep.join(sys.path),
+    }
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER], env=env, check=True)
+    monkeypatch.setenv(MULTIPROC_DIR_VARIABLE, str(tmp_path))
+    metrics = ServingMetrics()
+    metrics.add_collector(lambda: {"cache": {"hits": 3}})
+
+    lines = metrics.expose().splitlines()
+
+    assert 'inference_errors_total{exception="BadRequest"} 2.0' in lines
+    assert 'inference_stage_duration_seconds_count{stage="parse"} 2.0' in lines
+    assert f'inference_cache_hits{{worker="{os.getpid()}"}} 3.0' in lines
+
+
+def test_instrumented_pipeline(test_X_y_dataset):
+    """Test that step-wise scoring matches the Pipeline and records every step"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("featurizer", Featurizer()),
+            ("estimator", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    ).fit(X, y)
+    metrics = ServingMetrics()
+    metrics.add_collector(lambda: {"cache": {"hits": 3}})
+
+    score_fn = metrics.instrument(model, model.predict_proba)
+
+    assert np.array_equal(score_fn(X.copy()), model.predict_proba(X.copy()))
+    exposition = metrics.expose()
+    assert 'inference_pipeline_step_duration_seconds_count{step="featurizer"} 1.0' in exposition
+    assert 'inference_pipeline_step_duration_seconds_count{step="estimator"} 1.0' in exposition
+    assert "inference_cache_hits 3.0" in exposition
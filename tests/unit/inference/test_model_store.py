@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xgb_churn_prediction.inference import model_store
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.model_store import ModelRouter
+from xgb_churn_prediction.inference.model_store import ModelWatcher
+from xgb_churn_prediction.inference.model_store import parse_model_versions
+from xgb_churn_prediction.inference.outputs import OutputOptions
+
+
+class ConstantModel:
+    """Model stub predicting the same value for every row"""
+
+    def __init__(self, value):
+        self.value = value
+        self.weights_ = np.zeros(1000)
+
+    def predict(self, data):
+        return [self.value] * len(data)
+
+
+def test_watcher_swaps_model_on_new_generation(mocker):
+    """Test that a new artifact generation is loaded and swapped in, the old model stays usable"""
+    generation = {"value": "1"}
+    mocker.patch.object(
+        model_store, "model_generation", side_effect=lambda uri: generation["value"]
+    )
+    old = LoadedModel(model=ConstantModel(0), version="gs://bucket/model#1", batching_max_wait_ms=1)
+    new = LoadedModel(model=ConstantModel(1), version="gs://bucket/model#2")
+    watcher = ModelWatcher("gs://bucket/model", old, lambda: new)
+    data = pd.DataFrame({"a": [1, 2]})
+
+    assert not watcher.check()
+    in_flight = watcher.current
+
+    generation["value"] = "2"
+    assert watcher.check()
+
+    assert watcher.current is new
+    assert watcher.current.predict(data, OutputOptions())["label"].tolist() == [1, 1]
+    # requests that picked up the old model before the swap still complete on it
+    assert in_flight.predict(data, OutputOptions())["label"].tolist() == [0, 0]
+
+
+def test_router_loads_versions_and_evicts_least_recently_used():
+    """Test routing by version name with eviction of cold versions beyond the memory limit"""
+    default = LoadedModel(model=ConstantModel(0), version="default")
+    loads = []
+
+    def load(uri):
+        loads.append(uri)
+        return LoadedModel(model=ConstantModel(uri), version=uri)
+
+    versions = parse_model_versions("a=gs://bucket/a, b=gs://bucket/b")
+    watcher = ModelWatcher("gs://bucket/model", default, None, interval_seconds=0)
+    limit = default.nbytes + 2 * LoadedModel(ConstantModel("gs://bucket/a"), "a").nbytes - 1
+    assert default.nbytes == 8000
+    router = ModelRouter(watcher, versions, load, memory_limit_bytes=limit)
+
+    assert router.get(None) is default
+    assert router.get("a").version == "gs://bucket/a"
+    assert router.get("a").version == "gs://bucket/a"
+    assert router.get("b").version == "gs://bucket/b"
+    assert router.get("a").version == "gs://bucket/a"
+
+    assert loads == ["gs://bucket/a", "gs://bucket/b", "gs://bucket/a"]
+    assert router.snapshot()["evictions"] == 2
+    with pytest.raises(KeyError):
+        router.get("c")
+
+
+def test_router_loads_versions_without_blocking_others():
+    """Test that a slow load neither blocks other versions nor runs twice for the same version"""
+    default = LoadedModel(model=ConstantModel(0), version="default")
+    release = threading.Event()
+    loads = []
+
+    def load(uri):
+        loads.append(uri)
+        if uri == "gs://bucket/a":
+            release.wait(timeout=5)
+        return LoadedModel(model=ConstantModel(uri), version=uri)
+
+    versions = parse_model_versions("a=gs://bucket/a, b=gs://bucket/b")
+    watcher = ModelWatcher("gs://bucket/model", default, None, interval_seconds=0)
+    router = ModelRouter(watcher, versions, load)
+    results = []
+    first_requests = [
+        threading.Thread(target=lambda: results.append(router.get("a"))) for _ in range(2)
+    ]
+    for thread in first_requests:
+        thread.start()
+
+    assert router.get("b").version == "gs://bucket/b"
+    assert router.snapshot()["loaded_versions"] == 1
+    release.set()
+    for thread in first_requests:
+        thread.join(timeout=5)
+
+    assert loads.count("gs://bucket/a") == 1
+    assert results[0] is results[1]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from xgb_churn_prediction.inference.outputs import OutputOptions
+from xgb_churn_prediction.inference.outputs import make_outputs
+from xgb_churn_prediction.inference.outputs import prediction_function
+
+
+def test_labels_match_predict(test_X_y_dataset):
+    """Test that labels derived from predict_proba equal the labels of predict"""
+    _, X, y, _ = test_X_y_dataset
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    score_fn, classes = prediction_function(model)
+
+    outputs = make_outputs(score_fn(X), classes, OutputOptions())
+
+    assert list(outputs) == ["label"]
+    assert np.array_equal(outputs["label"], model.predict(X))
+
+
+def test_top_k_and_threshold():
+    """Test top-k class scores and thresholded labels"""
+    proba = np.array([[0.2, 0.3, 0.5], [0.6, 0.1, 0.3]])
+    classes = np.array(["a", "b", "c"])
+
+    outputs = make_outputs(proba, classes, OutputOptions.from_parameters({"top_k": "2"}))
+
+    assert outputs["label"].tolist() == ["c", "a"]
+    assert outputs["classes"].tolist() == [["c", "b"], ["a", "c"]]
+    assert outputs["scores"].tolist() == [[0.5, 0.3], [0.6, 0.3]]
+
+    binary = np.array([[0.7, 0.3], [0.4, 0.6]])
+    options = OutputOptions.from_parameters({"threshold": 0.25})
+    assert make_outputs(binary, np.array([0, 1]), options)["label"].tolist() == [1, 1]
+
+
+def test_invalid_parameters():
+    """Test that invalid parameters and unsupported outputs are rejected"""
+    with pytest.raises(ValueError):
+        OutputOptions.from_parameters({"output": "logits"})
+    with pytest.raises(ValueError):
+        make_outputs(pd.Series([1, 0]).to_numpy(), None, OutputOptions(output="proba"))
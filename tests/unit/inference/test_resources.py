@@ -0,0 +1,32 @@
+from xgb_churn_prediction.inference.resources import cpu_limit
+from xgb_churn_prediction.inference.resources import gunicorn_settings
+from xgb_churn_prediction.inference.resources import memory_limit
+
+
+def test_cgroup_v2_limits(tmp_path):
+    """Test detection of CPU quota and memory limit from cgroup v2 files"""
+    (tmp_path / "cpu.max").write_text("250000 100000\n")
+    (tmp_path / "memory.max").write_text("2147483648\n")
+
+    assert cpu_limit(tmp_path) == 2.5
+    assert memory_limit(tmp_path) == 2147483648
+
+
+def test_cgroup_unlimited(tmp_path):
+    """Test fallback if the cgroup sets no limits"""
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    (tmp_path / "memory.max").write_text("max\n")
+
+    assert cpu_limit(tmp_path) >= 1
+    assert memory_limit(tmp_path) is None
+
+
+def test_gunicorn_settings():
+    """Test worker count is derived from CPUs, capped by memory and overridable"""
+    assert gunicorn_settings(2.5, None, environ={})["workers"] == 3
+    assert gunicorn_settings(8, 1024**3, environ={})["workers"] == 2
+
+    settings = gunicorn_settings(8, None, environ={"GUNICORN_WORKERS": "5"})
+
+    assert settings["workers"] == 5
+    assert settings["worker_class"] == "gthread"
@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import json
+import threading
+
+import numpy as np
+
+from xgb_churn_prediction.inference.admission import AdmissionController
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.server import AsgiPredictionServer
+
+
+class BlockingModel:
+    """Model stub predicting 0 for every row once released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict(self, data):
+        self.release.wait(timeout=5)
+        return np.zeros(len(data), dtype=int)
+
+
+async def call(app, method, path, body=b"", headers=()):
+    """Send a single request to an ASGI app and collect status and JSON body"""
+    scope = {"type": "http", "method": method, "path": path, "headers": list(headers)}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def test_predict_and_health():
+    """Test predict route and that health checks answer while a prediction is running"""
+    model = BlockingModel()
+    loaded = LoadedModel(model=model, version="v1")
+    app = AsgiPredictionServer(lambda version: loaded, "/health", "/predict", max_pending=1)
+    body = json.dumps({"instances": [{"a": 1}, {"a": 2}]}).encode()
+
+    async def scenario():
+        predict = asyncio.ensure_future(call(app, "POST", "/predict", body))
+        await asyncio.sleep(0.05)
+        health = await call(app, "GET", "/health")
+        rejected = await call(app, "POST", "/predict", body)
+        model.release.set()
+        return health, rejected, await predict
+
+    health, rejected, predicted = asyncio.run(scenario())
+
+    assert health == (200, {})
+    assert rejected[0] == 503
+    assert predicted == (200, {"predictions": [{"label": 0}, {"label": 0}]})
+    exposition = app.metrics.expose()
+    assert 'inference_errors_total{exception="ServiceUnavailable"} 1.0' in exposition
+    assert 'inference_stage_duration_seconds_count{stage="predict"} 1.0' in exposition
+
+
+def test_predict_bad_request():
+    """Test that undecodable bodies are rejected with a 400"""
+    loaded = LoadedModel(model=BlockingModel(), version="v1")
+    app = AsgiPredictionServer(lambda version: loaded, "/health", "/predict")
+
+    status, _ = asyncio.run(call(app, "POST", "/predict", b"{}"))
+
+    assert status == 400
+
+
+def test_predict_method_not_allowed():
+    """Test that other methods than POST on the predict route get a 405 like the Flask app"""
+    loaded = LoadedModel(model=BlockingModel(), version="v1")
+    app = AsgiPredictionServer(lambda version: loaded, "/health", "/predict")
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/predict", "headers": []}
+    asyncio.run(app(scope, None, send))
+
+    assert sent[0]["status"] == 405
+    assert (b"allow", b"POST") in sent[0]["headers"]
+
+
+def test_predict_body_too_large():
+    """Test that bodies over the size limit are rejected with a 413, also once decompressed"""
+    loaded = LoadedModel(model=BlockingModel(), version="v1")
+    app = AsgiPredictionServer(lambda version: loaded, "/health", "/predict", max_body_bytes=1024)
+    body = json.dumps({"instances": [{"a": 1}] * 1000}).encode()
+    compressed = gzip.compress(body)
+    assert len(compressed) < 1024
+
+    announced = [(b"content-length", str(len(body)).encode())]
+    status, _ = asyncio.run(call(app, "POST", "/predict", body, announced))
+    assert status == 413
+    encoded = [(b"content-encoding", b"gzip")]
+    status, _ = asyncio.run(call(app, "POST", "/predict", compressed, encoded))
+    assert status == 413
+
+
+def test_predict_rejected_before_body():
+    """Test that requests expected to overload the server are rejected without reading them"""
+    loaded = LoadedModel(model=BlockingModel(), version="v1")
+    admission = AdmissionController(max_inflight_rows=10, max_queued=0)
+    admission.admit(10)
+    app = AsgiPredictionServer(lambda version: loaded, "/health", "/predict", admission=admission)
+    received = []
+
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        received.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/predict",
+        "headers": [(b"x-request-rows", b"5")],
+    }
+    asyncio.run(app(scope, receive, send))
+
+    assert received[0]["status"] == 429
+    assert 'inference_rejections_total{reason="queue_full"} 1.0' in app.metrics.expose()
+
+
+def test_health_until_ready():
+    """Test that health checks fail until the model is warmed up"""
+    ready = {"value": False}
+    loaded = LoadedModel(model=BlockingModel(), version="v1")
+    app = AsgiPredictionServer(
+        lambda version: loaded, "/health", "/predict", is_ready=lambda: ready["value"]
+    )
+
+    assert asyncio.run(call(app, "GET", "/health"))[0] == 503
+    ready["value"] = True
+    assert asyncio.run(call(app, "GET", "/health")) == (200, {})
@@ -0,0 +1,73 @@
+import json
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.outputs import OutputOptions
+from xgb_churn_prediction.inference.shadow import ShadowScorer
+
+
+class ParityModel:
+    """Model stub predicting whether the value in column a is even"""
+
+    def predict(self, data):
+        return (data["a"] % 2 == 0).astype(int).to_numpy()
+
+
+def test_shadow_logs_champion_and_challenger(caplog):
+    """Test that the challenger scores served requests in the background and both are logged"""
+    challenger = LoadedModel(model=ParityModel(), version="challenger")
+    champion = LoadedModel(model=ParityModel(), version="champion")
+    shadow = ShadowScorer(lambda: challenger)
+    data = pd.DataFrame({"a": [1, 2, 3, 4]})
+
+    with caplog.at_level(logging.INFO, logger="xgb_churn_prediction.shadow"):
+        shadow.submit(data, OutputOptions(), champion, {"label": [1, 1, 0, 1]})
+        deadline = time.monotonic() + 5
+        while shadow.snapshot()["shadowed"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["champion_version"] == "champion"
+    assert record["challenger_version"] == "challenger"
+    assert record["rows"] == 4
+    assert record["agreement"] == 0.75
+    assert record["disagreeing_rows"] == [{"row": 0, "champion": 1, "challenger": 0}]
+    assert "champion" not in record and "challenger" not in record
+
+
+class ConstantScoreModel:
+    """Classifier stub scoring every row with the same positive class probability"""
+
+    classes_ = [0, 1]
+
+    def __init__(self, positive):
+        self.positive = positive
+
+    def predict_proba(self, data):
+        return np.tile([1 - self.positive, self.positive], (len(data), 1))
+
+
+def test_shadow_logs_score_summary(caplog):
+    """Test that score differences are summarized and only a sample of disagreements is logged"""
+    challenger = LoadedModel(model=ConstantScoreModel(0.6), version="challenger")
+    champion = LoadedModel(model=ConstantScoreModel(0.4), version="champion")
+    shadow = ShadowScorer(lambda: challenger, max_logged_rows=2)
+    data = pd.DataFrame({"a": range(100)})
+    options = OutputOptions(output="proba")
+
+    with caplog.at_level(logging.INFO, logger="xgb_churn_prediction.shadow"):
+        shadow.submit(data, options, champion, champion.predict(data, options))
+        deadline = time.monotonic() + 5
+        while shadow.snapshot()["shadowed"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["agreement"] == 0 and record["disagreements"] == 100
+    assert record["mean_score_delta"] == pytest.approx(0.2)
+    assert record["max_score_delta"] == pytest.approx(0.2)
+    assert [row["row"] for row in record["disagreeing_rows"]] == [0, 1]
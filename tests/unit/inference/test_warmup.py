@@ -0,0 +1,28 @@
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.inference.model_store import LoadedModel
+from xgb_churn_prediction.inference.model_store import ModelWatcher
+from xgb_churn_prediction.inference.warmup import synthetic_batch
+from xgb_churn_prediction.model.features import Featurizer
+
+
+def test_warm_up_marks_watcher_ready(test_X_y_dataset):
+    """Test that synthetic batches match the model inputs and warm-up gates readiness"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("featurizer", Featurizer()),
+            ("estimator", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    ).fit(X, y)
+    watcher = ModelWatcher(
+        "gs://bucket/model", LoadedModel(model, "v1"), None, warm_up_sizes=[1, 8]
+    )
+
+    assert list(synthetic_batch(model, 8).columns) == list(X.columns)
+    assert not watcher.ready
+
+    watcher.warm_up()
+
+    assert watcher.ready
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.model.artifact import load_artifact
+from xgb_churn_prediction.model.artifact import save_artifact
+from xgb_churn_prediction.model.artifact import verify_artifact
+from xgb_churn_prediction.model.compiled_forest import CompiledForest
+from xgb_churn_prediction.model.features import Featurizer
+from xgb_churn_prediction.model.save_load_model import load_model
+from xgb_churn_prediction.model.save_load_model import save_model
+
+
+def test_artifact_round_trip(test_X_y_dataset, tmp_path):
+    """Test that a pipeline loaded from its artifact predicts like the saved pipeline"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("preprocessing", Pipeline([("generate_features", Featurizer())])),
+            ("model", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    ).fit(X, y)
+    path = str(tmp_path / "model")
+
+    save_model(model, path)
+    manifest = json.loads((tmp_path / "model.json").read_text())
+    compiled = load_artifact(path, verify_checksum=True)
+    restored = load_model(path)
+
+    assert not (tmp_path / "model.pkl").exists()
+    assert manifest["feature_names"] == list(X.columns)
+    assert isinstance(compiled.steps[-1][1], CompiledForest)
+    assert isinstance(restored.steps[-1][1], RandomForestClassifier)
+    expected = model.predict_proba(X.copy())
+    assert np.array_equal(compiled.predict_proba(X.copy()), expected)
+    assert np.allclose(restored.predict_proba(X.copy()), expected)
+    assert np.array_equal(restored.predict(X.copy()), model.predict(X.copy()))
+
+
+def test_artifact_restores_forest_exactly(tmp_path):
+    """Test that the restored forest keeps hyperparameters and tree statistics"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 4))
+    forest = RandomForestClassifier(
+        n_estimators=4, max_depth=5, max_features=0.5, class_weight={0: 1, 1: 3}, random_state=0
+    ).fit(X, X[:, 0] + X[:, 1] > 0)
+    path = str(tmp_path / "model")
+
+    save_model(forest, path)
+    restored = load_model(path)
+
+    assert restored.get_params() == forest.get_params()
+    assert np.array_equal(restored.feature_importances_, forest.feature_importances_)
+    assert np.array_equal(restored.predict_proba(X), forest.predict_proba(X))
+    for tree, original in zip(restored.estimators_, forest.estimators_):
+        assert tree.get_params() == original.get_params()
+        assert tree.get_depth() == original.get_depth()
+        assert np.array_equal(tree.tree_.n_node_samples, original.tree_.n_node_samples)
+
+
+def test_artifact_rejects_corrupt_blobs(tmp_path):
+    """Test that corrupted artifacts are detected when loading them"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    forest = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, X[:, 0] > 0)
+    path = str(tmp_path / "model")
+    save_artifact(forest, path)
+    manifest = json.loads((tmp_path / "model.json").read_text())
+
+    # point the first child index of the forest outside of its nodes
+    with open(tmp_path / "model.bin", "r+b") as file:
+        file.seek(manifest["estimator"]["arrays"]["left"]["offset"])
+        file.write(np.array([1 << 30], dtype=np.int32).tobytes())
+
+    with pytest.raises(ValueError):
+        load_artifact(path, verify_checksum=True)
+    with pytest.raises(ValueError):
+        load_artifact(path)
+
+
+def test_verify_artifact_detects_mixed_versions(tmp_path):
+    """Test that a blob file saved with another manifest, e.g. by a racing upload, is detected"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    for name, seed in [("old", 0), ("new", 1)]:
+        forest = RandomForestClassifier(n_estimators=3, random_state=seed).fit(X, X[:, 0] > 0)
+        save_artifact(forest, str(tmp_path / name), compression="gzip")
+
+    verify_artifact(str(tmp_path / "old"))
+    (tmp_path / "new.bin").replace(tmp_path / "old.bin")
+    with pytest.raises(ValueError):
+        verify_artifact(str(tmp_path / "old"))
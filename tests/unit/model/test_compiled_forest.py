@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.model.compiled_forest import CompiledForest
+from xgb_churn_prediction.model.compiled_forest import compile_pipeline
+from xgb_churn_prediction.model.features import Featurizer
+
+
+def test_compiled_forest_matches_sklearn():
+    """Test that compiled forests reproduce sklearn's probabilities and labels exactly"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 6))
+    y = np.where(X[:, 0] + X[:, 1] * X[:, 2] > 0, "churn", "stay")
+    X_test = rng.normal(size=(300, 6))
+
+    for forest in (
+        RandomForestClassifier(n_estimators=10, random_state=0),
+        ExtraTreesClassifier(n_estimators=10, max_depth=4, random_state=0),
+    ):
+        forest.fit(X, y)
+        compiled = CompiledForest.from_estimator(forest)
+
+        assert np.array_equal(compiled.predict_proba(X_test), forest.predict_proba(X_test))
+        assert np.array_equal(compiled.predict(X_test), forest.predict(X_test))
+        assert compiled.apply(X_test[:1]).shape == (1, 10)
+
+
+def test_compile_pipeline(test_X_y_dataset):
+    """Test that the compiled pipeline is a drop-in replacement of the fitted pipeline"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("preprocessing", Pipeline([("generate_features", Featurizer())])),
+            ("model", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    ).fit(X, y)
+
+    compiled = compile_pipeline(model)
+
+    assert isinstance(compiled.steps[-1][1], CompiledForest)
+    # input column order does not matter, as for the fitted pipeline
+    shuffled = X[X.columns[::-1]]
+    assert np.array_equal(compiled.predict(shuffled.copy()), model.predict(X.copy()))
+    assert np.array_equal(compiled.classes_, model.classes_)
+    assert compile_pipeline("MOCK") == "MOCK"
+
+
+def test_compiled_forest_cannot_be_trained(test_X_y_dataset):
+    """Test that refitting a compiled pipeline fails with a hint at the forest to train instead"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("preprocessing", Pipeline([("generate_features", Featurizer())])),
+            ("model", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    ).fit(X, y)
+    compiled = compile_pipeline(model)
+
+    with pytest.raises(TypeError, match="to_estimator"):
+        compiled.fit(X, y)
+    with pytest.raises(TypeError):
+        clone(compiled).fit(X, y)
+    # the restored forest is trainable again with the original hyperparameters
+    forest = model.steps[-1][1]
+    restored = clone(CompiledForest.from_estimator(forest).to_estimator())
+    assert restored.get_params() == forest.get_params()
+
+
+def test_compiled_forest_routes_large_calls(test_X_y_dataset, mocker):
+    """Test that calls beyond max_compiled_rows are scored by sklearn with the same results"""
+    _, X, y, _ = test_X_y_dataset
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    model = Pipeline([("generate_features", Featurizer()), ("model", forest)]).fit(X, y)
+
+    routed = compile_pipeline(model, max_compiled_rows=2).steps[-1][1]
+    restored = CompiledForest.from_estimator(forest).route_rows(max_rows=2)
+    traverse = mocker.spy(routed, "apply")
+    shuffled = X[X.columns[::-1]]
+
+    assert routed.estimator_ is forest
+    assert routed.nbytes > CompiledForest.from_estimator(forest).nbytes
+    assert np.array_equal(routed.predict_proba(shuffled), forest.predict_proba(X))
+    assert np.array_equal(restored.predict(shuffled), forest.predict(X))
+    assert traverse.call_count == 0
+    routed.predict_proba(X[:2])
+    assert traverse.call_count == 1
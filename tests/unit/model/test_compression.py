@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from xgb_churn_prediction.model.artifact import decompress_artifact
+from xgb_churn_prediction.model.artifact import load_artifact
+from xgb_churn_prediction.model.artifact import verify_artifact
+from xgb_churn_prediction.model.compression import file_codec
+from xgb_churn_prediction.model.save_load_model import load_model
+from xgb_churn_prediction.model.save_load_model import save_model
+
+# zstd and lz4 come with the `compression` extra installed for the tests
+CODECS = ["gzip", "lzma", "zstd", "lz4"]
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 4))
+    return X, X[:, 0] + X[:, 1] > 0
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compressed_artifact_round_trip(codec, data, tmp_path):
+    """Test that compressed artifacts load like uncompressed ones, mapped once decompressed"""
+    X, y = data
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    path = str(tmp_path / "model")
+
+    save_model(forest, path, compression=codec, level=1)
+    size = (tmp_path / "model.bin").stat().st_size
+    model = load_artifact(path, verify_checksum=True)
+
+    assert file_codec(f"{path}.bin") == codec
+    assert np.array_equal(model.predict_proba(X), forest.predict_proba(X))
+    assert decompress_artifact(path) == codec
+    assert file_codec(f"{path}.bin") is None
+    assert json.loads((tmp_path / "model.json").read_text())["compression"] is None
+    assert (tmp_path / "model.bin").stat().st_size > size
+    assert np.array_equal(load_artifact(path).predict_proba(X), forest.predict_proba(X))
+    assert decompress_artifact(path) is None
+
+
+@pytest.mark.parametrize("saved, recorded", [("gzip", None), (None, "gzip"), ("gzip", "zstd")])
+def test_compression_must_match_manifest(saved, recorded, data, tmp_path):
+    """Test that a blob file compressed otherwise than its manifest records fails to load"""
+    X, y = data
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    path = str(tmp_path / "model")
+    save_model(forest, path, compression=saved)
+    manifest = json.loads((tmp_path / "model.json").read_text())
+    (tmp_path / "model.json").write_text(json.dumps({**manifest, "compression": recorded}))
+
+    with pytest.raises(ValueError):
+        load_artifact(path)
+    with pytest.raises(ValueError):
+        verify_artifact(path)
+
+
+@pytest.mark.parametrize("codec", ["gzip", "lzma"])
+def test_compressed_pickle_round_trip(codec, data, tmp_path):
+    """Test that models saved as compressed pickle are detected and decompressed on load"""
+    X, y = data
+    model = LogisticRegression().fit(X, y)
+    path = str(tmp_path / "model")
+
+    save_model(model, path, compression=codec)
+
+    assert file_codec(f"{path}.pkl") == codec
+    assert np.array_equal(load_model(path).predict_proba(X), model.predict_proba(X))
+    with pytest.raises(ValueError):
+        save_model(model, path, compression="snappy")
@@ -0,0 +1,97 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+from google.api_core.exceptions import PreconditionFailed
+from sklearn.ensemble import RandomForestClassifier
+
+from benchmarks.fake_gcs import FakeGcsServer
+from xgb_churn_prediction import clients
+from xgb_churn_prediction.inference import loading
+from xgb_churn_prediction.model.artifact import save_artifact
+from xgb_churn_prediction.model.download import download_blob
+from xgb_churn_prediction.model.download import download_blob_bytes
+from xgb_churn_prediction.model.model_cache import ModelCache
+
+
+@pytest.fixture()
+def fake_gcs():
+    """Local fake GCS server"""
+    server = FakeGcsServer().start()
+    yield server
+    server.stop()
+
+
+def test_download_blob_in_ranges(fake_gcs, tmp_path):
+    """Test that ranged downloads reassemble the blob and fail on checksum or generation change"""
+    content = os.urandom(5 * 1024 + 17)
+    fake_gcs.put("bucket", "models/model.bin", content)
+    bucket = fake_gcs.client().bucket("bucket")
+    path = str(tmp_path / "model.bin")
+
+    download_blob(bucket.blob("models/model.bin"), path, chunk_bytes=1024, max_workers=3)
+    assert open(path, "rb").read() == content
+    assert download_blob_bytes(bucket.blob("models/model.bin"), chunk_bytes=1000) == content
+
+    blob = bucket.get_blob("models/model.bin")
+    blob._properties["crc32c"] = "AAAAAA=="
+    with pytest.raises(ValueError):
+        download_blob(blob, path, chunk_bytes=1024)
+    blob = bucket.get_blob("models/model.bin")
+    fake_gcs.put("bucket", "models/model.bin", content)
+    with pytest.raises(PreconditionFailed):
+        download_blob(blob, path, chunk_bytes=1024)
+    # blobs fetched in a single request are pinned to their generation as well
+    blob = bucket.get_blob("models/model.bin")
+    fake_gcs.put("bucket", "models/model.bin", content)
+    with pytest.raises(PreconditionFailed):
+        download_blob(blob, path)
+    with pytest.raises(PreconditionFailed):
+        download_blob_bytes(blob)
+
+
+def test_download_model_from_fake_gcs(fake_gcs, mocker, tmp_path):
+    """Test that the serving containers load artifacts and pickles from GCS"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    forest = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, X[:, 0] > 0)
+    save_artifact(forest, str(tmp_path / "model"))
+    for suffix in ("json", "bin"):
+        fake_gcs.put(
+            "bucket", f"artifact/model.{suffix}", (tmp_path / f"model.{suffix}").read_bytes()
+        )
+    fake_gcs.put("bucket", "pickle/model.pkl", pickle.dumps(forest))
+    clients.set_factory(clients.STORAGE, lambda project, location: fake_gcs.client())
+
+    cache = ModelCache(str(tmp_path / "cache"))
+    for uri in ("gs://bucket/artifact", "gs://bucket/pickle"):
+        model = loading.download_model(uri, cache=cache)
+        assert np.array_equal(model.predict_proba(X), forest.predict_proba(X))
+
+
+def test_download_model_shares_cached_artifact(fake_gcs, mocker, tmp_path):
+    """Test that loads of the same artifact generation, e.g. by all workers, map one file"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    forest = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, X[:, 0] > 0)
+    save_artifact(forest, str(tmp_path / "model"))
+    for suffix in ("bin", "json"):
+        fake_gcs.put(
+            "bucket", f"artifact/model.{suffix}", (tmp_path / f"model.{suffix}").read_bytes()
+        )
+    clients.set_factory(clients.STORAGE, lambda project, location: fake_gcs.client())
+    cache = ModelCache(str(tmp_path / "cache"))
+    download = mocker.spy(loading, "download_blob")
+
+    first = loading.download_model("gs://bucket/artifact", compiled=False, cache=cache)
+    second = loading.download_model("gs://bucket/artifact", compiled=False, cache=cache)
+    assert download.call_count == 2
+    assert len(cache.entries()) == 1
+    assert np.array_equal(second.predict_proba(X), first.predict_proba(X))
+
+    # a new upload is a new generation and gets its own entry
+    fake_gcs.put("bucket", "artifact/model.json", (tmp_path / "model.json").read_bytes())
+    loading.download_model("gs://bucket/artifact", compiled=False, cache=cache)
+    assert download.call_count == 4
+    assert len(cache.entries()) == 2
@@ -14,3 +14,8 @@ class TestFeaturizer:
         feat = Featurizer()
         X = feat.transform(self.test_X)
         assert X.equals(self.expected_feat)
+
+    def test_fit_records_input_columns(self):
+        feat = Featurizer().fit(self.test_X, self.test_y)
+        assert list(feat.feature_names_in_) == list(self.test_X.columns)
+        assert feat.n_features_in_ == self.test_X.shape[1]
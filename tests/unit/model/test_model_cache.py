@@ -0,0 +1,75 @@
+import os
+import pickle
+
+from xgb_churn_prediction import clients
+from xgb_churn_prediction.model import save_load_model
+from xgb_churn_prediction.model.model_cache import ModelCache
+
+
+class FakeBlob:
+    """Blob stub serving a pickled model and counting downloads"""
+
+    def __init__(self, name, generation, content):
+        self.name = name
+        self.generation = generation
+        self.content = content
+        self.size = len(content)
+        self.crc32c = "unused"
+        self.downloads = 0
+
+    def download_to_filename(self, filename, **kwargs):
+        self.downloads += 1
+        with open(filename, "wb") as file:
+            file.write(self.content)
+
+
+class FakeBucket:
+    """Bucket stub with a single pickled model blob"""
+
+    def __init__(self, blob):
+        self.model_blob = blob
+
+    def get_blob(self, name):
+        return self.model_blob if name == self.model_blob.name else None
+
+    def blob(self, name):
+        return self.model_blob
+
+
+def test_model_cache_evicts_least_recently_used(tmp_path):
+    """Test that entries beyond the size limit are evicted least recently used first"""
+    cache = ModelCache(str(tmp_path), max_bytes=25)
+
+    def write(directory):
+        with open(os.path.join(directory, "model.pkl"), "wb") as file:
+            file.write(b"x" * 10)
+
+    cache.put("a", write)
+    cache.put("b", write)
+    os.utime(cache.get("a"), (0, 0))
+    cache.put("c", write)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert sorted(key for _, _, key in cache.entries()) == ["b", "c"]
+
+
+def test_load_model_from_gcs_uses_cache(mocker, tmp_path):
+    """Test that an unchanged model is loaded from the cache and a new generation downloaded"""
+    vertex_model = mocker.patch.object(save_load_model.aiplatform, "Model").return_value
+    vertex_model.uri = "gs://bucket/models/"
+    vertex_model.version_id = "3"
+    blob = FakeBlob("models/model.pkl", 1, pickle.dumps("MOCK"))
+    client = mocker.Mock()
+    client.bucket.return_value = FakeBucket(blob)
+    clients.set_factory(clients.STORAGE, lambda project, location: client)
+    cache = ModelCache(str(tmp_path))
+
+    first = save_load_model.load_model_from_gcs("model", cache=cache)
+    second = save_load_model.load_model_from_gcs("model", cache=cache)
+    blob.generation = 2
+    save_load_model.load_model_from_gcs("model", cache=cache)
+
+    assert first == second == ("MOCK", "3")
+    assert blob.downloads == 2
+    assert len(cache.entries()) == 2
@@ -0,0 +1,69 @@
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from xgb_churn_prediction.model.compiled_forest import CompiledForest
+from xgb_churn_prediction.model.features import Featurizer
+from xgb_churn_prediction.model.optimize import downcast_thresholds
+from xgb_churn_prediction.model.optimize import merge_leaves
+from xgb_churn_prediction.model.optimize import optimize_model
+from xgb_churn_prediction.model.save_load_model import load_model
+from xgb_churn_prediction.model.save_load_model import save_model
+
+
+def test_merge_leaves_and_downcast_keep_predictions():
+    """Test that merged leaves and float32 thresholds do not change any prediction"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 3))
+    forest = CompiledForest.from_estimator(
+        RandomForestClassifier(n_estimators=5, random_state=0).fit(X, X[:, 0] > 0)
+    )
+    # a split of a leaf into two leaves predicting the same as their parent
+    n_nodes = len(forest.feature)
+    leaf = int(np.flatnonzero(forest.is_leaf)[0])
+    arrays = {
+        "feature": np.append(forest.feature, [0, 0]),
+        "threshold": np.append(forest.threshold, [0.0, 0.0]),
+        "left": np.append(forest.left, [n_nodes, n_nodes + 1]).astype(np.int32),
+        "right": np.append(forest.right, [n_nodes, n_nodes + 1]).astype(np.int32),
+        "value": np.concatenate([forest.value, forest.value[[leaf, leaf]]]),
+    }
+    arrays["left"][leaf], arrays["right"][leaf] = n_nodes, n_nodes + 1
+    arrays["feature"][leaf], arrays["threshold"][leaf] = 1, 0.5
+    split = CompiledForest(
+        **arrays, roots=forest.roots, max_depth=forest.max_depth + 1, classes=forest.classes_
+    )
+
+    merged = merge_leaves(split)
+    downcast = downcast_thresholds(forest)
+
+    assert len(merged.feature) == n_nodes
+    assert np.array_equal(merged.predict_proba(X), forest.predict_proba(X))
+    assert downcast.threshold.dtype == np.float32
+    assert np.array_equal(downcast.apply(X), forest.apply(X))
+
+
+def test_optimize_model(test_X_y_dataset, tmp_path):
+    """Test that an optimized pipeline stays within tolerance and can be saved and loaded"""
+    _, X, y, _ = test_X_y_dataset
+    model = Pipeline(
+        [
+            ("preprocessing", Pipeline([("generate_features", Featurizer())])),
+            ("model", RandomForestClassifier(n_estimators=20, random_state=0)),
+        ]
+    ).fit(X, y)
+
+    exact, report = optimize_model(model, X.copy(), y, repeats=1)
+    pruned, pruned_report = optimize_model(
+        model, X.copy(), y, tolerance=0.1, drop=True, min_trees=3, repeats=1
+    )
+    save_model(pruned, str(tmp_path / "model"))
+    restored = load_model(str(tmp_path / "model"), compiled=True)
+
+    assert np.array_equal(exact.predict(X.copy()), model.predict(X.copy()))
+    assert report.nbytes_after < report.nbytes_before
+    assert report.metric_after == report.metric_before
+    assert 3 <= pruned_report.n_trees_after < pruned_report.n_trees_before
+    assert pruned_report.metric_after >= pruned_report.metric_before - 0.1
+    assert np.array_equal(restored.predict_proba(X.copy()), pruned.predict_proba(X.copy()))
+    assert pruned_report.to_dict()["downcast"]["threshold"] == "float32"
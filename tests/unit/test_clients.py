@@ -0,0 +1,35 @@
+import os
+
+from xgb_churn_prediction import clients
+from xgb_churn_prediction.data import data_output
+
+
+def test_clients_are_shared_per_project_and_process(mocker):
+    """Test that clients are created once per project and location and again after a fork"""
+    client_class = mocker.patch("google.cloud.bigquery.Client")
+    client_class.side_effect = lambda **kwargs: mocker.Mock(**kwargs)
+
+    first = clients.bigquery_client("project")
+    data_output.output_data("project", mocker.Mock(), "dataset.table")
+    other = clients.bigquery_client("project", "EU")
+
+    assert clients.bigquery_client("project") is first
+    assert other is not first
+    assert client_class.call_count == 2
+    assert first.load_table_from_dataframe.call_count == 1
+
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if clients.bigquery_client("project") is not first else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+
+
+def test_set_factory_swaps_clients():
+    """Test that a kind of client can be replaced by a fake"""
+    fake = object()
+    clients.set_factory(clients.METRIC_SERVICE, lambda project, location: fake)
+
+    assert clients.metric_service_client() is fake
+    clients.reset()
+    assert clients._clients == {}
+    assert clients._factories == clients._DEFAULT_FACTORIES
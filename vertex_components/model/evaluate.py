@@ -28,19 +28,22 @@ def evaluate(
         metrics (Output[Metrics]): metrics as output Artifact of component
     """
     from xgb_churn_prediction.data import data_ingestion
+    from xgb_churn_prediction.inference.warmup import input_feature_names
     from xgb_churn_prediction.model import evaluate
     from xgb_churn_prediction.model import save_load_model
 
-    # Read in training data
-    sql_query = f"""
-        SELECT * EXCEPT(split)
-        FROM `{dataset.metadata["datasetId"]}.{dataset.metadata["tableId"]}`
-        WHERE split = 'TEST'
-    """
-    test_data_df = data_ingestion.execute_bq_query(project, sql_query)
-
     trained_model = save_load_model.load_model(str(model.path))
 
+    # Read in test data, only the model inputs and the label if the model records its inputs
+    columns = data_ingestion.projected_columns(input_feature_names(trained_model), [target_column])
+    sql_query = data_ingestion.build_query(
+        f'{dataset.metadata["datasetId"]}.{dataset.metadata["tableId"]}',
+        columns=columns,
+        filters={"split": "TEST"},
+        exclude=["split"],
+    )
+    test_data_df = data_ingestion.execute_bq_query(project, sql_query)
+
     evals = evaluate.evaluate_model(test_data_df, trained_model, target_column)
 
     # log metrics to metric output
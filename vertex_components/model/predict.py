@@ -41,38 +41,50 @@ def batch_predictions(
 
     from xgb_churn_prediction.data import data_ingestion
     from xgb_churn_prediction.data import data_output
+    from xgb_churn_prediction.inference.warmup import input_feature_names
     from xgb_churn_prediction.model import predict
     from xgb_churn_prediction.model import save_load_model
 
-    # Read in inference data
-    logging.info("Fetching current inference data from Big Query")
-    sql_query = f"""
-        SELECT *
-        FROM `{inference_data.metadata["datasetId"]}.{inference_data.metadata["tableId"]}`
-    """
-    data = data_ingestion.execute_bq_query(project, sql_query=sql_query)
-
     # load model from Google Cloud Storage
     logging.info("Loading model from Model Registry / GCS")
     model_resource_name = model.metadata["resourceName"]
     trained_model, model_version = save_load_model.load_model_from_gcs(model_resource_name)
 
-    # make predictions on dataset within horizon
-    logging.info("Running predicitions on inference data")
-    predictions = predict.make_predictions(
-        trained_model, data, prediction_expr, timestamp_expr, series_id_expr
-    )
-    predictions["model_version"] = int(model_version)
-
     # generate output table name with timestamp
     timestamp = datetime.now(tz=timezone.utc)
     timestamp_str = timestamp.strftime("%Y_%m_%dT%H_%M_%S_%f")[:-3] + "Z"
     table_id = f"predictions_{timestamp_str}"
     full_table_name = f"{project}.{dataset}.{table_id}"
 
-    # output predicitons to output inference table
-    logging.info("Storing predicitions in Big Query")
-    data_output.output_data(project=project, dataset=predictions, table_id=full_table_name)
+    # Read in inference data in chunks, so tables of any size fit into memory. Only the model
+    # inputs and the series id are read if the model records its inputs
+    logging.info("Fetching current inference data from Big Query")
+    columns = data_ingestion.projected_columns(input_feature_names(trained_model), [series_id_expr])
+    sql_query = data_ingestion.build_query(
+        f'{inference_data.metadata["datasetId"]}.{inference_data.metadata["tableId"]}',
+        columns=columns,
+    )
+    # the first chunk is loaded with an inferred schema, all further chunks with the schema of
+    # the table, so a chunk where e.g. a column is all NULL cannot append with another type
+    schema = None
+    for data in data_ingestion.iter_bq_query(project, sql_query=sql_query):
+        # make predictions on dataset within horizon
+        logging.info(f"Running predicitions on {len(data)} rows of inference data")
+        predictions = predict.make_predictions(
+            trained_model, data, prediction_expr, timestamp_expr, series_id_expr
+        )
+        predictions["model_version"] = int(model_version)
+
+        # append predicitons to output inference table
+        logging.info("Storing predicitions in Big Query")
+        data_output.output_data(
+            project=project,
+            dataset=predictions,
+            table_id=full_table_name,
+            data_type_mapping=schema,
+        )
+        if schema is None:
+            schema = data_output.table_schema(project, full_table_name)
 
     # return generated table id
     output = namedtuple("output", ["result_table_id", "model_version"])
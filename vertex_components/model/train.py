@@ -8,7 +8,12 @@ from config import BASE_IMAGE
 
 @component(base_image=BASE_IMAGE)
 def train(
-    project: str, dataset: Input[Artifact], target_column: str, model: Output[Artifact]
+    project: str,
+    dataset: Input[Artifact],
+    target_column: str,
+    model: Output[Artifact],
+    optimize: bool = False,
+    optimize_tolerance: float = 0.0,
 ) -> None:
     """Component to run training as part of Vertex AI pipeline
     All relevant libraries need to be imported within the component function;
@@ -19,33 +24,56 @@ def train(
         dataset (Input[Artifact]): training dataset to train model with as Input Dataset
         target_column (str): Target Column for the model training
         model (Output[Artifact]): model as Output Artifact of component
+        optimize (bool): whether to shrink the trained forest before saving it, validated on
+            10% of the training data held out from training
+        optimize_tolerance (float): accuracy the optimization may lose by dropping trees, no
+            trees are dropped if 0
     """
     import logging
 
+    from sklearn.model_selection import train_test_split
+
     from xgb_churn_prediction.data import data_ingestion
     from xgb_churn_prediction.data import data_split
+    from xgb_churn_prediction.model import optimize as optimize_model
     from xgb_churn_prediction.model import save_load_model
     from xgb_churn_prediction.model import train
 
     # Set model path
     model_path = str(model.path)
 
-    # Read in training data
+    # Read in training data, all columns as the Featurizer learns its inputs from them
     logging.info("Fetching training data from Big Query")
-    sql_query = f"""
-        SELECT * EXCEPT(split)
-        FROM `{dataset.metadata["datasetId"]}.{dataset.metadata["tableId"]}`
-        WHERE split = 'TRAIN'
-    """
+    sql_query = data_ingestion.build_query(
+        f'{dataset.metadata["datasetId"]}.{dataset.metadata["tableId"]}',
+        filters={"split": "TRAIN"},
+        exclude=["split"],
+    )
     train_data_df = data_ingestion.execute_bq_query(project, sql_query=sql_query)
 
     # Split Features / Target
     train_X, train_y = data_split.split_X_y(train_data_df, target_column)
+    if optimize:
+        train_X, validation_X, train_y, validation_y = train_test_split(
+            train_X, train_y, test_size=0.1, random_state=42
+        )
 
     # Train model
     logging.info("Start model training")
     trained_model = train.train_model(train_X, train_y)
 
+    # Optimize model
+    if optimize:
+        logging.info("Optimizing trained model")
+        trained_model, report = optimize_model.optimize_model(
+            trained_model,
+            validation_X,
+            validation_y,
+            tolerance=optimize_tolerance,
+            drop=optimize_tolerance > 0,
+        )
+        model.metadata["optimization"] = report.to_dict()
+
     # Save model
     logging.info("Model training successful - storing model in GCS")
     save_load_model.save_model(trained_model, model_path)
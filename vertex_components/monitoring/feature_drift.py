@@ -43,6 +43,7 @@ def evaluate_feature_drift(
     from datetime import datetime
     from datetime import timezone
 
+    from xgb_churn_prediction.data.data_ingestion import build_query
     from xgb_churn_prediction.data.data_ingestion import execute_bq_query
     from xgb_churn_prediction.monitoring.feature_drift import create_report
     from xgb_churn_prediction.monitoring.metrics import (
@@ -50,30 +51,30 @@ def evaluate_feature_drift(
     )
     from xgb_churn_prediction.monitoring.metrics import write_metrics_to_table
 
-    # Read in training history data (random selection of 100,000)
+    # TODO: define features to check on for data drift
+    # NOTE: limiting range to speed up processing
+    features = ["feature_1"]
+
+    # Read in training history data (random selection of 100,000), only the features checked
     logging.info("Fetching training history data from Big Query")
-    training_query = f"""
-        SELECT *
-        FROM `{project_id}.{dataset_id}.{table_id}`
-        ORDER BY RAND()
-        LIMIT {data_limit}
-    """
+    training_query = build_query(
+        f"{project_id}.{dataset_id}.{table_id}",
+        columns=features,
+        order_by="RAND()",
+        limit=data_limit,
+    )
     training_data = execute_bq_query(project_id, sql_query=training_query)
 
-    # Read in inference data (random selection of 100,000)
+    # Read in inference data (random selection of 100,000), only the features checked
     logging.info("Fetching current inference data from Big Query")
-    inference_query = f"""
-        SELECT *
-        FROM `{inference_dataset.metadata["datasetId"]}.{inference_dataset.metadata["tableId"]}`
-        ORDER BY RAND()
-        LIMIT {data_limit}
-    """
+    inference_query = build_query(
+        f'{inference_dataset.metadata["datasetId"]}.{inference_dataset.metadata["tableId"]}',
+        columns=features,
+        order_by="RAND()",
+        limit=data_limit,
+    )
     inference_data = execute_bq_query(project_id, sql_query=inference_query)
 
-    # TODO: define features to check on for data drift
-    # NOTE: limiting range to speed up processing
-    features = ["feature_1"]
-
     logging.info(f"Generating evidently data drift report and metrics for columns {features}")
     result_report, result_metrics, monitoring_metrics = create_report(
         inference_data[features].astype(float), training_data[features].astype(float), features